@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+
+
+class ServiceEstimate:
+    """Exponentially weighted moving average of how long a task holds a worker"""
+    def __init__(self, initial, alpha):
+        self.seconds = initial
+        self.alpha = alpha
+        self.samples = 0
+
+    def update(self, seconds):
+        # The first sample replaces the prior instead of being averaged with it
+        if self.samples == 0:
+            self.seconds = seconds
+        else:
+            self.seconds += self.alpha * (seconds - self.seconds)
+        self.samples += 1
+
+
+class AdmissionController:
+    """Admit new tasks by predicted queue wait instead of a fixed queue length.
+
+    Engines report every served task with the time it waited in the queue
+    and the time it held a worker. Service times are averaged per function
+    and overall; ``capacity`` workers divided by the mean service time is
+    the drain rate, so the queue a task would join converts to a predicted
+    wait that follows upstream speed (including rate limit waits).
+
+    Like CoDel, a standing queue is detected from sojourn times: if tasks
+    have kept waiting longer than ``target`` seconds for a whole
+    ``interval``, the queue is overloaded and new tasks are only admitted
+    once the predicted wait is back under ``target``. Otherwise bursts are
+    absorbed up to a predicted wait of ``max_wait`` seconds.
+    """
+    def __init__(self, capacity, target=5.0, interval=10.0, max_wait=60.0, default_service=10.0, alpha=0.2):
+        self.capacity = max(1, capacity)
+        self.target = target
+        self.interval = interval
+        self.max_wait = max_wait
+        self.default_service = default_service
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.overall = ServiceEstimate(default_service, alpha)
+        self.functions = {}
+        self.first_above = None  # When sojourn times will have stayed above target for an interval
+        self.overloaded = False
+        self.admitted = 0
+        self.rejected = 0
+
+    def served(self, function_id, waited, busy):
+        """Record a task that left the queue after ``waited`` seconds and held a worker for ``busy``"""
+        now = time.time()
+        with self.lock:
+            self.overall.update(busy)
+            if function_id not in self.functions:
+                self.functions[function_id] = ServiceEstimate(self.default_service, self.alpha)
+            self.functions[function_id].update(busy)
+            if waited < self.target:
+                self.first_above = None
+                self.overloaded = False
+            elif self.first_above is None:
+                self.first_above = now + self.interval
+            elif now >= self.first_above:
+                self.overloaded = True
+
+    def service_time(self, function_id):
+        with self.lock:
+            estimate = self.functions.get(function_id, self.overall)
+            return estimate.seconds
+
+    def predicted_wait(self, queue_depth):
+        """Seconds a task joining a queue of ``queue_depth`` tasks would wait for a worker"""
+        with self.lock:
+            mean_service = self.overall.seconds
+        return queue_depth * mean_service / self.capacity
+
+    def admit(self, function_id, queue_depth):
+        """Decide on a new task; return ``(admitted, seconds)``.
+
+        ``seconds`` is the estimated time to the result when admitted, or
+        how long to wait before retrying when not.
+        """
+        wait = self.predicted_wait(queue_depth)
+        with self.lock:
+            if queue_depth == 0:
+                # An empty queue has no standing delay, whatever the last samples said
+                self.overloaded = False
+                self.first_above = None
+            limit = self.target if self.overloaded else self.max_wait
+            admitted = wait <= limit
+            if admitted:
+                self.admitted += 1
+            else:
+                self.rejected += 1
+        if admitted:
+            return True, wait + self.service_time(function_id)
+        return False, max(1, math.ceil(wait - limit))
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'overloaded': self.overloaded,
+                'target_wait': self.target,
+                'max_wait': self.max_wait,
+                'mean_service_seconds': round(self.overall.seconds, 3),
+                'service_rate': round(self.capacity / max(self.overall.seconds, 1e-3), 2),
+                'service_seconds': {fid: round(e.seconds, 3) for fid, e in self.functions.items()},
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
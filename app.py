@@ -1,17 +1,40 @@
 import os
+import json
+import math
 import uuid
 import time
 import logging
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from flask_session import Session
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, abort
+from markupsafe import Markup
 from dotenv import load_dotenv
 import openai
-from prompts import get_system_prompt
-from feedback_manager import save_feedback
-import threading
-import queue
+from prompts import get_registry
+from tokenizer import count_tokens, split_text
+from map_reduce import MapReduceJob, leading_instruction, join_translations
+from batch import BatchRunner, item_key, parse_items
+from model_router import ModelRouter, parse_routes
+from conversation import build_context, compaction_turns, compaction_input, context_messages, recent_start
+from conversation_store import ConversationStore
+from job_queue import JobQueue, JobFeeder
+from feedback_manager import save_feedback, FeedbackRollup
+from worker_pool import WorkerPool
+from async_engine import AsyncCompletionEngine
+from streaming import StreamBroker
+from response_cache import ResponseCache, LRUTTLBackend, create_backend
+from similarity_index import SimilarityIndex, minhash, similarity
+from coalescer import RequestCoalescer
+from result_store import ResultStore
+from key_scheduler import KeyScheduler
+from fair_queue import FairQueue
+from cancellation import TaskTracker, TaskCancelled
+from admission import AdmissionController
+from hedging import HedgePolicy, HedgedCall
+from metrics import MetricsRegistry, PipelineMetrics, CONTENT_TYPE
+from static_assets import AssetManifest, IMMUTABLE
 import random
+import atexit
 
 # Load environment variables
 load_dotenv()
@@ -19,28 +42,100 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'supersecretkey')
 
-# Configure server-side sessions
-app.config['SESSION_TYPE'] = 'filesystem'
-Session(app)
+# Sessions only carry the user ID; chat history lives in the conversation store.
+# Server-side sessions (e.g. SESSION_TYPE=redis) remain available through Flask-Session.
+if os.getenv('SESSION_TYPE'):
+    from flask_session import Session
+    app.config['SESSION_TYPE'] = os.getenv('SESSION_TYPE')
+    Session(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 app.logger.addHandler(logging.StreamHandler())
 
+# Static files are served under content-hashed URLs, precompressed once at startup
+static_assets = AssetManifest(app.static_folder)
+
+@app.template_global()
+def asset_url(name):
+    """Cache-forever URL of a static file, falling back to the plain static route for unknown files"""
+    return static_assets.url(name) or url_for('static', filename=name)
+
 # Initialize OpenAI clients with multiple keys if available
 API_KEYS = os.getenv('OPENAI_API_KEYS', os.getenv('OPENAI_API_KEY', '')).split(',')
-clients = [openai.OpenAI(api_key=key.strip()) for key in API_KEYS if key.strip()]
-current_key_index = 0
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', 60))  # Seconds to connect or wait for data before an API call fails
+# No SDK retries: a 429 or connection error must reach KeyScheduler and ModelRouter on the first attempt,
+# and a call can hold a worker for at most UPSTREAM_TIMEOUT
+clients = [openai.OpenAI(api_key=key.strip(), timeout=UPSTREAM_TIMEOUT, max_retries=0) for key in API_KEYS if key.strip()]
 
 # Use GPT-3.5-turbo as default since it has higher rate limits
 MODEL_NAME = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
-MAX_INPUT_LENGTH = 5000  # Character limit for user input
-MAX_CONCURRENT_REQUESTS = 5  # Increased simultaneous API calls
-MAX_QUEUE_SIZE = 15  # Increased allowed queue size
+# Fallback chain, preferred (e.g. cheapest) first; every model must fit MODEL_CONTEXT_TOKENS
+OPENAI_MODELS = [m.strip() for m in os.getenv('OPENAI_MODELS', MODEL_NAME).split(',') if m.strip()]
+MODEL_ROUTES = parse_routes(os.getenv('MODEL_ROUTES', ''))  # e.g. 'code:gpt-4o|gpt-4o-mini,summarize/large:gpt-4o-mini' -- tried before OPENAI_MODELS
+LARGE_INPUT_TOKENS = int(os.getenv('LARGE_INPUT_TOKENS', 2000))  # Inputs above this use the '/large' routes
+MODEL_LATENCY_SLO = float(os.getenv('MODEL_LATENCY_SLO', 20))  # Mean call seconds above which a model yields to faster ones (0 = off)
+MODEL_MAX_ERROR_RATE = float(os.getenv('MODEL_MAX_ERROR_RATE', 0.5))  # Recent error rate above which a model yields to healthier ones
+MAX_INPUT_LENGTH = int(os.getenv('MAX_INPUT_LENGTH', 400000))  # Character sanity cap before tokenizing
+MAX_COMPLETION_TOKENS = 1500
+TEMPERATURE = 0.7
+MODEL_CONTEXT_TOKENS = int(os.getenv('MODEL_CONTEXT_TOKENS', 16385))  # Context window of MODEL_NAME
+MAX_DOCUMENT_TOKENS = int(os.getenv('MAX_DOCUMENT_TOKENS', 60000))  # Largest input accepted for map-reduce
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', 3000))  # Input tokens per map-reduce chunk
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', 200))  # Context repeated across summary chunks
+# Functions that split over-budget inputs, and the prompt that merges their chunk responses (None = concatenate)
+MAP_REDUCE_FUNCTIONS = {'summarize': 'summarize_reduce', 'summarize_reduce': 'summarize_reduce', 'translate': None}
+CONTEXT_FUNCTIONS = [f.strip() for f in os.getenv('CONTEXT_FUNCTIONS', 'explain,code,creative').split(',') if f.strip()]  # Assistants that see earlier turns
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 1500))  # Rolling summary plus verbatim recent turns
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', 50))  # Messages read per conversation page
+CONVERSATION_DB = os.getenv('CONVERSATION_DB', 'data/conversations.db')
+CONVERSATION_TTL = int(os.getenv('CONVERSATION_TTL', 30 * 86400))  # Seconds before an idle user's history is deleted
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 5))  # Simultaneous API calls per key
+WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', MAX_CONCURRENT_REQUESTS * max(len(clients), 1)))
+ADMISSION_TARGET_WAIT = float(os.getenv('ADMISSION_TARGET_WAIT', 5))  # Queue wait tolerated as a standing delay (CoDel target)
+ADMISSION_INTERVAL = float(os.getenv('ADMISSION_INTERVAL', 10))  # Seconds waits must stay above target before new tasks are shed
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 60))  # Predicted queue wait beyond which even bursts are turned away
+KEY_RPM_LIMIT = int(os.getenv('KEY_RPM_LIMIT', 500))  # Requests per minute per key until headers say otherwise
+FUNCTION_PRIORITIES = dict(
+    (item.split(':')[0].strip(), int(item.split(':')[1]))
+    for item in os.getenv('FUNCTION_PRIORITIES', '').split(',') if ':' in item
+)  # e.g. 'translate:0,summarize:1' -- lower is served first, unlisted functions get 0
+FAIR_QUEUE_QUANTUM = int(os.getenv('FAIR_QUEUE_QUANTUM', 500))  # Estimated tokens a user may use per round-robin turn
+KEY_TPM_LIMIT = int(os.getenv('KEY_TPM_LIMIT', 200000))  # Tokens per minute per key until headers say otherwise
+COMPLETION_ENGINE = os.getenv('COMPLETION_ENGINE', 'threaded')  # 'threaded' or 'async'
+ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', 200))  # In-flight completions on the event loop
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'  # Forward deltas to /stream
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'  # Duplicate slow calls on a second key (needs 2+ keys)
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))  # Percentile of recent time-to-first-token after which a call is duplicated
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', 0.05))  # Most duplicates as a fraction of calls
+HEDGE_HOLDOUT = float(os.getenv('HEDGE_HOLDOUT', 0.1))  # Fraction of calls never hedged, the latency baseline in /metrics
+
+# Response cache for repeated inputs (creative stays uncached unless listed)
+RESPONSE_CACHE_FUNCTIONS = [f.strip() for f in os.getenv('RESPONSE_CACHE_FUNCTIONS', 'summarize,explain,translate,code').split(',') if f.strip()]
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))  # Seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')  # memory, filesystem:<dir> or redis://...
+# Cached functions whose inputs are also indexed for near-duplicate lookup after an exact miss
+NEAR_DUPLICATE_FUNCTIONS = [f.strip() for f in os.getenv('NEAR_DUPLICATE_FUNCTIONS', 'summarize,translate,explain').split(',') if f.strip()]
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.9))  # Estimated Jaccard similarity of word 3-grams
+NEAR_DUPLICATE_REUSE = os.getenv('NEAR_DUPLICATE_REUSE', 'false').lower() == 'true'  # Serve matches; off only measures them
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', 5000))  # Recent inputs kept in this process's index
+JOB_QUEUE = os.getenv('JOB_QUEUE', '')  # SQLite path of a durable queue shared by all processes; empty keeps tasks in memory
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 300))  # Seconds before an unacked job is handed out again
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))  # Leases before a job is abandoned with an error
+# Results must be visible to every process when the job queue is shared
+RESULT_STORE_BACKEND = os.getenv('RESULT_STORE_BACKEND', 'filesystem:data/results' if JOB_QUEUE else 'memory')  # Same specs as RESPONSE_CACHE_BACKEND
+RESULT_TTL = int(os.getenv('RESULT_TTL', 3600))  # Seconds a finished result stays pollable
+RESULT_STORE_MAX_ENTRIES = int(os.getenv('RESULT_STORE_MAX_ENTRIES', 10000))
+TASK_DEADLINE = int(os.getenv('TASK_DEADLINE', 300))  # Seconds after acceptance before a task is given up
+CLIENT_GRACE_PERIOD = int(os.getenv('CLIENT_GRACE_PERIOD', 30))  # Seconds without a poll or open stream before a task is dropped
+BATCH_PRIORITY = int(os.getenv('BATCH_PRIORITY', 10))  # Fair queue class of batch items, served after interactive ones
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))  # Most items of one batch in flight at once
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', 1000))  # Items accepted per /process_batch request
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'  # Share one call between identical in-flight tasks
 
-# Request queue and worker thread
-request_queue = queue.Queue()
-stop_worker = threading.Event()
+# Fair-share request queue drained by the worker pool
+request_queue = FairQueue(quantum=FAIR_QUEUE_QUANTUM)
 
 # Define available functions with metadata
 FUNCTIONS = [
@@ -56,164 +151,651 @@ FUNCTIONS = [
      "description": "Generate stories, poems, and more"}
 ]
 
+# Opening message of each assistant, shown above its conversation
+GREETINGS = {
+    'summarize': {
+        'role': 'ai',
+        'content': "Hello! I'm your Summarize assistant. Paste any text and I'll create a concise summary for you."
+    },
+    'explain': {
+        'role': 'ai',
+        'content': "Hi there! I'm your Explain assistant. Give me any concept or topic and I'll explain it clearly."
+    },
+    'translate': {
+        'role': 'ai',
+        'content': "Bonjour! I'm your Translation assistant. I can translate between 50+ languages with cultural context."
+    },
+    'code': {
+        'role': 'ai',
+        'content': "Hello, developer! I'm your Code assistant. I can help with code generation, debugging, and explanations."
+    },
+    'creative': {
+        'role': 'ai',
+        'content': "Hello creative mind! I'm your Creative assistant. Let's brainstorm ideas, write stories, or create art concepts."
+    }
+}
+
 # --- Rate Limit Handling System ---
-class RateLimitManager:
-    def __init__(self):
-        self.last_request_time = 0
-        self.retry_delay = 3  # Reduced base delay
-        self.max_retry_delay = 30  # Reduced max delay
-        self.consecutive_failures = 0
-        self.lock = threading.Lock()
-        
-    def should_delay(self):
-        with self.lock:
-            elapsed = time.time() - self.last_request_time
-            required_delay = min(self.retry_delay * (1.5 ** self.consecutive_failures), self.max_retry_delay)
-            return max(0, required_delay - elapsed)
+key_scheduler = KeyScheduler(len(clients), rpm=KEY_RPM_LIMIT, tpm=KEY_TPM_LIMIT)
+response_cache = ResponseCache(create_backend(RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_MAX_ENTRIES),
+                               RESPONSE_CACHE_FUNCTIONS, RESPONSE_CACHE_TTL)
+similar_inputs = SimilarityIndex(NEAR_DUPLICATE_THRESHOLD, max_entries=NEAR_DUPLICATE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+near_duplicate_shadow = LRUTTLBackend(max_entries=NEAR_DUPLICATE_MAX_ENTRIES)  # session_id -> response reuse would have served
+prompt_registry = get_registry(MODEL_NAME)
+model_router = ModelRouter(OPENAI_MODELS, MODEL_ROUTES, count_tokens=lambda text: count_tokens(text, MODEL_NAME),
+                           large_input_tokens=LARGE_INPUT_TOKENS, latency_slo=MODEL_LATENCY_SLO,
+                           max_error_rate=MODEL_MAX_ERROR_RATE)
+request_coalescer = RequestCoalescer()
+feedback_rollup = FeedbackRollup()
+result_store = ResultStore(create_backend(RESULT_STORE_BACKEND, RESULT_STORE_MAX_ENTRIES), RESULT_TTL)
+conversation_store = ConversationStore(CONVERSATION_DB, ttl=CONVERSATION_TTL, pending_ttl=RESULT_TTL)
+task_tracker = TaskTracker(grace=CLIENT_GRACE_PERIOD, retention=RESULT_TTL)
+admission_controller = AdmissionController(
+    capacity=ASYNC_MAX_CONCURRENCY if COMPLETION_ENGINE == 'async' else WORKER_POOL_SIZE,
+    target=ADMISSION_TARGET_WAIT, interval=ADMISSION_INTERVAL, max_wait=ADMISSION_MAX_WAIT)
+hedge_policy = HedgePolicy(HEDGE_PERCENTILE, HEDGE_BUDGET, HEDGE_HOLDOUT)
+metrics_registry = MetricsRegistry()
+pipeline_metrics = PipelineMetrics(metrics_registry)
+task_accepted = {}  # session_id -> (accept time, function_id) until the result is published
+task_enqueued = {}  # session_id -> time handed to the worker pool, until a worker takes it
+
+def build_request(function_id, user_input, context=(), model=MODEL_NAME):
+    """Keyword arguments for a chat completion request"""
+    return {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": prompt_registry.get(function_id).text},
+            *context_messages(context),
+            {"role": "user", "content": user_input}
+        ],
+        'temperature': TEMPERATURE,
+        'max_tokens': MAX_COMPLETION_TOKENS
+    }
+
+def run_completion(client, session_id, request_kwargs, publish=None):
+    """Call the API, streaming deltas to ``publish`` (default ``publish_delta``) if enabled.
+
+    Returns the response text, the token usage (if reported) and the
+    response headers, which carry the key's rate limit state.
+    """
+    publish = publish or publish_delta
+    if not STREAM_RESPONSES:
+        raw = client.chat.completions.with_raw_response.create(**request_kwargs)
+        response = raw.parse()
+        return response.choices[0].message.content, response.usage, raw.headers
+    
+    raw = client.chat.completions.with_raw_response.create(
+        stream=True, stream_options={'include_usage': True}, **request_kwargs)
+    parts = []
+    usage = None
+    stream = raw.parse()
+    try:
+        for chunk in stream:
+            check_task(session_id)
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                publish(session_id, chunk.choices[0].delta.content)
+    finally:
+        # Drops the connection of an aborted stream
+        stream.close()
+    return ''.join(parts), usage, raw.headers
+
+def publish_delta(session_id, content):
+    """Forward a streamed delta to the task and any coalesced followers"""
+    stream_broker.publish(session_id, content)
+    for follower in request_coalescer.followers_of(session_id):
+        stream_broker.publish(follower, content)
+
+def complete(session_id, function_id, request_kwargs, key_index, estimated_tokens):
+    """Run a completion on ``key_index``, duplicated on another key if it is slower than usual to answer.
+
+    Returns the response text, usage, headers and the key that answered.
+    Reservations of calls that did not answer are settled here; if no
+    call answers, the error is raised for the caller to settle ``key_index``.
+    """
+    if hedge_executor is None:
+        return (*run_completion(clients[key_index], session_id, request_kwargs), key_index)
+    hedged = HedgedCall(hedge_policy, key_scheduler, function_id, key_index, estimated_tokens,
+                        estimated_tokens - request_kwargs['max_tokens'], pipeline_metrics)
+    
+    def attempt(index, attempt_id):
+        return hedged.claim(attempt_id, run_completion(clients[index], session_id, request_kwargs,
+                                                       hedged.gate(attempt_id, publish_delta)))
+    
+    primary = hedge_executor.submit(attempt, key_index, 0)
+    calls = {primary: key_index}
+    delay = hedged.delay()
+    if delay is not None and wait([primary], timeout=delay).not_done and hedged.race.winner is None:
+        hedge_index = hedged.start_hedge()
+        if hedge_index is not None:
+            calls[hedge_executor.submit(attempt, hedge_index, 1)] = hedge_index
+    
+    # Take the first call that answers; if one fails the other may still answer
+    winner, pending = None, set(calls)
+    while winner is None and pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = next((future for future in done if future.exception() is None), None)
+    hedged.finish(winner is not None, by_hedge=winner is not None and winner is not primary)
+    
+    for future, index in calls.items():
+        if hedged.needs_settling(future is winner, future is primary, winner is not None):
+            # A loser stuck before its first token is settled once it returns
+            future.add_done_callback(lambda f, index=index: hedged.settle(index, f.exception()))
+    if winner is None:
+        raise hedged.failure(primary.exception(), [future.exception() for future in calls if future is not primary])
+    return (*winner.result(), calls[winner])
+
+def task_stop_reason(session_id):
+    """Why a task (or the document a chunk belongs to) should stop, unless a coalesced follower still waits for it"""
+    leader = session_id.split(':')[0]
+    reason = task_tracker.stop_reason(leader)
+    if reason is None and job_feeder is not None and job_feeder.is_cancelled(leader):
+        reason = 'cancelled'  # Cancelled through another process
+    if reason is None:
+        return None
+    if any(task_tracker.stop_reason(follower) is None for follower in request_coalescer.followers_of(leader)):
+        return None
+    return reason
+
+def check_task(session_id):
+    """Raise ``TaskCancelled`` if nobody wants the task's answer any more"""
+    reason = task_stop_reason(session_id)
+    if reason is not None:
+        raise TaskCancelled(reason)
+
+def request_key(function_id, user_input, context=()):
+    """Identity of a task: preferred model, system prompt, temperature, normalized input and conversation context"""
+    return ResponseCache.make_key(model_router.primary(function_id, user_input), prompt_registry.get(function_id).sha256,
+                                  TEMPERATURE, user_input, context)
+
+def input_budget(function_id):
+    """Input tokens a single completion can take for a function"""
+    budget = MODEL_CONTEXT_TOKENS - prompt_registry.get(function_id).tokens - MAX_COMPLETION_TOKENS
+    if function_id in MAP_REDUCE_FUNCTIONS and MAP_REDUCE_FUNCTIONS[function_id] is None:
+        # Concatenated outputs are as long as their inputs, so each must fit the completion cap
+        budget = min(budget, MAX_COMPLETION_TOKENS * 2 // 3)
+    if function_id in CONTEXT_FUNCTIONS:
+        budget -= CONTEXT_TOKEN_BUDGET
+    return budget
+
+def check_input_tokens(function_id, user_input):
+    """Error message if an input cannot be served within the token budgets, else None"""
+    tokens = count_tokens(user_input, MODEL_NAME)
+    if tokens <= input_budget(function_id):
+        return None
+    if function_id not in MAP_REDUCE_FUNCTIONS:
+        return f'Input too long. Maximum {input_budget(function_id)} tokens allowed for this function.'
+    if tokens > MAX_DOCUMENT_TOKENS:
+        return f'Document too long. Maximum {MAX_DOCUMENT_TOKENS} tokens allowed.'
+    return None
+
+def estimate_tokens(function_id, user_input, context=()):
+    """Token cost of a task: cached system prompt count, input and context tokens and the completion cap"""
+    context_tokens = sum(count_tokens(content, MODEL_NAME) for _, content in context)
+    return (prompt_registry.get(function_id).tokens + count_tokens(user_input, MODEL_NAME) + context_tokens
+            + MAX_COMPLETION_TOKENS)
+
+def cache_key(function_id, user_input, context=()):
+    """Response cache key for a task, or None if the function is not cached"""
+    if not response_cache.enabled_for(function_id):
+        return None
+    return request_key(function_id, user_input, context)
+
+def cached_result(session_id, function_id, user_input, context=()):
+    """Serve a task from the response cache, or None on a miss"""
+    key = cache_key(function_id, user_input, context)
+    if key is None:
+        return None
+    entry = response_cache.get(key)
+    similar = None
+    if entry is None:
+        entry, similar = near_duplicate(session_id, function_id, user_input, context)
+        if entry is None:
+            return None
+    pipeline_metrics.cache_hits.inc(function_id)
+    result = success_result(session_id, function_id, user_input, entry['ai_response'], time.time(), cached=True,
+                            context=context, model=entry['model_used'])
+    if similar is not None:
+        result['near_duplicate'] = round(similar, 3)
+    return result
+
+def similarity_scope(function_id, user_input, context=()):
+    """Everything but the input that two tasks must share for one's response to answer the other"""
+    return ResponseCache.make_key(model_router.primary(function_id, user_input), prompt_registry.get(function_id).sha256,
+                                  TEMPERATURE, '', context)
+
+def near_duplicate(session_id, function_id, user_input, context=()):
+    """Cache entry of a near-identical earlier input and its similarity, or ``(None, None)``.
+
+    Unless reuse is enabled, a match is only remembered so that the fresh
+    response can be compared with the one reuse would have served.
+    """
+    if function_id not in NEAR_DUPLICATE_FUNCTIONS:
+        return None, None
+    started = time.perf_counter()
+    match = similar_inputs.find(similarity_scope(function_id, user_input, context), user_input)
+    pipeline_metrics.near_duplicate_lookup.observe(time.perf_counter() - started, function_id)
+    # The task's own lookup already counted as a miss; a near-duplicate is not an exact hit
+    entry = response_cache.peek(match[0]) if match is not None else None
+    if entry is None:
+        pipeline_metrics.near_duplicates.inc(function_id, 'miss')
+        return None, None
+    pipeline_metrics.near_duplicate_similarity.observe(match[1], function_id)
+    if not NEAR_DUPLICATE_REUSE:
+        pipeline_metrics.near_duplicates.inc(function_id, 'shadow')
+        near_duplicate_shadow.set(session_id, entry['ai_response'], TASK_DEADLINE)
+        return None, None
+    pipeline_metrics.near_duplicates.inc(function_id, 'reused')
+    return entry, match[1]
+
+def success_result(session_id, function_id, user_input, ai_response, start_time, cached=False, context=(),
+                   model=None):
+    """Build the success result for a completed API request; ``model`` defaults to the task's preferred one"""
+    ai_response = ai_response.strip()
+    processing_time = round(time.time() - start_time, 2)
+    model = model or model_router.primary(function_id, user_input)
+    if not cached:
+        key = cache_key(function_id, user_input, context)
+        if key is not None and ai_response:
+            # Keyed by the preferred model, which is known before the call; the entry says which one answered
+            response_cache.set(key, ai_response, model)
+            if function_id in NEAR_DUPLICATE_FUNCTIONS:
+                similar_inputs.add(similarity_scope(function_id, user_input, context), user_input, key)
+        shadow = near_duplicate_shadow.get(session_id)
+        if shadow is not None:
+            # How close the near-duplicate's response came to what the task really got
+            pipeline_metrics.near_duplicate_agreement.observe(similarity(minhash(shadow), minhash(ai_response)),
+                                                             function_id)
+    
+    func_meta = next((f for f in FUNCTIONS if f["id"] == function_id), None)
+    return {
+        'status': 'success',
+        'session_id': session_id,
+        'func_id': function_id,
+        'func_name': func_meta["name"] if func_meta else "Unknown",
+        'func_icon': func_meta["icon"] if func_meta else "bi-question",
+        'model_used': model,
+        'user_input': user_input,
+        'ai_response': ai_response,
+        'processing_time': processing_time,
+        'cached': cached
+    }
+
+def retry_after():
+    """Seconds before a new task could be served: until a key is usable or the queue has drained, whichever is later"""
+    return max(1, math.ceil(max(key_scheduler.retry_after(), admission_controller.predicted_wait(queue_depth()))))
+
+def error_result(session_id, error, model=None):
+    """Build the retry/error result for a failed API request"""
+    if isinstance(error, TaskCancelled):
+        return {
+            'status': 'cancelled',
+            'session_id': session_id,
+            'reason': error.reason,
+            'error': str(error)
+        }
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        delay = retry_after()
+        return {
+            'status': 'retry',
+            'session_id': session_id,
+            'retry_after': delay,
+            'error': f"API rate limit exceeded. Please try again in {delay} seconds."
+        }
+    if isinstance(error, openai.NotFoundError):
+        # Handle model not found error
+        return {
+            'status': 'error',
+            'session_id': session_id,
+            'error': f"The model '{model or MODEL_NAME}' is not available. Please try a different model."
+        }
+    if isinstance(error, openai.APIError):
+        return {
+            'status': 'error',
+            'session_id': session_id,
+            'error': f"OpenAI API error: {str(error)}"
+        }
+    return {
+        'status': 'error',
+        'session_id': session_id,
+        'error': f"Unexpected error: {str(error)}"
+    }
+
+def api_worker(task):
+    """Process a single queued API request, reporting its queue wait and service time"""
+    session_id, function_id = task[0], task[1]
+    started_at = time.time()
+    waited = started_at - task_enqueued.pop(session_id, started_at)
+    pipeline_metrics.queue_wait.observe(waited, function_id)
+    try:
+        run_task(task)
+    finally:
+        admission_controller.served(function_id, waited, time.time() - started_at)
+
+def run_task(task):
+    """Answer a task from the cache or the API with rate limit handling"""
+    session_id, function_id, user_input, context, callback = task
+    
+    # Skip tasks that were cancelled, ran out of time or lost their client while queued
+    reason = task_stop_reason(session_id)
+    if reason is not None:
+        callback(error_result(session_id, TaskCancelled(reason)))
+        return
+    
+    # Repeated inputs skip the upstream call entirely
+    result = cached_result(session_id, function_id, user_input, context)
+    if result is not None:
+        callback(result)
+        return
+    
+    callback(call_models(session_id, function_id, user_input, context))
+
+def call_models(session_id, function_id, user_input, context):
+    """Call the task's candidate models in turn until one answers or fails for a reason that is not the model's"""
+    models = model_router.candidates(function_id, user_input)
+    estimated_tokens = estimate_tokens(function_id, user_input, context)
+    for attempt, model in enumerate(models):
+        # Pick the key with the most headroom and wait for its budget if needed
+        request_kwargs = build_request(function_id, user_input, context, model)
+        key_index, required_delay = key_scheduler.acquire(estimated_tokens)
+        pipeline_metrics.rate_limit_wait.observe(required_delay, function_id)
+        if required_delay > 0:
+            time.sleep(required_delay)
         
-    def record_success(self):
-        with self.lock:
-            self.last_request_time = time.time()
-            self.consecutive_failures = 0
-            # Reset delay after success
-            self.retry_delay = max(3, self.retry_delay // 1.5)
-            
-    def record_failure(self):
-        with self.lock:
-            self.consecutive_failures += 1
-            self.retry_delay = min(self.retry_delay * 1.5, self.max_retry_delay)
-            self.last_request_time = time.time()
-
-rate_limit_manager = RateLimitManager()
-
-def api_worker():
-    """Background worker to process API requests with rate limit handling"""
-    while not stop_worker.is_set():
         try:
-            task = request_queue.get(timeout=0.5)  # Shorter timeout
-            if task is None:
+            start_time = time.time()
+            # The rate limit wait may have outlasted the task's deadline or its client
+            check_task(session_id)
+            ai_response, usage, headers, key_index = complete(session_id, function_id, request_kwargs, key_index,
+                                                              estimated_tokens)
+        except TaskCancelled as e:
+            key_scheduler.release(key_index, estimated_tokens)
+            return error_result(session_id, e)
+        except Exception as e:
+            elapsed = time.time() - start_time
+            pipeline_metrics.upstream_call(function_id, elapsed, error=e)
+            if model_router.fail_over(models, attempt, elapsed, e, session_id, pipeline_metrics) is not None:
+                # The model is throttled or unavailable, not the key
+                key_scheduler.release(key_index, estimated_tokens)
                 continue
-                
-            session_id, function_id, user_input, callback = task
-            
-            # Check rate limits before processing
-            required_delay = rate_limit_manager.should_delay()
-            if required_delay > 0:
-                time.sleep(required_delay)
-                
-            try:
-                start_time = time.time()
-                system_prompt = get_system_prompt(function_id)
-                
-                # Rotate API keys
-                global current_key_index
-                with threading.Lock():
-                    client = clients[current_key_index % len(clients)]
-                    current_key_index = (current_key_index + 1) % len(clients)
-                
-                # Make API request
-                response = client.chat.completions.create(
-                    model=MODEL_NAME,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_input}
-                    ],
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-                
-                ai_response = response.choices[0].message.content.strip()
-                processing_time = round(time.time() - start_time, 2)
-                rate_limit_manager.record_success()
-                
-                # Prepare result
-                func_meta = next((f for f in FUNCTIONS if f["id"] == function_id), None)
-                result = {
-                    'status': 'success',
-                    'session_id': session_id,
-                    'func_id': function_id,
-                    'func_name': func_meta["name"] if func_meta else "Unknown",
-                    'func_icon': func_meta["icon"] if func_meta else "bi-question",
-                    'model_used': MODEL_NAME,
-                    'user_input': user_input,
-                    'ai_response': ai_response,
-                    'processing_time': processing_time
-                }
-                
-            except (openai.RateLimitError, openai.APIConnectionError) as e:
-                rate_limit_manager.record_failure()
-                result = {
-                    'status': 'retry',
-                    'session_id': session_id,
-                    'error': f"API rate limit exceeded. Please try again in {rate_limit_manager.retry_delay} seconds."
-                }
-            except openai.NotFoundError:
-                # Handle model not found error
-                result = {
-                    'status': 'error',
-                    'session_id': session_id,
-                    'error': f"The model '{MODEL_NAME}' is not available. Please try a different model."
-                }
-            except openai.APIError as e:
-                result = {
-                    'status': 'error',
-                    'session_id': session_id,
-                    'error': f"OpenAI API error: {str(e)}"
-                }
-            except Exception as e:
-                result = {
-                    'status': 'error',
-                    'session_id': session_id,
-                    'error': f"Unexpected error: {str(e)}"
-                }
-                
-            # Send result back to main thread
-            callback(result)
-            request_queue.task_done()
-            
-        except queue.Empty:
-            continue
-
-# Start worker thread
-worker_thread = threading.Thread(target=api_worker, daemon=True)
-worker_thread.start()
+            key_scheduler.record_failure(key_index, estimated_tokens, e)
+            return error_result(session_id, e, model)
+        
+        pipeline_metrics.upstream_call(function_id, time.time() - start_time, usage=usage)
+        model_router.record_success(model, time.time() - start_time)
+        key_scheduler.record_success(key_index, estimated_tokens, usage.total_tokens if usage else None, headers)
+        return success_result(session_id, function_id, user_input, ai_response, start_time, context=context,
+                              model=model)
+
+# Start the configured completion engine
+stream_broker = StreamBroker()
+worker_pool = WorkerPool(request_queue, api_worker, WORKER_POOL_SIZE)
+# A primary and a duplicate per worker, plus room for losers still waiting for their first token
+hedge_executor = (ThreadPoolExecutor(WORKER_POOL_SIZE * 3, thread_name_prefix='hedge')
+                  if HEDGE_REQUESTS and COMPLETION_ENGINE != 'async' and len(clients) > 1 else None)
+async_engine = AsyncCompletionEngine(API_KEYS, build_request, success_result, error_result,
+                                     scheduler=key_scheduler,
+                                     max_concurrency=ASYNC_MAX_CONCURRENCY,
+                                     quantum=FAIR_QUEUE_QUANTUM,
+                                     lookup=cached_result,
+                                     estimate=estimate_tokens,
+                                     metrics=pipeline_metrics,
+                                     should_stop=task_stop_reason,
+                                     timeout=UPSTREAM_TIMEOUT,
+                                     on_served=admission_controller.served,
+                                     router=model_router,
+                                     hedge=hedge_policy if HEDGE_REQUESTS else None,
+                                     on_delta=publish_delta if STREAM_RESPONSES else None)
+job_queue = JobQueue(JOB_QUEUE, JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS) if JOB_QUEUE else None
+job_feeder = None  # Started at the end of the module, once everything it calls is defined
+if COMPLETION_ENGINE == 'async':
+    async_engine.start()
+else:
+    worker_pool.start()
+
+def shutdown_engine():
+    """Stop leasing jobs, stop the engine, then hand unfinished jobs back to the shared queue"""
+    if job_feeder is not None:
+        job_feeder.stop()
+    if COMPLETION_ENGINE == 'async':
+        async_engine.shutdown()
+    else:
+        worker_pool.shutdown()
+    if hedge_executor is not None:
+        hedge_executor.shutdown(wait=False)
+    if job_feeder is not None:
+        job_feeder.release_held()
+
+atexit.register(shutdown_engine)
+
+def enqueue_task(task, user, priority=None):
+    """Hand a task to the configured completion engine"""
+    session_id, function_id, user_input, _, _ = task
+    priority = FUNCTION_PRIORITIES.get(function_id, 0) if priority is None else priority
+    cost = count_tokens(user_input, MODEL_NAME) + 1
+    if COMPLETION_ENGINE == 'async':
+        async_engine.submit(task, user=user, priority=priority, cost=cost)
+    else:
+        task_enqueued[session_id] = time.time()
+        request_queue.put(task, user=user, priority=priority, cost=cost)
+
+def dispatch_task(task, user, priority=None):
+    """Queue a task, fanning inputs over the function's token budget out as map-reduce chunks"""
+    session_id, function_id, user_input, context, callback = task
+    budget = input_budget(function_id)
+    if function_id not in MAP_REDUCE_FUNCTIONS or count_tokens(user_input, MODEL_NAME) <= budget:
+        enqueue_task(task, user, priority)
+        return
+    
+    # The whole document may already be cached from an earlier map-reduce; chunks carry no conversation context
+    result = cached_result(session_id, function_id, user_input)
+    if result is not None:
+        callback(result)
+        return
+    
+    start_time = time.time()
+    reducer = MAP_REDUCE_FUNCTIONS[function_id]
+    overlap = CHUNK_OVERLAP_TOKENS if reducer is not None else 0
+    # Chunks are answered independently, so an instruction such as the target language goes with each of them
+    instruction, text = leading_instruction(user_input) if reducer is None else ('', user_input)
+    chunk_tokens = min(CHUNK_TOKENS, budget) - count_tokens(instruction + '\n', MODEL_NAME)
+    chunks = [f"{instruction}\n{chunk}" if instruction else chunk
+              for chunk in split_text(text, chunk_tokens, overlap, MODEL_NAME)]
+    
+    models_used = set()  # Chunks may land on different models of the chain
+    
+    def finish(ai_response, model):
+        result = success_result(session_id, function_id, user_input, ai_response, start_time, model=model)
+        result['chunks'] = len(chunks)
+        callback(result)
+    
+    def reduce(responses):
+        if reducer is None:
+            finish(join_translations(responses), ', '.join(sorted(models_used)))
+            return
+        merged = '\n\n'.join(f"[Part {i + 1} of {len(responses)}]\n{r.strip()}" for i, r in enumerate(responses))
+        # The merge streams to the client under the original session id and is split again if still too long
+        dispatch_task((session_id, reducer, merged, (),
+                       lambda result: finish(result['ai_response'], result['model_used']) if result['status'] == 'success' else callback(result)),
+                      user, priority)
+    
+    app.logger.info(f"Splitting {function_id} task {session_id} into {len(chunks)} chunks")
+    job = MapReduceJob(session_id, len(chunks), reduce, callback)
+    
+    def chunk_callback(index):
+        done = job.callback(index)
+        def record(result):
+            if result['status'] == 'success':
+                models_used.add(result['model_used'])
+            done(result)
+        return record
+    
+    for index, chunk in enumerate(chunks):
+        enqueue_task((job.chunk_id(index), function_id, chunk, (), chunk_callback(index)), user, priority)
+
+def submit_task(session_id, function_id, user_input, context, user, kind='task'):
+    """Queue a new task or compaction; return True if it joined an identical in-flight task"""
+    if job_queue is not None:
+        key = request_key(function_id, user_input, context) if COALESCE_REQUESTS and kind == 'task' else None
+        leader = job_queue.put(session_id, kind, user, function_id, user_input, context,
+                               priority=FUNCTION_PRIORITIES.get(function_id, 0),
+                               cost=count_tokens(user_input, MODEL_NAME) + 1, key=key)
+        job_feeder.notify()
+        return leader is not None
+    
+    task_accepted[session_id] = (time.time(), function_id)
+    if kind == 'compaction':
+        enqueue_task((session_id, function_id, user_input, context, process_result), user)
+        return False
+    if COALESCE_REQUESTS and request_coalescer.join(request_key(function_id, user_input, context), session_id):
+        return True
+    dispatch_task((session_id, function_id, user_input, context, lambda result: deliver_result(result)), user)
+    return False
+
+def run_job(job):
+    """Run a job leased from the shared queue on this process's engine; ack it once its result is stored"""
+    session_id = job['session_id']
+    # The job may have been accepted by another process
+    task_accepted[session_id] = (job['enqueued_at'], job['function_id'])
+    task_tracker.register(session_id, job['enqueued_at'] + TASK_DEADLINE, watch_client=False)
+    
+    def on_result(result):
+        try:
+            # A job cancelled from any process was answered by the cancellation
+            if job_queue.claim(session_id):
+                process_result(result)
+        finally:
+            followers = job_feeder.done(session_id)
+        for follower in followers:
+            process_result(dict(result, session_id=follower))
+    
+    task = (session_id, job['function_id'], job['user_input'], job['context'], on_result)
+    if job['kind'] == 'compaction':
+        enqueue_task(task, job['user_id'])
+    else:
+        dispatch_task(task, job['user_id'])
+
+def abandon_job(job):
+    """Fail a job that kept dying with its process instead of retrying it forever"""
+    result = {
+        'status': 'error',
+        'session_id': job['session_id'],
+        'error': f"The request failed {job['attempts']} times and was abandoned. Please try again."
+    }
+    if job['settled'] is None:  # Otherwise already answered by a cancellation or its last holder
+        process_result(result)
+    for follower in job_queue.ack(job['session_id']):
+        process_result(dict(result, session_id=follower))
+
+def drop_tasks(match):
+    """Take the tasks whose session id satisfies ``match`` off this process's engine and answer them as stopped.
+
+    Queued tasks are removed; the async engine also aborts matching calls
+    in flight, while a threaded worker notices at its next check.
+    """
+    if COMPLETION_ENGINE == 'async':
+        async_engine.cancel(match)
+        return
+    for task in request_queue.remove(lambda task: match(task[0])):
+        task_enqueued.pop(task[0], None)
+        reason = task_stop_reason(task[0]) or 'cancelled'
+        task[4](error_result(task[0], TaskCancelled(reason)))
+
+def prune_dead_tasks():
+    """Free queue slots held by tasks that were cancelled, ran out of time or lost their client"""
+    if job_queue is None:
+        drop_tasks(lambda session_id: task_stop_reason(session_id) is not None)
+
+def queue_depth():
+    """Number of tasks waiting for a free worker"""
+    if job_queue is not None:
+        return job_queue.qsize()
+    if COMPLETION_ENGINE == 'async':
+        return async_engine.queue_depth()
+    return request_queue.qsize()
+
+def queue_position(session_id):
+    """Place of a task (its first chunk, or the leader it is coalesced with) in the service order"""
+    if job_queue is not None:
+        position = job_queue.position(session_id)
+        if position is not None:
+            return position
+    
+    def matches(task_id):
+        leader = task_id.split(':')[0]  # Chunk tasks are named after their document's session
+        return leader == session_id or session_id in request_coalescer.followers_of(leader)
+    if COMPLETION_ENGINE == 'async':
+        return async_engine.position(matches)
+    return request_queue.position(lambda task: matches(task[0]))
+
+def user_id():
+    """Stable identifier of the current browser session for fair-share queueing and chat history"""
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+    conversation_store.touch(session['user_id'])
+    return session['user_id']
+
+function_cards_html = None  # The cards only change with a deploy, so they are rendered once
+
+def function_cards():
+    global function_cards_html
+    if function_cards_html is None:
+        function_cards_html = Markup(render_template('function_cards.html', greetings=GREETINGS,
+                                                     page_size=CHAT_PAGE_SIZE))
+    return function_cards_html
 
 @app.route('/')
 def index():
-    """Render the homepage with function cards."""
-    # Initialize chat histories if not present
-    if 'chats' not in session:
-        session['chats'] = {
-            'summarize': [{
-                'role': 'ai',
-                'content': "Hello! I'm your Summarize assistant. Paste any text and I'll create a concise summary for you."
-            }],
-            'explain': [{
-                'role': 'ai',
-                'content': "Hi there! I'm your Explain assistant. Give me any concept or topic and I'll explain it clearly."
-            }],
-            'translate': [{
-                'role': 'ai',
-                'content': "Bonjour! I'm your Translation assistant. I can translate between 50+ languages with cultural context."
-            }],
-            'code': [{
-                'role': 'ai',
-                'content': "Hello, developer! I'm your Code assistant. I can help with code generation, debugging, and explanations."
-            }],
-            'creative': [{
-                'role': 'ai',
-                'content': "Hello creative mind! I'm your Creative assistant. Let's brainstorm ideas, write stories, or create art concepts."
-            }]
-        }
-    
+    """Render the homepage with function cards; conversations load from /api/history."""
+    user_id()
     feedback_success = request.args.get('feedback') == 'success'
-    queue_size = request_queue.qsize()
+    queue_size = queue_depth()
     return render_template('index.html', 
                           functions=FUNCTIONS, 
+                          function_cards=function_cards(),
                           feedback_success=feedback_success,
                           model_name=MODEL_NAME,
-                          queue_size=queue_size,
-                          chats=session.get('chats', {}))
+                          queue_size=queue_size)
+
+@app.route('/api/history/<function_id>')
+def chat_history(function_id):
+    """One page of the user's conversation with an assistant, oldest first.
+
+    ``before`` from the response fetches the next older page; it is None
+    once there are no older messages.
+    """
+    if function_id not in GREETINGS:
+        return jsonify({'error': 'Unknown function'}), 404
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), CHAT_PAGE_SIZE)
+    before = request.args.get('before', type=int)
+    # One extra row tells whether an older page exists
+    messages = conversation_store.history(user_id(), function_id, limit + 1, before)
+    has_more = len(messages) > limit
+    messages = messages[-limit:]
+    response = jsonify({
+        'messages': [{field: message[field] for field in ('id', 'role', 'content', 'model_used', 'timestamp')}
+                     for message in messages],
+        'before': messages[0]['id'] if has_more else None
+    })
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Static file by content-hashed name, in the smallest encoding the client accepts"""
+    asset = static_assets.lookup(filename)
+    if asset is None:
+        abort(404)
+    encoding, body = asset.pick(request.headers.get('Accept-Encoding'))
+    response = Response(body, content_type=asset.content_type)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(f"{asset.digest}-{encoding}")
+    return response.make_conditional(request)
 
 @app.route('/process', methods=['POST'])
 def process_request():
@@ -222,93 +804,222 @@ def process_request():
     user_input = request.form.get('user_input', '').strip()
     
     # Validate input
-    if not function_id or function_id not in [f['id'] for f in FUNCTIONS]:
-        return jsonify({'error': 'Invalid function selection'}), 400
+    input_error = validate_input(function_id, user_input)
+    if input_error:
+        return jsonify({'error': input_error}), 400
     
-    if not user_input:
-        return jsonify({'error': 'Please enter your request'}), 400
-    
-    if len(user_input) > MAX_INPUT_LENGTH:
-        return jsonify({'error': f'Input too long. Maximum {MAX_INPUT_LENGTH} characters allowed.'}), 400
-    
-    # Check queue size
-    if request_queue.qsize() >= MAX_QUEUE_SIZE:
-        return jsonify({'error': 'Our servers are busy. Please try again in a few minutes.'}), 429
+    # Admit by predicted queue wait, after freeing the slots of tasks nobody waits for
+    prune_dead_tasks()
+    admitted, seconds = admission_controller.admit(function_id, queue_depth())
+    if not admitted:
+        pipeline_metrics.rejections.inc(function_id)
+        return (jsonify({'error': f'Our servers are busy. Please try again in {seconds} seconds.',
+                         'retry_after': seconds}),
+                429, {'Retry-After': str(seconds)})
     
     # Create unique session ID for this request
     session_id = str(uuid.uuid4())
-    queue_position = request_queue.qsize() + 1
-    
-    # Add user message to chat history
-    if 'chats' not in session:
-        session['chats'] = {}
+    user = user_id()
+    context = conversation_context(user, function_id)
     
-    if function_id not in session['chats']:
-        session['chats'][function_id] = []
-    
-    session['chats'][function_id].append({
+    # Add user message to chat history and remember whose conversation the result belongs to
+    conversation_store.append(user, function_id, {
         'role': 'user',
         'content': user_input,
         'timestamp': datetime.now().isoformat(),
         'session_id': session_id
     })
-    session.modified = True
+    conversation_store.add_pending(session_id, user, function_id)
+    # Polls may reach any process when the job queue is shared, so only this one can watch the client
+    task_tracker.register(session_id, time.time() + TASK_DEADLINE, watch_client=job_queue is None)
     
-    # Add to processing queue
-    request_queue.put((session_id, function_id, user_input, lambda result: process_result(result)))
+    # Add to processing queue, unless an identical task is already in flight
+    stream_broker.open(session_id)
+    coalesced = submit_task(session_id, function_id, user_input, context, user)
     
     return jsonify({
         'session_id': session_id,
-        'queue_position': queue_position,
-        'status': 'queued'
+        'queue_position': queue_position(session_id) or 0,
+        'eta_seconds': round(seconds, 1),
+        'status': 'queued',
+        'coalesced': coalesced
     })
 
-def process_result(result):
-    """Callback to handle API results and update session"""
-    session_id = result['session_id']
-    function_id = result.get('func_id')
+def validate_input(function_id, user_input):
+    """Error message for an unknown function or an unusable input, else None"""
+    if not function_id or function_id not in [f['id'] for f in FUNCTIONS]:
+        return 'Invalid function selection'
+    if not isinstance(user_input, str) or not user_input.strip():
+        return 'Please enter your request'
+    if len(user_input) > MAX_INPUT_LENGTH:
+        return f'Input too long. Maximum {MAX_INPUT_LENGTH} characters allowed.'
+    return check_input_tokens(function_id, user_input)
+
+def run_batch(batch_id, items, concurrency=BATCH_CONCURRENCY):
+    """Result lines of batch items in completion order.
+
+    Items run below interactive requests in the fair queue, as one user per
+    batch. Completed items are kept in the result store under the batch id
+    and ``item_key`` (item id and a hash of its function and input), so
+    running the same batch again replays them instead of calling the API,
+    while an item whose input changed runs again. With the default in-memory
+    ``RESULT_STORE_BACKEND`` the replay only works within one process
+    lifetime; a restart forgets every batch.
+    """
+    def submit(item, callback):
+        key = f"batch-{batch_id}-{item_key(item)}"
+        stored = result_store.get(key)
+        if stored is not None:
+            callback(stored)
+            return
+        
+        def on_result(result):
+            try:
+                if result['status'] == 'success':
+                    result_store.put(key, result)
+            finally:
+                callback(result)
+        
+        task = (str(uuid.uuid4()), item['function'], item['input'].strip(), (), on_result)
+        dispatch_task(task, f"batch:{batch_id}", priority=BATCH_PRIORITY)
     
-    if not function_id or 'chats' not in session or function_id not in session['chats']:
-        return
+    runner = BatchRunner(submit, concurrency,
+                         validate=lambda item: validate_input(item.get('function'), item.get('input')))
+    return runner.run(items)
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """Run a JSONL body of {"id", "function", "input"} items and stream JSONL results as they finish.
+
+    Pass the ``batch_id`` from the ``X-Batch-Id`` header to resume an
+    interrupted batch without repeating completed items.
+    """
+    batch_id = request.args.get('batch_id') or uuid.uuid4().hex
+    concurrency = max(1, min(request.args.get('concurrency', BATCH_CONCURRENCY, type=int), BATCH_CONCURRENCY))
+    items = list(parse_items(request.get_data(as_text=True).splitlines()))
+    if not items:
+        return jsonify({'error': 'The batch has no items'}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Batch too large. Maximum {MAX_BATCH_ITEMS} items allowed.'}), 413
     
+    def generate():
+        for line in run_batch(batch_id, items, concurrency):
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Batch-Id': batch_id, 'X-Accel-Buffering': 'no'})
+
+def conversation_context(user, function_id):
+    """Rolling summary and recent turns of a user's conversation with an assistant"""
+    if function_id not in CONTEXT_FUNCTIONS:
+        return ()
+    # Only the newest page is read; anything older is covered by the summary
+    history = conversation_store.history(user, function_id, CHAT_PAGE_SIZE)
+    summary = conversation_store.get_summary(user, function_id)
+    context, overflow = build_context(history, summary, CONTEXT_TOKEN_BUDGET, MODEL_NAME)
+    if overflow:
+        schedule_compaction(user, function_id, history, summary)
+    return context
+
+def schedule_compaction(user, function_id, history, summary):
+    """Queue an update of the rolling summary, unless one is already pending for this assistant"""
+    if conversation_store.compaction_pending(user, function_id):
+        return
+    turns = compaction_turns(history, summary, CONTEXT_TOKEN_BUDGET, MODEL_NAME)
+    # Turns beyond what one compaction can read are dropped rather than summarized
+    turns = turns[recent_start(turns, input_budget('compact_history') - CONTEXT_TOKEN_BUDGET, MODEL_NAME):]
+    if not turns:
+        return
+    session_id = str(uuid.uuid4())
+    conversation_store.add_pending(session_id, user, function_id, compacts=turns[-1][0])
+    submit_task(session_id, 'compact_history', compaction_input(summary, turns), (), user, kind='compaction')
+
+def deliver_result(result):
+    """Hand a task result to its own session and every coalesced follower"""
+    for task_result in request_coalescer.complete(result) + [result]:
+        try:
+            process_result(task_result)
+        except Exception:
+            app.logger.exception(f"Failed to deliver result for {task_result['session_id']}")
+
+def result_payload(result):
+    """The /get_result response for a finished task"""
     if result['status'] == 'success':
-        # Add AI response to chat history
-        session['chats'][function_id].append({
-            'role': 'ai',
-            'content': result['ai_response'],
-            'model_used': result['model_used'],
-            'processing_time': result['processing_time'],
-            'timestamp': datetime.now().isoformat(),
-            'session_id': session_id  # 👈 important
-        })
-    else:
-        # Add error message to chat history
-        session['chats'][function_id].append({
-            'role': 'error',
-            'content': result.get('error', 'An unknown error occurred'),
-            'timestamp': datetime.now().isoformat(),
-            'session_id': session_id
-        })
+        return {'status': 'completed', 'message': result['ai_response']}
+    return {'status': 'error', 'message': result.get('error', 'An unknown error occurred')}
+
+def process_result(result):
+    """Callback to publish API results to the result store, chat history and SSE stream"""
+    session_id = result['session_id']
+    if not task_tracker.finish(session_id):
+        return  # Already answered by a cancellation
+    result['completed_at'] = datetime.now().isoformat()
+    result_store.put(session_id, result)
+    conversation_store.complete(result, result['completed_at'])
+    stream_broker.finish(session_id, result_payload(result))
     
-    session.modified = True
+    accepted_at, function_id = task_accepted.pop(session_id, (None, result.get('func_id', 'unknown')))
+    pipeline_metrics.requests.inc(function_id, result['status'])
+    if result['status'] == 'cancelled':
+        pipeline_metrics.tasks_stopped.inc(result['reason'])
+    if accepted_at is not None:
+        pipeline_metrics.end_to_end.observe(time.time() - accepted_at, function_id, result['status'])
 
 @app.route('/get_result/<session_id>')
 def get_result(session_id):
-    for func_id, chats in session.get('chats', {}).items():
-        for chat in reversed(chats):  # Latest first
-            if chat.get('session_id') == session_id:
-                if chat['role'] == 'ai':
-                    return jsonify({
-                        'status': 'completed',
-                        'message': chat['content']
-                    })
-                elif chat['role'] == 'error':
-                    return jsonify({
-                        'status': 'error',
-                        'message': chat['content']
-                    })
-    return jsonify({'status': 'pending'})
+    task_tracker.seen(session_id)
+    result = result_store.get(session_id)
+    if result is None:
+        return jsonify({'status': 'pending', 'queue_position': queue_position(session_id) or 0})
+    return jsonify(result_payload(result))
+
+@app.route('/stream/<session_id>')
+def stream_result(session_id):
+    """Stream completion deltas as Server-Sent Events.
+
+    Unknown sessions (e.g. queued by another process) get a 404 so the
+    client falls back to polling /get_result.
+    """
+    if not stream_broker.has(session_id):
+        return jsonify({'status': 'unknown', 'fallback': url_for('get_result', session_id=session_id)}), 404
+    
+    poll = None
+    if job_queue is not None:
+        # The job may run in another process, which cannot publish to this channel
+        def poll():
+            result = result_store.get(session_id)
+            return result_payload(result) if result is not None else None
+    
+    def events():
+        # An open stream keeps the task alive; events come at least every heartbeat
+        for event in stream_broker.events(session_id, poll=poll):
+            task_tracker.seen(session_id)
+            yield event
+    
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
+@app.route('/cancel/<session_id>', methods=['GET', 'POST'])
+def cancel_request(session_id):
+    """Cancel a queued or running task; its work stops unless a coalesced request still needs it"""
+    if job_queue is not None:
+        # Whichever process accepted or leased the job; its holder stores no other answer
+        outcome = job_queue.cancel(session_id)
+        if outcome == 'cancelled':
+            process_result(error_result(session_id, TaskCancelled('cancelled')))
+            return jsonify({'status': 'cancelled'})
+        if outcome == 'finished':
+            return jsonify({'status': 'finished'})
+    if not task_tracker.cancel(session_id):
+        if result_store.get(session_id) is not None:
+            return jsonify({'status': 'finished'})
+        return jsonify({'status': 'unknown'}), 404
+    
+    process_result(error_result(session_id, TaskCancelled('cancelled')))
+    if job_queue is None and task_stop_reason(session_id) is not None:
+        drop_tasks(lambda task_id: task_id.split(':')[0] == session_id)
+    return jsonify({'status': 'cancelled'})
 
 @app.route('/feedback', methods=['POST'])
 def handle_feedback():
@@ -321,9 +1032,16 @@ def handle_feedback():
     if not rating or rating not in ['good', 'neutral', 'poor']:
         return jsonify({'error': 'Invalid feedback rating'}), 400
     
+    # Attribute feedback to the assistant that produced the answer
+    function_id = request.form.get('function')
+    if not function_id and request_id:
+        result = result_store.get(request_id)
+        function_id = result.get('func_id') if result else None
+    
     # Save feedback
     save_feedback({
         'request_id': request_id,
+        'function': function_id,
         'rating': rating,
         'comments': comments,
         'timestamp': datetime.now().isoformat()
@@ -331,25 +1049,78 @@ def handle_feedback():
     
     return jsonify({'status': 'success'})
 
-@app.teardown_appcontext
-def shutdown_worker(exception=None):
-    """Clean up worker thread on shutdown"""
-    stop_worker.set()
-    try:
-        worker_thread.join(timeout=2.0)
-    except RuntimeError:
-        pass
+@app.route('/api/feedback/stats')
+def feedback_stats():
+    """Feedback counts by day, rating and function from incremental rollups"""
+    days = request.args.get('days', type=int)
+    if days is not None and days < 1:
+        return jsonify({'error': 'days must be at least 1'}), 400
+    return jsonify(feedback_rollup.get_stats(days=days))
 
 @app.route('/api/status')
 def api_status():
     """Endpoint to get current API status"""
+    key_stats = key_scheduler.get_stats()
     return jsonify({
-        'queue_size': request_queue.qsize(),
-        'consecutive_failures': rate_limit_manager.consecutive_failures,
-        'retry_delay': rate_limit_manager.retry_delay,
-        'status': 'normal' if rate_limit_manager.consecutive_failures == 0 else 'delayed'
+        'queue_size': queue_depth(),
+        'engine': COMPLETION_ENGINE,
+        'consecutive_failures': min(k['consecutive_failures'] for k in key_stats),
+        'retry_delay': key_scheduler.retry_after(),
+        'admission': admission_controller.get_stats(),
+        'status': 'normal' if key_scheduler.healthy_keys() == len(key_stats) else 'delayed',
+        'keys': key_stats,
+        'models': model_router.get_stats(),
+        'workers': async_engine.get_stats() if COMPLETION_ENGINE == 'async' else worker_pool.get_stats(),
+        'hedging': hedge_policy.get_stats() if HEDGE_REQUESTS else None,
+        'cache': response_cache.get_stats(),
+        'near_duplicates': dict(similar_inputs.get_stats(), reuse=NEAR_DUPLICATE_REUSE),
+        'coalescing': request_coalescer.get_stats(),
+        'tasks': task_tracker.get_stats(),
+        'conversations': conversation_store.get_stats(),
+        'jobs': dict(job_queue.get_stats(), **job_feeder.get_stats()) if job_queue is not None else None,
+        'prompts': prompt_registry.get_stats(),
+        'static_assets': static_assets.get_stats()
     })
 
+@app.route('/metrics')
+def metrics():
+    """Pipeline latencies, outcomes, token usage and queue gauges of this process for Prometheus"""
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
+def workers_busy():
+    if COMPLETION_ENGINE == 'async':
+        return async_engine.in_flight
+    return worker_pool.busy_count()
+
+metrics_registry.gauge('queue_depth', 'Tasks waiting for a free worker', queue_depth)
+metrics_registry.gauge('workers_busy', 'Workers (or async slots) running a task', workers_busy)
+metrics_registry.gauge('workers_capacity', 'Workers (or async slots) available to run tasks',
+                       lambda: ASYNC_MAX_CONCURRENCY if COMPLETION_ENGINE == 'async' else worker_pool.size)
+metrics_registry.gauge('tasks_in_progress', 'Accepted tasks whose result is not published yet',
+                       lambda: len(task_accepted))
+metrics_registry.gauge('predicted_queue_wait_seconds', 'Queue wait a new task would have, from measured service times',
+                       lambda: round(admission_controller.predicted_wait(queue_depth()), 3))
+metrics_registry.gauge('admission_overloaded', '1 while queue waits have stayed above target and new tasks are shed',
+                       lambda: int(admission_controller.overloaded))
+metrics_registry.gauge('keys_healthy', 'API keys not quarantined', key_scheduler.healthy_keys)
+metrics_registry.gauge('model_latency_seconds', 'Mean latency of recent successful calls per model',
+                       lambda: {(m['model'],): m['latency_seconds'] or 0 for m in model_router.get_stats()}, ['model'])
+metrics_registry.gauge('model_error_rate', 'Share of recent calls per model that failed',
+                       lambda: {(m['model'],): m['error_rate'] for m in model_router.get_stats()}, ['model'])
+metrics_registry.gauge('near_duplicate_index_entries', 'Inputs in the near-duplicate index',
+                       lambda: len(similar_inputs.entries))
+metrics_registry.gauge('near_duplicate_index_bytes', 'Approximate memory held by the near-duplicate index',
+                       similar_inputs.memory_bytes)
+metrics_registry.gauge('uptime_seconds', 'Seconds since this process started',
+                       lambda: round(time.time() - pipeline_metrics.started_at, 1))
+
+# Every process leases from the shared queue; with gunicorn, do not use --preload,
+# since threads started before the fork do not survive in the workers
+if job_queue is not None:
+    job_feeder = JobFeeder(job_queue, run_job, abandon_job,
+                           capacity=ASYNC_MAX_CONCURRENCY if COMPLETION_ENGINE == 'async' else WORKER_POOL_SIZE)
+    job_feeder.start()
+
 if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_ENV', 'development') == 'development'
     app.run(host='0.0.0.0', port=5000, debug=debug_mode, threaded=True)
\ No newline at end of file
@@ -0,0 +1,375 @@
+import asyncio
+import threading
+import time
+import logging
+import openai
+from key_scheduler import estimate_request_tokens
+from cancellation import TaskCancelled
+from hedging import HedgedCall, HedgeLost
+from fair_queue import FairQueue
+
+logger = logging.getLogger('async_engine')
+
+# Connection limits type of the HTTP library bundled with the openai SDK
+Limits = type(openai.DEFAULT_CONNECTION_LIMITS)
+
+
+class AsyncCompletionEngine:
+    """Run chat completions concurrently on a single asyncio event loop.
+
+    The loop lives in one background thread; tasks are handed over with
+    ``submit`` and produce the same result dicts as the threaded
+    ``api_worker`` through the shared ``on_success``/``on_error`` builders
+    and pick keys through the same ``KeyScheduler``.
+    When ``on_delta`` is given, completions are streamed and every content
+    delta is forwarded to it. ``lookup`` may answer a task before it takes
+    a concurrency slot (e.g. from a response cache); like ``on_success``
+    and the task callbacks, which may block on disk or network too, it
+    runs in a worker thread instead of on the loop. ``estimate`` overrides
+    the default token cost estimate of a task. ``metrics`` (a
+    ``PipelineMetrics``) receives queue, rate limit and upstream timings.
+    ``should_stop`` returns a ``TaskCancelled`` reason for tasks that are
+    no longer wanted; it is asked before the call, after any rate limit
+    wait and on every streamed chunk. ``cancel`` aborts tasks outright.
+    ``on_served`` is called with the function, the seconds a task waited
+    for its slot and the seconds it held it. With a ``router`` (a
+    ``ModelRouter``) each task tries the router's candidate models in turn,
+    moving on when a model is throttled or unavailable; the model is
+    passed to ``build_request``, ``on_success`` and ``on_error`` as
+    ``model``. With a ``hedge`` policy (a ``HedgePolicy``, which needs the
+    scheduler), a call that is slow to answer is duplicated on another key
+    and the loser of the two is cancelled. Tasks waiting for one of the
+    ``max_concurrency`` slots are served like the threaded engine's
+    ``FairQueue``: by priority class, then by per-user deficit round-robin
+    of their cost, with ``quantum`` credit per turn.
+    """
+    def __init__(self, api_keys, build_request, on_success, on_error,
+                 scheduler=None, max_concurrency=200, keepalive=100, on_delta=None,
+                 lookup=None, estimate=None, metrics=None, should_stop=None,
+                 timeout=openai.DEFAULT_TIMEOUT, on_served=None, router=None, hedge=None, quantum=500):
+        self.api_keys = [key.strip() for key in api_keys if key.strip()]
+        self.build_request = build_request
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_delta = on_delta
+        self.lookup = lookup
+        self.estimate = estimate
+        self.metrics = metrics
+        self.should_stop = should_stop
+        self.on_served = on_served
+        self.router = router
+        self.hedge = hedge
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.max_concurrency = max_concurrency
+        self.keepalive = keepalive
+
+        self.loop = None
+        self.thread = None
+        self.clients = []
+        self.free_slots = max_concurrency
+        self.waiting = FairQueue(quantum)  # (session_id, future) of tasks waiting for a slot; only the loop takes them
+        self.key_index = 0  # Round-robin position when no scheduler is given
+        self.ready = threading.Event()
+
+        self.submit_lock = threading.Lock()
+        self.futures = {}  # session_id -> future of the task, until it finishes
+        self.submitted = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _make_client(self, api_key):
+        # One pooled keep-alive transport per key, shared by all requests
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=Limits(max_connections=self.max_concurrency,
+                          max_keepalive_connections=self.keepalive)
+        )
+        # Retries are left to the scheduler's backoff and the router's failover
+        return openai.AsyncOpenAI(api_key=api_key, http_client=http_client, timeout=self.timeout, max_retries=0)
+
+    def start(self):
+        """Start the event loop thread and create the async clients"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run_loop, name='async-engine', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        logger.info(f"Async engine started with {len(self.clients)} clients, "
+                    f"max concurrency {self.max_concurrency}")
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.clients = [self._make_client(key) for key in self.api_keys]
+        self.ready.set()
+        self.loop.run_forever()
+
+    def submit(self, task, user='anonymous', priority=0, cost=1):
+        """Schedule a ``(session_id, function_id, user_input, context, callback)`` task"""
+        session_id = task[0]
+        with self.submit_lock:
+            self.submitted += 1
+            future = asyncio.run_coroutine_threadsafe(self._process(task, user, priority, cost), self.loop)
+            self.futures[session_id] = future
+        future.add_done_callback(lambda _: self.futures.pop(session_id, None))
+        return future
+
+    def cancel(self, match):
+        """Abort queued and in-flight tasks whose session id satisfies ``match``; return how many"""
+        futures = [future for session_id, future in list(self.futures.items()) if match(session_id)]
+        for future in futures:
+            future.cancel()
+        return len(futures)
+
+    def _check(self, session_id):
+        reason = self.should_stop(session_id) if self.should_stop is not None else None
+        if reason is not None:
+            raise TaskCancelled(reason)
+
+    async def _acquire_key(self, function_id, estimated_tokens):
+        if self.scheduler is None:
+            # Round-robin is safe without a lock: only the loop thread calls this
+            index = self.key_index % len(self.clients)
+            self.key_index = (self.key_index + 1) % len(self.clients)
+            return index
+        index, required_delay = self.scheduler.acquire(estimated_tokens)
+        if self.metrics is not None:
+            self.metrics.rate_limit_wait.observe(required_delay, function_id)
+        if required_delay > 0:
+            # Wait for the key's budget without holding a thread
+            try:
+                await asyncio.sleep(required_delay)
+            except asyncio.CancelledError:
+                self.scheduler.release(index, estimated_tokens)
+                raise
+        return index
+
+    async def _take_slot(self, session_id, user, priority, cost):
+        """Wait for a concurrency slot in fair-share order"""
+        if self.free_slots > 0 and self.waiting.empty():
+            self.free_slots -= 1
+            return
+        waiter = self.loop.create_future()
+        self.waiting.put((session_id, waiter), user, priority, cost)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if not self.waiting.remove(lambda entry: entry[1] is waiter):
+                self._free_slot()  # The slot was handed over just as the task was cancelled
+            raise
+
+    def _free_slot(self):
+        """Hand a finished task's slot to the next waiting task"""
+        while not self.waiting.empty():
+            _, waiter = self.waiting.get(block=False)
+            self.waiting.task_done()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.free_slots += 1
+
+    async def _process(self, task, user, priority, cost):
+        session_id, function_id, user_input, context, callback = task
+        try:
+            result = None
+            if self.lookup is not None:
+                result = await asyncio.to_thread(self.lookup, session_id, function_id, user_input, context)
+            if result is None:
+                queued_at = time.time()
+                await self._take_slot(session_id, user, priority, cost)
+                self.in_flight += 1
+                started_at = time.time()
+                try:
+                    if self.metrics is not None:
+                        self.metrics.queue_wait.observe(started_at - queued_at, function_id)
+                    self._check(session_id)
+                    result = await self._call(session_id, function_id, user_input, context)
+                finally:
+                    self.in_flight -= 1
+                    self._free_slot()
+                    if self.on_served is not None:
+                        self.on_served(function_id, started_at - queued_at, time.time() - started_at)
+        except TaskCancelled as e:
+            result = self.on_error(session_id, e)
+        except asyncio.CancelledError:
+            # Aborted through ``cancel`` while waiting or in flight
+            reason = self.should_stop(session_id) if self.should_stop is not None else None
+            result = self.on_error(session_id, TaskCancelled(reason or 'cancelled'))
+
+        if result['status'] == 'success':
+            self.completed += 1
+        else:
+            self.failed += 1
+        # Shielded: a task aborted now must still deliver its result
+        await asyncio.shield(asyncio.to_thread(self._deliver, callback, result))
+        return result
+
+    async def _call(self, session_id, function_id, user_input, context):
+        # Without a router the request builder picks the model
+        models = self.router.candidates(function_id, user_input) if self.router is not None else [None]
+        for attempt, model in enumerate(models):
+            routed = {} if model is None else {'model': model}
+            request_kwargs = self.build_request(function_id, user_input, context, **routed)
+            if self.estimate is not None:
+                estimated_tokens = self.estimate(function_id, user_input, context)
+            else:
+                estimated_tokens = estimate_request_tokens(request_kwargs)
+            index = await self._acquire_key(function_id, estimated_tokens)
+
+            start_time = time.time()
+            try:
+                # The rate limit wait may have outlasted the task's deadline or its client
+                self._check(session_id)
+                ai_response, usage, headers, index = await self._hedged(session_id, function_id, request_kwargs,
+                                                                        index, estimated_tokens)
+            except (TaskCancelled, asyncio.CancelledError):
+                if self.scheduler is not None:
+                    self.scheduler.release(index, estimated_tokens)
+                raise
+            except Exception as e:
+                elapsed = time.time() - start_time
+                if self.metrics is not None:
+                    self.metrics.upstream_call(function_id, elapsed, error=e)
+                if model is not None and self.router.fail_over(models, attempt, elapsed, e, session_id,
+                                                               self.metrics) is not None:
+                    # The model is throttled or unavailable, not the key
+                    if self.scheduler is not None:
+                        self.scheduler.release(index, estimated_tokens)
+                    continue
+                if self.scheduler is not None:
+                    self.scheduler.record_failure(index, estimated_tokens, e)
+                return self.on_error(session_id, e, **routed)
+
+            if self.metrics is not None:
+                self.metrics.upstream_call(function_id, time.time() - start_time, usage=usage)
+            if model is not None:
+                self.router.record_success(model, time.time() - start_time)
+            if self.scheduler is not None:
+                used_tokens = usage.total_tokens if usage else None
+                self.scheduler.record_success(index, estimated_tokens, used_tokens, headers)
+            return await asyncio.to_thread(self.on_success, session_id, function_id, user_input, ai_response,
+                                           start_time, context=context, **routed)
+
+    async def _hedged(self, session_id, function_id, request_kwargs, index, estimated_tokens):
+        """``_complete`` on key ``index``, duplicated on another key if slow; return the response and the key that answered.
+
+        Reservations of calls that did not answer are settled here; if no
+        call answers, the error is raised for the caller to settle ``index``.
+        """
+        if self.hedge is None or self.scheduler is None or len(self.clients) < 2:
+            return (*await self._complete(self.clients[index], session_id, request_kwargs), index)
+        hedged = HedgedCall(self.hedge, self.scheduler, function_id, index, estimated_tokens,
+                            estimated_tokens - request_kwargs['max_tokens'], self.metrics)
+
+        async def attempt(key, attempt_id):
+            return hedged.claim(attempt_id, await self._complete(self.clients[key], session_id, request_kwargs,
+                                                                 hedged.gate(attempt_id, self.on_delta)))
+
+        primary = asyncio.ensure_future(attempt(index, 0))
+        calls = {primary: index}
+
+        def settle(call, key):
+            call.cancel()
+            call.add_done_callback(
+                lambda call: hedged.settle(key, HedgeLost() if call.cancelled() else call.exception()))
+
+        try:
+            delay = hedged.delay()
+            if delay is not None:
+                await asyncio.wait([primary], timeout=delay)
+                if not primary.done() and hedged.race.winner is None:
+                    hedge_index = hedged.start_hedge()
+                    if hedge_index is not None:
+                        calls[asyncio.ensure_future(attempt(hedge_index, 1))] = hedge_index
+
+            # Take the first call that answers; if one fails the other may still answer
+            winner, pending = None, set(calls)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((call for call in done if call.exception() is None), None)
+        except asyncio.CancelledError:
+            # The task was aborted; the primary's key is left to the caller
+            primary.cancel()
+            for call, key in calls.items():
+                if call is not primary:
+                    settle(call, key)
+            raise
+        hedged.finish(winner is not None, by_hedge=winner is not None and winner is not primary)
+
+        for call, key in calls.items():
+            if hedged.needs_settling(call is winner, call is primary, winner is not None):
+                settle(call, key)
+        if winner is None:
+            raise hedged.failure(primary.exception(), [call.exception() for call in calls if call is not primary])
+        return (*winner.result(), calls[winner])
+
+    def _deliver(self, callback, result):
+        try:
+            callback(result)
+        except Exception:
+            logger.exception(f"Result callback failed for {result['session_id']}")
+
+    async def _complete(self, client, session_id, request_kwargs, publish=None):
+        publish = publish or self.on_delta
+        if self.on_delta is None:
+            raw = await client.chat.completions.with_raw_response.create(**request_kwargs)
+            response = raw.parse()
+            return response.choices[0].message.content, response.usage, raw.headers
+
+        raw = await client.chat.completions.with_raw_response.create(
+            stream=True, stream_options={'include_usage': True}, **request_kwargs)
+        parts = []
+        usage = None
+        stream = raw.parse()
+        try:
+            async for chunk in stream:
+                self._check(session_id)
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    publish(session_id, chunk.choices[0].delta.content)
+        finally:
+            # Drops the connection of an aborted stream
+            await stream.close()
+        return ''.join(parts), usage, raw.headers
+
+    def pending(self):
+        """Tasks submitted but not finished yet"""
+        return self.submitted - self.completed - self.failed
+
+    def queue_depth(self):
+        """Tasks waiting for a free concurrency slot"""
+        return self.waiting.qsize()
+
+    def position(self, match):
+        """1-based place among the tasks waiting for a slot of the first whose session id satisfies ``match``"""
+        return self.waiting.position(lambda entry: match(entry[0]))
+
+    def get_stats(self):
+        """Snapshot of in-flight and completed request counts"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'waiting': self.queue_depth(),
+            'completed': self.completed,
+            'failed': self.failed
+        }
+
+    def shutdown(self, timeout=5.0):
+        """Close the pooled connections and stop the event loop"""
+        if self.loop is None or not self.loop.is_running():
+            return
+
+        async def close_clients():
+            for client in self.clients:
+                await client.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_clients(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Failed to close async clients: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        logger.info("Async engine shut down")
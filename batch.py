@@ -0,0 +1,168 @@
+"""Run JSONL batches of (function, input) items through the completion pipeline.
+
+Each input line is ``{"id": ..., "function": "summarize", "input": "..."}``
+(``id`` defaults to the line number). Results are written as JSONL in
+completion order. The output file doubles as the checkpoint: rerunning with
+the same ``--output`` skips items that already completed, unless their
+function or input changed since.
+
+    python batch.py documents.jsonl --output summaries.jsonl --concurrency 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import uuid
+
+
+def parse_items(lines):
+    """Yield one item dict per non-blank JSONL line, or an ``error`` item for lines that do not parse"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError('not an object')
+        except ValueError as e:
+            yield {'id': number, 'error': f"Line {number} is not a JSON object: {str(e)}"}
+            continue
+        item.setdefault('id', number)
+        yield item
+
+
+def item_key(item):
+    """Checkpoint key of an item: its id and a hash of its function and trimmed input"""
+    text = item.get('input')
+    content = json.dumps([item.get('function'), text.strip() if isinstance(text, str) else text], ensure_ascii=False)
+    return f"{item['id']}-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]}"
+
+
+def record(item, result):
+    """Output line for a finished item"""
+    line = {'id': item['id'], 'function': item.get('function'), 'key': item_key(item)}
+    if result['status'] == 'success':
+        line.update(status='completed', output=result['ai_response'], model_used=result.get('model_used'),
+                    processing_time=result.get('processing_time'), cached=result.get('cached', False))
+        if 'chunks' in result:
+            line['chunks'] = result['chunks']
+    else:
+        line.update(status='error', error=result.get('error', 'An unknown error occurred'))
+    return line
+
+
+class BatchRunner:
+    """Feed items to ``submit`` with at most ``concurrency`` in flight and yield results as they finish.
+
+    ``submit(item, callback)`` must arrange for ``callback(result)`` to be
+    called, from any thread; only its first call counts. An item whose
+    ``submit`` raises is answered with the error. Items that fail validation
+    (``validate`` returns an error message) are answered without being
+    submitted.
+    """
+    def __init__(self, submit, concurrency=8, validate=None):
+        self.submit = submit
+        self.concurrency = max(1, concurrency)
+        self.validate = validate
+
+    def run(self, items):
+        finished = queue.Queue()
+        items = iter(items)
+        in_flight = 0
+        exhausted = False
+        while True:
+            while not exhausted and in_flight < self.concurrency:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                error = item.get('error') or (self.validate(item) if self.validate else None)
+                callback = self._answer(item, finished)
+                if error:
+                    callback({'status': 'error', 'error': error})
+                else:
+                    try:
+                        self.submit(item, callback)
+                    except Exception as e:
+                        callback({'status': 'error', 'error': f"The item could not be submitted: {str(e)}"})
+                in_flight += 1
+            if in_flight == 0:
+                return
+            yield finished.get()
+            in_flight -= 1
+
+    @staticmethod
+    def _answer(item, finished):
+        """Callback that records the first result of an item"""
+        lock = threading.Lock()
+        answered = []
+
+        def callback(result):
+            with lock:
+                if answered:
+                    return
+                answered.append(True)
+            finished.put(record(item, result))
+        return callback
+
+
+def completed_keys(path):
+    """Checkpoint keys of the items an earlier run already completed, read from its output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the last run was killed
+            if result.get('status') == 'completed' and 'key' in result:
+                done.add(result['key'])
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="JSONL file of items, or '-' for stdin")
+    parser.add_argument('--output', help='JSONL results file, appended to and used as checkpoint; default stdout')
+    parser.add_argument('--concurrency', type=int, default=8, help='Items in flight at once')
+    parser.add_argument('--batch-id', help='Name of the run in the fair-share queue (default: random)')
+    args = parser.parse_args()
+
+    # Importing the app starts its completion engine in this process
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    done = completed_keys(args.output) if args.output else set()
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    counts = {'completed': 0, 'error': 0, 'skipped': 0}
+
+    def pending(items):
+        for item in items:
+            if item_key(item) in done:
+                counts['skipped'] += 1
+                continue
+            yield item
+
+    try:
+        batch_id = args.batch_id or uuid.uuid4().hex
+        for line in app.run_batch(batch_id, pending(parse_items(source)), args.concurrency):
+            output.write(json.dumps(line, ensure_ascii=False) + '\n')
+            output.flush()
+            counts[line['status']] += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
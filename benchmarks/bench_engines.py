@@ -0,0 +1,135 @@
+"""Compare the threaded worker pool with the asyncio completion engine.
+
+Both engines run the same number of completions against the local fake
+OpenAI server; results are printed as JSON.
+
+    python benchmarks/bench_engines.py --requests 500 --latency 0.2 --concurrency 200
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai
+from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from worker_pool import WorkerPool
+from async_engine import AsyncCompletionEngine
+
+
+def build_request(function_id, user_input, context=()):
+    return {
+        'model': 'gpt-3.5-turbo',
+        'messages': [{'role': 'system', 'content': function_id},
+                     {'role': 'user', 'content': user_input}],
+        'max_tokens': 50
+    }
+
+
+def on_success(session_id, function_id, user_input, ai_response, start_time, context=()):
+    return {'status': 'success', 'session_id': session_id,
+            'processing_time': time.time() - start_time}
+
+
+def on_error(session_id, error):
+    return {'status': 'error', 'session_id': session_id, 'error': str(error)}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(name, results, elapsed, total):
+    latencies = [r['processing_time'] for r in results if r['status'] == 'success']
+    return {
+        'engine': name,
+        'requests': total,
+        'succeeded': len(latencies),
+        'failed': total - len(latencies),
+        'wall_seconds': round(elapsed, 3),
+        'requests_per_second': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1)
+    }
+
+
+def run_threaded(api_keys, total, concurrency):
+    results = []
+    done = threading.Event()
+    lock = threading.Lock()
+    task_queue = queue.Queue()
+
+    def callback(result):
+        with lock:
+            results.append(result)
+            if len(results) == total:
+                done.set()
+
+    clients = [openai.OpenAI(api_key=key) for key in api_keys]
+
+    def handler(task):
+        session_id, function_id, user_input, context, cb = task
+        start_time = time.time()
+        try:
+            client = clients[hash(session_id) % len(clients)]
+            response = client.chat.completions.create(**build_request(function_id, user_input, context))
+            ai_response = response.choices[0].message.content
+            result = on_success(session_id, function_id, user_input, ai_response, start_time)
+        except Exception as e:
+            result = on_error(session_id, e)
+        cb(result)
+
+    pool = WorkerPool(task_queue, handler, concurrency, name='bench-worker')
+    pool.start()
+    start = time.time()
+    for i in range(total):
+        task_queue.put((f"t{i}", 'summarize', 'benchmark input', (), callback))
+    done.wait()
+    elapsed = time.time() - start
+    pool.shutdown()
+    return summarize('threaded', results, elapsed, total)
+
+
+def run_async(api_keys, total, concurrency):
+    engine = AsyncCompletionEngine(api_keys, build_request, on_success, on_error,
+                                   max_concurrency=concurrency)
+    engine.start()
+    start = time.time()
+    futures = [engine.submit((f"a{i}", 'summarize', 'benchmark input', (), lambda r: None))
+               for i in range(total)]
+    results = [f.result() for f in futures]
+    elapsed = time.time() - start
+    engine.shutdown()
+    return summarize('async', results, elapsed, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--threads', type=int, default=10, help='Worker pool size for the threaded engine')
+    parser.add_argument('--concurrency', type=int, default=200, help='Max in-flight for the async engine')
+    parser.add_argument('--keys', type=int, default=2, help='Number of fake API keys')
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=args.latency))
+    os.environ['OPENAI_BASE_URL'] = server.start()
+    api_keys = [f"fake-key-{i}" for i in range(args.keys)]
+
+    report = [
+        run_threaded(api_keys, args.requests, args.threads),
+        run_async(api_keys, args.requests, args.concurrency)
+    ]
+    server.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure feedback writer throughput in records/sec.
+
+Compares a naive open/append/close per record with the batched
+FeedbackWriter (with and without group fsync), optionally from several
+processes sharing one file, and checks that no record was lost.
+
+    python benchmarks/bench_feedback.py --records 20000 --processes 4
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feedback_manager
+from feedback_manager import FeedbackWriter
+
+
+def make_record(i):
+    return json.dumps({
+        'request_id': f"bench-{os.getpid()}-{i}",
+        'rating': 'good',
+        'comments': 'Benchmark feedback record',
+        'timestamp': '2026-01-01T00:00:00'
+    })
+
+
+def naive_writer(directory, records):
+    filename = os.path.join(directory, 'feedback_naive.jsonl')
+    for i in range(records):
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(make_record(i) + '\n')
+
+
+def batched_writer(directory, records, fsync):
+    writer = FeedbackWriter(directory=directory, fsync=fsync)
+    writer.start()
+    for i in range(records):
+        writer.append(make_record(i))
+    writer.close()
+
+
+def count_lines(directory):
+    total = 0
+    for path in glob.glob(os.path.join(directory, 'feedback_*.jsonl')):
+        with open(path, 'rb') as f:
+            total += sum(1 for _ in f)
+    return total
+
+
+def run(name, target, records, processes, **kwargs):
+    directory = tempfile.mkdtemp(prefix='feedback-bench-')
+    per_process = records // processes
+    start = time.time()
+    if processes == 1:
+        target(directory, per_process, **kwargs)
+    else:
+        workers = [multiprocessing.Process(target=target, args=(directory, per_process), kwargs=kwargs)
+                   for _ in range(processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+    elapsed = time.time() - start
+    written = count_lines(directory)
+    return {
+        'writer': name,
+        'processes': processes,
+        'records': per_process * processes,
+        'records_on_disk': written,
+        'seconds': round(elapsed, 3),
+        'records_per_second': round(written / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    feedback_manager.logger.setLevel('WARNING')
+    report = [
+        run('naive_append', naive_writer, args.records, args.processes),
+        run('batched', batched_writer, args.records, args.processes, fsync=False),
+        run('batched_fsync', batched_writer, args.records, args.processes, fsync=True)
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
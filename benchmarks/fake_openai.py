@@ -0,0 +1,242 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves ``POST /v1/chat/completions`` (plain and ``stream=True``) with
+configurable latency, error rate and 429 injection so the completion
+engines can be exercised without network access or API spend.
+
+    python benchmarks/fake_openai.py --port 8999 --latency 0.2 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8999/v1 OPENAI_API_KEY=fake python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+RATE_LIMIT_HEADERS = {
+    'x-ratelimit-limit-requests': '10000',
+    'x-ratelimit-remaining-requests': '9999',
+    'x-ratelimit-limit-tokens': '2000000',
+    'x-ratelimit-remaining-tokens': '1999000'
+}
+
+
+class FakeOpenAIConfig:
+    """Behaviour knobs shared by all handler threads"""
+    def __init__(self, latency=0.2, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 tokens_per_second=0.0, reply="This is a fake completion.", throttled_models=(), missing_models=(),
+                 tail_rate=0.0, tail_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.tokens_per_second = tokens_per_second
+        self.tail_rate = tail_rate  # Fraction of replies delayed by tail_latency, a heavy latency tail
+        self.tail_latency = tail_latency
+        self.reply = reply
+        self.throttled_models = set(throttled_models)  # Always answered with 429, to exercise model failover
+        self.missing_models = set(missing_models)  # Always answered with 404
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def count(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # The client dropped a kept-alive connection, e.g. after an error response
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        config = self.config
+        config.count('requests')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+
+        model = payload.get('model', 'gpt-3.5-turbo')
+        if model in config.missing_models:
+            config.count('errors')
+            self._send_json(404, {'error': {'message': f"The model `{model}` does not exist",
+                                            'type': 'invalid_request_error', 'code': 'model_not_found'}})
+            return
+        if model in config.throttled_models:
+            config.count('rate_limited')
+            self._send_json(429, {'error': {'message': f"Rate limit reached for {model}", 'type': 'rate_limit_error',
+                                            'code': 'rate_limit_exceeded'}}, headers={'Retry-After': '1'})
+            return
+
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            config.count('rate_limited')
+            self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error',
+                                            'code': 'rate_limit_exceeded'}},
+                            headers={'Retry-After': '1', 'x-ratelimit-remaining-requests': '0'})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            config.count('errors')
+            self._send_json(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+            return
+
+        delay = config.latency + random.uniform(-config.jitter, config.jitter)
+        if random.random() < config.tail_rate:
+            delay += config.tail_latency
+        time.sleep(max(0.0, delay))
+
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in payload.get('messages', []))
+        words = config.reply.split()
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(words),
+            'total_tokens': prompt_tokens + len(words)
+        }
+        if payload.get('stream'):
+            include_usage = (payload.get('stream_options') or {}).get('include_usage', False)
+            self._stream(model, words, usage if include_usage else None)
+        else:
+            self._send_json(200, {
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': config.reply},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            }, headers=RATE_LIMIT_HEADERS)
+
+    def _stream(self, model, words, usage=None):
+        try:
+            self._write_stream(model, words, usage)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client aborted the completion
+            self.close_connection = True
+
+    def _write_stream(self, model, words, usage=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        for name, value in RATE_LIMIT_HEADERS.items():
+            self.send_header(name, value)
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+        for i, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'role': 'assistant', 'content': word if i == 0 else ' ' + word},
+                    'finish_reason': None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        final = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                 'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+        if usage is not None:
+            usage_chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                           'model': model, 'choices': [], 'usage': usage}
+            self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, config=None):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve in a background thread and return the base URL"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds before each reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of 500 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of 429 responses')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='Streaming speed (0 = instant)')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of replies delayed by --tail-latency')
+    parser.add_argument('--tail-latency', type=float, default=0.0, help='Extra seconds for tail replies')
+    parser.add_argument('--throttled-models', default='', help='Comma-separated models that always get 429')
+    parser.add_argument('--missing-models', default='', help='Comma-separated models that always get 404')
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, tokens_per_second=args.tokens_per_second,
+                              tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                              throttled_models=[m for m in args.throttled_models.split(',') if m],
+                              missing_models=[m for m in args.missing_models.split(',') if m])
+    server = FakeOpenAIServer(args.host, args.port, config)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Load-test the Flask app end to end against the local fake OpenAI server.
+
+Simulated users (one cookie session each) submit tasks to /process and
+poll /get_result until they finish. The report is printed as JSON:
+completed requests/sec, p50/p95/p99 latency, queue wait (from /metrics)
+and the rejection and error rates. With HEDGE_REQUESTS=true on the app it
+also compares call latency of hedged calls against the never-hedged
+holdout, next to the tokens the duplicates cost.
+
+    python benchmarks/load_test.py --users 20 --requests-per-user 10 --latency 0.2 --rate-limit-rate 0.05
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --users 50   # app started separately
+    HEDGE_REQUESTS=true HEDGE_BUDGET=0.1 python benchmarks/load_test.py --tail-rate 0.03 --tail-latency 2
+
+Without ``--url`` the app is imported and served in this process, with
+its settings taken from the environment (e.g. COMPLETION_ENGINE=async).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from bench_engines import percentile
+
+FILLER = "The quick brown fox jumps over the lazy dog while the benchmark measures the queue."
+
+
+class UserStats:
+    """Outcomes of all simulated users, filled in concurrently"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.submit_latencies = []
+        self.counts = {'requests': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+
+    def record(self, outcome, latency=None, submit_latency=None):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts[outcome] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+            if submit_latency is not None:
+                self.submit_latencies.append(submit_latency)
+
+
+def simulate_user(base_url, user, args, stats):
+    http = requests.Session()
+    for i in range(args.requests_per_user):
+        function_id = args.functions[(user + i) % len(args.functions)]
+        # Unique inputs keep the response cache and coalescing out of the measurement
+        user_input = f"Load test request {user}-{i}-{time.time()}. " + ' '.join([FILLER] * args.input_sentences)
+        started = time.time()
+        try:
+            response = http.post(f"{base_url}/process", data={'function': function_id, 'user_input': user_input},
+                                 timeout=args.timeout)
+        except requests.RequestException:
+            stats.record('failed')
+            continue
+        submitted = time.time()
+        if response.status_code == 429:
+            stats.record('rejected', submit_latency=submitted - started)
+        elif response.status_code != 200:
+            stats.record('failed', submit_latency=submitted - started)
+        else:
+            outcome = poll_result(http, base_url, response.json()['session_id'], args)
+            stats.record(outcome, time.time() - started if outcome == 'completed' else None, submitted - started)
+        if args.think_time:
+            time.sleep(args.think_time)
+
+
+def poll_result(http, base_url, session_id, args):
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        try:
+            status = http.get(f"{base_url}/get_result/{session_id}", timeout=args.timeout).json()['status']
+        except (requests.RequestException, ValueError):
+            return 'failed'
+        if status == 'completed':
+            return 'completed'
+        if status == 'error':
+            return 'failed'
+        time.sleep(args.poll_interval)
+    return 'timed_out'
+
+
+def scrape_metrics(base_url):
+    try:
+        return requests.get(f"{base_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return None
+
+
+def scrape_histogram(base_url, name, label=''):
+    """Bucket counts (summed over labels), sum and count of a histogram from /metrics, or None.
+
+    ``label`` (e.g. ``'group="holdout"'``) keeps only the series containing it.
+    """
+    text = scrape_metrics(base_url)
+    if text is None:
+        return None
+    buckets, total, count = {}, 0.0, 0
+    for line in text.splitlines():
+        if label not in line:
+            continue
+        if line.startswith(name + '_bucket{'):
+            bound = line.split('le="')[1].split('"')[0]
+            buckets[float(bound)] = buckets.get(float(bound), 0) + float(line.rsplit(' ', 1)[1])
+        elif line.startswith(name + '_sum'):
+            total += float(line.rsplit(' ', 1)[1])
+        elif line.startswith(name + '_count'):
+            count += int(float(line.rsplit(' ', 1)[1]))
+    return {'buckets': buckets, 'sum': total, 'count': count}
+
+
+def histogram_quantile(buckets, count, q):
+    """Quantile estimate by linear interpolation inside the bucket, like PromQL's histogram_quantile"""
+    rank = q * count
+    lower, below = 0.0, 0
+    for bound in sorted(buckets):
+        if buckets[bound] >= rank:
+            if bound == float('inf'):
+                return lower
+            in_bucket = buckets[bound] - below
+            return lower + (bound - lower) * ((rank - below) / in_bucket if in_bucket else 0)
+        lower, below = bound, buckets[bound]
+    return lower
+
+
+def histogram_report(before, after):
+    if before is None or after is None:
+        return None
+    count = after['count'] - before['count']
+    if count <= 0:
+        return None
+    buckets = {b: c - before['buckets'].get(b, 0) for b, c in after['buckets'].items()}
+    return {
+        'samples': count,
+        'mean_ms': round((after['sum'] - before['sum']) / count * 1000, 1),
+        'p50_ms': round(histogram_quantile(buckets, count, 0.50) * 1000, 1),
+        'p95_ms': round(histogram_quantile(buckets, count, 0.95) * 1000, 1),
+        'p99_ms': round(histogram_quantile(buckets, count, 0.99) * 1000, 1)
+    }
+
+
+def scrape_counter(base_url, name):
+    """Total of a counter over all labels from /metrics"""
+    text = scrape_metrics(base_url) or ''
+    return sum(float(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+               if line.startswith(name + '{') or line.startswith(name + ' '))
+
+
+def hedging_report(base_url, before):
+    """p99 of hedged against holdout calls and the tokens duplicates cost, from /metrics deltas; None without hedging"""
+    after = {group: scrape_histogram(base_url, 'inquiro_hedged_call_seconds', f'group="{group}"')
+             for group in ('hedging', 'holdout')}
+    groups = {group: histogram_report(before[group], after[group]) for group in after}
+    if groups['hedging'] is None:
+        return None
+    extra_tokens = scrape_counter(base_url, 'inquiro_hedge_extra_tokens_total') - before['extra_tokens']
+    tokens = scrape_counter(base_url, 'inquiro_tokens_total') - before['tokens']
+    return {
+        'hedged_calls': groups['hedging'],
+        'holdout_calls': groups['holdout'],
+        'p99_saved_ms': round(groups['holdout']['p99_ms'] - groups['hedging']['p99_ms'], 1) if groups['holdout'] else None,
+        'extra_tokens': int(extra_tokens),
+        'extra_token_fraction': round(extra_tokens / tokens, 4) if tokens else 0.0
+    }
+
+
+def hedging_baseline(base_url):
+    baseline = {group: scrape_histogram(base_url, 'inquiro_hedged_call_seconds', f'group="{group}"')
+                for group in ('hedging', 'holdout')}
+    baseline['extra_tokens'] = scrape_counter(base_url, 'inquiro_hedge_extra_tokens_total')
+    baseline['tokens'] = scrape_counter(base_url, 'inquiro_tokens_total')
+    return baseline
+
+
+def latency_report(values):
+    return {
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values, default=0.0) * 1000, 1)
+    }
+
+
+def start_app(args):
+    """Import the app against a fresh fake upstream and serve it on a free port"""
+    fake = FakeOpenAIServer(config=FakeOpenAIConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, tokens_per_second=args.tokens_per_second,
+        tail_rate=args.tail_rate, tail_latency=args.tail_latency))
+    os.environ['OPENAI_BASE_URL'] = fake.start()
+    os.environ.setdefault('OPENAI_API_KEYS', ','.join(f"fake-key-{i}" for i in range(args.keys)))
+    os.environ.setdefault('CONVERSATION_DB', os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'conversations.db'))
+    import logging
+    logging.disable(logging.INFO)
+    from werkzeug.serving import make_server
+    import app
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return fake, server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Base URL of a running app; default serves the app in this process')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent simulated users')
+    parser.add_argument('--requests-per-user', type=int, default=10)
+    parser.add_argument('--functions', default='summarize', help='Comma-separated functions to cycle through')
+    parser.add_argument('--input-sentences', type=int, default=5, help='Filler sentences per input')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Seconds a user waits between requests')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='Seconds between /get_result polls')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds before a request counts as timed out')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake upstream seconds before each reply')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Fake upstream +/- latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake 500 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of fake 429 responses')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='Fake streaming speed (0 = instant)')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of fake replies delayed by --tail-latency')
+    parser.add_argument('--tail-latency', type=float, default=0.0, help='Extra seconds for tail replies')
+    parser.add_argument('--keys', type=int, default=2, help='Number of fake API keys')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+    args.functions = [f.strip() for f in args.functions.split(',') if f.strip()]
+
+    fake = server = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        fake, server, base_url = start_app(args)
+
+    stats = UserStats()
+    queue_wait_before = scrape_histogram(base_url, 'inquiro_queue_wait_seconds')
+    hedging_before = hedging_baseline(base_url)
+    start = time.time()
+    users = [threading.Thread(target=simulate_user, args=(base_url, user, args, stats), daemon=True)
+             for user in range(args.users)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    elapsed = time.time() - start
+    queue_wait_after = scrape_histogram(base_url, 'inquiro_queue_wait_seconds')
+
+    counts = stats.counts
+    report = {
+        'target': args.url or 'in-process',
+        'engine': os.getenv('COMPLETION_ENGINE', 'threaded') if args.url is None else None,
+        'users': args.users,
+        **counts,
+        'wall_seconds': round(elapsed, 3),
+        'requests_per_second': round(counts['completed'] / elapsed, 1) if elapsed else 0.0,
+        'rejection_rate': round(counts['rejected'] / counts['requests'], 4) if counts['requests'] else 0.0,
+        'error_rate': round((counts['failed'] + counts['timed_out']) / counts['requests'], 4) if counts['requests'] else 0.0,
+        'latency': latency_report(stats.latencies),
+        'submit_latency': latency_report(stats.submit_latencies),
+        'queue_wait': histogram_report(queue_wait_before, queue_wait_after),
+        'hedging': hedging_report(base_url, hedging_before)
+    }
+    if fake is not None:
+        report['upstream'] = {'requests': fake.config.requests, 'rate_limited': fake.config.rate_limited,
+                              'errors': fake.config.errors}
+        server.shutdown()
+        fake.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import threading
+import time
+
+# Messages shown to the client for each way a task can be stopped
+STOP_REASONS = {
+    'cancelled': "The request was cancelled.",
+    'deadline': "The request did not finish in time. Please try again.",
+    'abandoned': "The request was dropped because nobody was waiting for the answer."
+}
+
+
+class TaskCancelled(Exception):
+    """Raised to stop a task that was cancelled, ran past its deadline or lost its client"""
+    def __init__(self, reason):
+        super().__init__(STOP_REASONS[reason])
+        self.reason = reason
+
+
+class TrackedTask:
+    """Deadline, cancellation flag and last client contact of one task"""
+    def __init__(self, deadline, watch_client):
+        self.deadline = deadline
+        self.watch_client = watch_client
+        self.last_seen = time.time()
+        self.cancelled = False
+        self.finished_at = None
+
+
+class TaskTracker:
+    """Decide whether a client-facing task is still worth running.
+
+    A task stops being worth it when it is cancelled, when its deadline
+    passes, or (for tasks with ``watch_client``) when its client has not
+    polled or held a stream open for ``grace`` seconds. Workers ask
+    ``stop_reason`` before and during each call; untracked session ids
+    (e.g. background compactions) always run.
+    """
+    def __init__(self, grace=30, retention=600, prune_interval=60):
+        self.grace = grace
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.last_prune = time.time()
+
+    def register(self, session_id, deadline, watch_client=True):
+        """Start tracking a task; a task that is already tracked keeps its state"""
+        with self.lock:
+            self._maybe_prune()
+            if session_id not in self.tasks:
+                self.tasks[session_id] = TrackedTask(deadline, watch_client)
+
+    def seen(self, session_id):
+        """Record that the task's client is still polling or streaming"""
+        task = self.tasks.get(session_id)
+        if task is not None:
+            task.last_seen = time.time()
+
+    def cancel(self, session_id):
+        """Flag a task as cancelled; False if it is unknown or already answered"""
+        with self.lock:
+            task = self.tasks.get(session_id)
+            if task is None or task.finished_at is not None:
+                return False
+            task.cancelled = True
+            return True
+
+    def stop_reason(self, session_id, now=None):
+        """Why a task should not run any further, or None"""
+        task = self.tasks.get(session_id)
+        if task is None:
+            return None
+        if task.cancelled:
+            return 'cancelled'
+        now = now or time.time()
+        if now > task.deadline:
+            return 'deadline'
+        if task.watch_client and now - task.last_seen > self.grace:
+            return 'abandoned'
+        return None
+
+    def finish(self, session_id):
+        """Mark a task answered; False if it already was, so a late result is dropped.
+
+        A cancelled task is answered by the cancellation itself, and its
+        worker may still report afterwards, so its entry is kept until then.
+        """
+        with self.lock:
+            task = self.tasks.get(session_id)
+            if task is None:
+                return True
+            if task.finished_at is not None:
+                del self.tasks[session_id]
+                return False
+            if task.cancelled:
+                task.finished_at = time.time()
+            else:
+                del self.tasks[session_id]
+            return True
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self.last_prune < self.prune_interval:
+            return
+        self.last_prune = now
+        expired = [sid for sid, task in self.tasks.items()
+                   if (task.finished_at is not None and task.finished_at < now - self.retention)
+                   or task.deadline < now - self.retention]
+        for sid in expired:
+            del self.tasks[sid]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'tracked': len(self.tasks),
+                'cancelled': sum(1 for task in self.tasks.values() if task.cancelled),
+                'grace_seconds': self.grace
+            }
@@ -0,0 +1,59 @@
+import threading
+
+
+class RequestCoalescer:
+    """Single-flight deduplication of identical in-flight tasks.
+
+    The first task for a key becomes the leader and is queued as usual;
+    identical tasks arriving before it finishes attach as followers and
+    receive a copy of the leader's result under their own ``session_id``.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.leaders = {}    # key -> leader session_id
+        self.followers = {}  # leader session_id -> [follower session_id, ...]
+        self.keys = {}       # leader session_id -> key
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def join(self, key, session_id):
+        """Register a task; return True if it attached to an in-flight leader"""
+        with self.lock:
+            leader = self.leaders.get(key)
+            if leader is not None:
+                self.followers[leader].append(session_id)
+                self.coalesced += 1
+                return True
+            self.leaders[key] = session_id
+            self.followers[session_id] = []
+            self.keys[session_id] = key
+            self.upstream_calls += 1
+            return False
+
+    def followers_of(self, session_id):
+        with self.lock:
+            return list(self.followers.get(session_id, ()))
+
+    def complete(self, result):
+        """Release a leader and return its result copied for every follower"""
+        session_id = result['session_id']
+        with self.lock:
+            key = self.keys.pop(session_id, None)
+            if key is None:
+                return []
+            del self.leaders[key]
+            followers = self.followers.pop(session_id)
+        return [dict(result, session_id=follower) for follower in followers]
+
+    def get_stats(self):
+        with self.lock:
+            waiting = sum(len(f) for f in self.followers.values())
+            leaders = len(self.leaders)
+        total = self.upstream_calls + self.coalesced
+        return {
+            'in_flight': leaders,
+            'waiting_followers': waiting,
+            'upstream_calls': self.upstream_calls,
+            'coalesced': self.coalesced,
+            'coalesce_rate': round(self.coalesced / total, 3) if total else 0.0
+        }
@@ -0,0 +1,70 @@
+from tokenizer import DEFAULT_MODEL, count_tokens
+
+# Chat history roles and the API roles they are sent as
+ROLES = {'user': 'user', 'ai': 'assistant'}
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def history_turns(history, summary=None):
+    """``(message id, role, content)`` of the chat turns the rolling summary does not cover yet"""
+    turns = [(m['id'], ROLES[m['role']], m['content']) for m in history if m['role'] in ROLES]
+    if summary:
+        # ``covers`` is the id of the last message folded into the summary
+        turns = [turn for turn in turns if turn[0] > summary['covers']]
+    return turns
+
+
+def recent_start(turns, budget, model=DEFAULT_MODEL):
+    """Index of the oldest turn such that it and all newer turns fit in ``budget`` tokens"""
+    start = len(turns)
+    for turn in reversed(turns):
+        budget -= count_tokens(turn[2], model)
+        if budget < 0:
+            break
+        start -= 1
+    return start
+
+
+def build_context(history, summary, budget, model=DEFAULT_MODEL):
+    """Context messages for the next request and the turns that fell out of the budget.
+
+    The rolling summary (if any) is sent first, followed by the newest
+    uncovered turns that fit in what is left of ``budget``. Turns that do
+    not fit are returned as overflow, ready to be compacted into the next
+    summary. The context is a tuple of ``(role, content)`` pairs.
+    """
+    turns = history_turns(history, summary)
+    context = []
+    if summary:
+        context.append(('system', SUMMARY_PREFIX + summary['text']))
+        budget -= count_tokens(context[0][1], model)
+    start = recent_start(turns, max(budget, 0), model)
+    context.extend((role, content) for _, role, content in turns[start:])
+    return tuple(context), turns[:start]
+
+
+def compaction_turns(history, summary, budget, model=DEFAULT_MODEL):
+    """Uncovered turns to compact, leaving half of the context budget's room for turns verbatim.
+
+    Keeping less than the full budget means several more turns fit
+    before the next compaction is due.
+    """
+    turns = history_turns(history, summary)
+    if summary:
+        budget -= count_tokens(SUMMARY_PREFIX + summary['text'], model)
+    return turns[:recent_start(turns, max(budget, 0) // 2, model)]
+
+
+def compaction_input(summary, turns):
+    """User message asking to fold ``turns`` into the previous rolling summary"""
+    parts = []
+    if summary:
+        parts.append(f"Previous summary:\n{summary['text']}")
+    lines = [f"{'User' if role == 'user' else 'Assistant'}: {content}" for _, role, content in turns]
+    parts.append("New conversation turns:\n" + "\n\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def context_messages(context):
+    """Chat completion messages for a context tuple"""
+    return [{"role": role, "content": content} for role, content in context]
@@ -0,0 +1,209 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger('conversation_store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    function_id TEXT NOT NULL,
+    session_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    model_used TEXT,
+    processing_time REAL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (user_id, function_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT NOT NULL,
+    function_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    covers INTEGER NOT NULL,  -- id of the last message folded into text
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, function_id)
+);
+CREATE TABLE IF NOT EXISTS pending (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    function_id TEXT NOT NULL,
+    compacts INTEGER,  -- message id the summary will cover, for compaction tasks
+    queued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pending_by_chat ON pending (user_id, function_id);
+"""
+
+MESSAGE_FIELDS = ('id', 'session_id', 'role', 'content', 'model_used', 'processing_time', 'timestamp')
+
+
+class ConversationStore:
+    """Chat histories, rolling summaries and in-flight tasks in SQLite.
+
+    Messages are append-only rows indexed by ``(user_id, function_id, id)``
+    so every read is a bounded range scan, however long a conversation
+    gets. Users not seen for ``ttl`` seconds are deleted with all their
+    data by a garbage collection that runs at most every ``gc_interval``
+    seconds. Each thread keeps its own connection; WAL mode lets several
+    processes share the file.
+    """
+    def __init__(self, path='data/conversations.db', ttl=30 * 86400, pending_ttl=3600,
+                 gc_interval=3600, touch_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.gc_interval = gc_interval
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.touched = {}
+        self.last_gc = 0.0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def touch(self, user_id):
+        """Mark a user as active; writes at most once per ``touch_interval``"""
+        now = time.time()
+        with self.lock:
+            if now - self.touched.get(user_id, 0.0) < self.touch_interval:
+                return
+            self.touched[user_id] = now
+        self._connection().execute(
+            "INSERT INTO users (user_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (user_id, now))
+        self.maybe_gc(now)
+
+    def append(self, user_id, function_id, message):
+        """Add one chat message to the end of a conversation"""
+        self._connection().execute(
+            "INSERT INTO messages (user_id, function_id, session_id, role, content, model_used, "
+            "processing_time, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, function_id, message.get('session_id'), message['role'], message['content'],
+             message.get('model_used'), message.get('processing_time'), message['timestamp']))
+
+    def history(self, user_id, function_id, limit=50, before=None):
+        """Up to ``limit`` messages older than message id ``before`` (newest if None), oldest first"""
+        query = f"SELECT {', '.join(MESSAGE_FIELDS)} FROM messages WHERE user_id = ? AND function_id = ?"
+        params = [user_id, function_id]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def get_summary(self, user_id, function_id):
+        row = self._connection().execute(
+            "SELECT text, covers FROM summaries WHERE user_id = ? AND function_id = ?",
+            (user_id, function_id)).fetchone()
+        return dict(row) if row else None
+
+    def add_pending(self, session_id, user_id, function_id, compacts=None):
+        """Remember whose conversation a queued task's result belongs to"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pending (session_id, user_id, function_id, compacts, queued_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (session_id, user_id, function_id, compacts, time.time()))
+
+    def compaction_pending(self, user_id, function_id):
+        row = self._connection().execute(
+            "SELECT 1 FROM pending WHERE user_id = ? AND function_id = ? AND compacts IS NOT NULL",
+            (user_id, function_id)).fetchone()
+        return row is not None
+
+    def complete(self, result, timestamp):
+        """File a finished task's result into its conversation; False if the task is unknown"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            task = conn.execute("SELECT user_id, function_id, compacts FROM pending WHERE session_id = ?",
+                                (result['session_id'],)).fetchone()
+            if task is None:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("DELETE FROM pending WHERE session_id = ?", (result['session_id'],))
+            if task['compacts'] is not None:
+                # Failed compactions are retried on a later turn
+                if result['status'] == 'success':
+                    conn.execute(
+                        "INSERT OR REPLACE INTO summaries (user_id, function_id, text, covers, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (task['user_id'], task['function_id'], result['ai_response'], task['compacts'],
+                         time.time()))
+            else:
+                if result['status'] == 'success':
+                    message = {'role': 'ai', 'content': result['ai_response'],
+                               'model_used': result['model_used'],
+                               'processing_time': result['processing_time']}
+                else:
+                    message = {'role': 'error', 'content': result.get('error', 'An unknown error occurred')}
+                message.update(session_id=result['session_id'], timestamp=timestamp)
+                self.append(task['user_id'], task['function_id'], message)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def maybe_gc(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            if now - self.last_gc < self.gc_interval:
+                return
+            self.last_gc = now
+        try:
+            self.gc(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Conversation garbage collection failed: {str(e)}")
+
+    def gc(self, now=None):
+        """Delete users idle for longer than the TTL, their conversations, and stale pending tasks"""
+        now = now or time.time()
+        conn = self._connection()
+        cutoff = now - self.ttl
+        expired = "SELECT user_id FROM users WHERE last_seen < ?"
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            messages = conn.execute(f"DELETE FROM messages WHERE user_id IN ({expired})", (cutoff,)).rowcount
+            conn.execute(f"DELETE FROM summaries WHERE user_id IN ({expired})", (cutoff,))
+            conn.execute("DELETE FROM pending WHERE queued_at < ?", (now - self.pending_ttl,))
+            users = conn.execute("DELETE FROM users WHERE last_seen < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if users:
+            logger.info(f"Expired {users} idle users and {messages} messages")
+        with self.lock:
+            self.touched = {u: t for u, t in self.touched.items() if t >= cutoff}
+        return users
+
+    def get_stats(self):
+        conn = self._connection()
+        return {
+            'path': self.path,
+            'users': conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            'pending': conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0],
+            'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'ttl': self.ttl
+        }
@@ -0,0 +1,149 @@
+import queue
+import threading
+from collections import OrderedDict, deque
+
+
+class PriorityClass:
+    """Deficit round-robin state for the tasks of one priority level"""
+    def __init__(self):
+        self.queues = OrderedDict()  # user -> deque of (cost, task); order is the round-robin ring
+        self.deficits = {}
+
+    def push(self, user, cost, task):
+        if user not in self.queues:
+            self.queues[user] = deque()
+            self.deficits[user] = 0
+        self.queues[user].append((cost, task))
+
+    def pop(self, quantum):
+        """Serve the next task in DRR order"""
+        while True:
+            user, user_queue = next(iter(self.queues.items()))
+            cost, task = user_queue[0]
+            if self.deficits[user] >= cost:
+                user_queue.popleft()
+                self.deficits[user] -= cost
+                if not user_queue:
+                    # Idle users do not bank credit
+                    del self.queues[user]
+                    del self.deficits[user]
+                return task
+            # Turn over: top up the credit and move the user to the back of the ring
+            self.deficits[user] += quantum
+            self.queues.move_to_end(user)
+
+    def remove(self, match):
+        """Drop the tasks for which ``match(task)`` is true and return them"""
+        removed = []
+        for user in list(self.queues):
+            kept = deque()
+            for cost, task in self.queues[user]:
+                (removed if match(task) else kept).append((cost, task))
+            if kept:
+                self.queues[user] = kept
+            else:
+                del self.queues[user]
+                del self.deficits[user]
+        return [task for _, task in removed]
+
+    def copy(self):
+        clone = PriorityClass()
+        for user, user_queue in self.queues.items():
+            clone.queues[user] = deque(user_queue)
+        clone.deficits = dict(self.deficits)
+        return clone
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.values())
+
+
+class FairQueue:
+    """Drop-in replacement for ``queue.Queue`` with per-user fair share.
+
+    Tasks are grouped into priority classes (lower number first); inside a
+    class, users are served by deficit round-robin weighted by each task's
+    estimated cost, so one user's batch of long inputs cannot starve
+    everyone else's short requests.
+    """
+    def __init__(self, quantum=500):
+        self.quantum = quantum
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.classes = {}
+        self.size = 0
+        self.sentinels = 0
+        self.unfinished = 0
+        self.all_done = threading.Condition(self.lock)
+
+    def put(self, task, user='anonymous', priority=0, cost=1):
+        with self.condition:
+            self.unfinished += 1
+            if task is None:
+                # Shutdown sentinel jumps the line
+                self.sentinels += 1
+            else:
+                self.classes.setdefault(priority, PriorityClass()).push(user, max(1, cost), task)
+                self.size += 1
+            self.condition.notify()
+
+    def get(self, block=True, timeout=None):
+        with self.condition:
+            if not block and not self._available():
+                raise queue.Empty
+            if not self.condition.wait_for(self._available, timeout):
+                raise queue.Empty
+            if self.sentinels:
+                self.sentinels -= 1
+                return None
+            priority = min(p for p, c in self.classes.items() if len(c))
+            task = self.classes[priority].pop(self.quantum)
+            self.size -= 1
+            return task
+
+    def _available(self):
+        return self.size > 0 or self.sentinels > 0
+
+    def task_done(self):
+        with self.condition:
+            self.unfinished -= 1
+            if self.unfinished <= 0:
+                self.all_done.notify_all()
+
+    def join(self):
+        with self.condition:
+            self.all_done.wait_for(lambda: self.unfinished <= 0)
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return self.size == 0
+
+    def remove(self, match):
+        """Take every queued task for which ``match(task)`` is true out of the queue and return them"""
+        with self.condition:
+            removed = []
+            for pclass in self.classes.values():
+                removed.extend(pclass.remove(match))
+            self.size -= len(removed)
+            self.unfinished -= len(removed)
+            if self.unfinished <= 0:
+                self.all_done.notify_all()
+            return removed
+
+    def position(self, match):
+        """1-based place in the current service order of the first task for which ``match(task)`` is true.
+
+        The order is simulated on a snapshot, so it is exact for the tasks
+        queued right now; later arrivals from other users may interleave.
+        """
+        with self.condition:
+            snapshot = {p: c.copy() for p, c in self.classes.items() if len(c)}
+        position = 0
+        for priority in sorted(snapshot):
+            pclass = snapshot[priority]
+            while len(pclass):
+                position += 1
+                if match(pclass.pop(self.quantum)):
+                    return position
+        return None
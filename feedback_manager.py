@@ -1,10 +1,19 @@
 import json
 import os
-import tempfile
 import shutil
-from datetime import datetime
+import threading
+import atexit
+import bisect
+import time
+from contextlib import contextmanager
+from datetime import datetime, date
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('feedback_manager')
@@ -13,57 +22,173 @@ FEEDBACK_DIR = "data/feedback"
 JSONL_FILE = os.path.join(FEEDBACK_DIR, "feedback_{date}.jsonl")
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB per file
 
+FLUSH_BATCH_SIZE = int(os.getenv('FEEDBACK_FLUSH_BATCH_SIZE', 64))  # Records per write
+FLUSH_INTERVAL_MS = int(os.getenv('FEEDBACK_FLUSH_INTERVAL_MS', 200))  # Max delay before buffered records hit disk
+FSYNC_ON_FLUSH = os.getenv('FEEDBACK_FSYNC', 'false').lower() == 'true'  # Group fsync once per batch
+LOCK_FILE = os.path.join(FEEDBACK_DIR, ".feedback.lock")
+INDEX_FILE = os.path.join(FEEDBACK_DIR, ".feedback_index.json")
+INDEX_STRIDE = 256  # Records between seek checkpoints
+LEGACY_FILE = "data/feedback.json"  # Pre-JSONL single array format
+ROLLUP_FILE = os.path.join(FEEDBACK_DIR, ".feedback_rollup.json")
+ROLLUP_REFRESH_INTERVAL = 5  # Seconds between tail reads for /api/feedback/stats
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process on the host"""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data):
+    """Replace a JSON file atomically so readers never see a torn write"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class FeedbackWriter:
+    """Single-writer, append-only JSONL writer with batched flushes.
+
+    Records are buffered in memory and appended by one background thread
+    every ``batch_size`` records or ``flush_interval_ms``, whichever comes
+    first. Each batch is written under an exclusive ``flock`` on a lock
+    file, so several gunicorn workers can share the same day file and
+    size-based rotation never races with a write.
+    """
+    def __init__(self, directory=FEEDBACK_DIR, batch_size=FLUSH_BATCH_SIZE,
+                 flush_interval_ms=FLUSH_INTERVAL_MS, fsync=FSYNC_ON_FLUSH,
+                 max_file_size=MAX_FILE_SIZE):
+        self.directory = directory
+        self.lock_path = os.path.join(directory, os.path.basename(LOCK_FILE))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync = fsync
+        self.max_file_size = max_file_size
+        self.buffer = []
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.stopped = False
+        self.thread = None
+        self.records_written = 0
+        self.batches_written = 0
+
+    def start(self):
+        if self.thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.thread = threading.Thread(target=self._run, name='feedback-writer', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def append(self, json_line):
+        """Buffer one serialized record for the next batch"""
+        with self.condition:
+            self.buffer.append(json_line)
+            backlog = len(self.buffer)
+            if backlog >= self.batch_size:
+                self.condition.notify()
+        if backlog >= self.batch_size * 64:
+            # Writer fell far behind: flush on the caller's thread to bound memory
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if len(self.buffer) < self.batch_size and not self.stopped:
+                    self.condition.wait(timeout=self.flush_interval)
+                stopped = self.stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self):
+        """Append all buffered records to the current day file"""
+        with self.flush_lock:
+            with self.condition:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+                self.records_written += len(batch)
+                self.batches_written += 1
+            except Exception as e:
+                logger.error(f"Failed to append {len(batch)} feedback records: {str(e)}")
+                for json_line in batch:
+                    save_to_fallback(json_line)
+
+    def _write_batch(self, batch):
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        filename = os.path.join(self.directory, os.path.basename(JSONL_FILE).format(date=current_date))
+        data = ''.join(line + '\n' for line in batch).encode('utf-8')
+
+        with file_lock(self.lock_path):
+            # Rotate file if it's too large
+            if os.path.exists(filename) and os.path.getsize(filename) > self.max_file_size:
+                rotate_file(filename)
+
+            # One O_APPEND write per batch keeps records whole
+            fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide feedback writer, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FeedbackWriter()
+            _writer.start()
+        return _writer
+
+
 def save_feedback(feedback_data):
-    """Save feedback data to JSONL files with rotation and atomic writes."""
+    """Queue feedback data for a batched append to the day's JSONL file."""
+    json_line = None
     try:
         # Add timestamp if not provided
         feedback_data.setdefault('timestamp', datetime.now().isoformat())
         
-        # Ensure directory exists
-        os.makedirs(FEEDBACK_DIR, exist_ok=True)
-        
-        # Get current date-based filename
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        filename = JSONL_FILE.format(date=current_date)
-        
-        # Rotate file if it's too large
-        if os.path.exists(filename) and os.path.getsize(filename) > MAX_FILE_SIZE:
-            rotate_file(filename)
-        
         # Create JSONL line
         json_line = json.dumps(feedback_data, ensure_ascii=False)
         
-        # Atomic write to prevent corruption
-        write_atomic(filename, json_line + '\n')
+        get_writer().append(json_line)
         
-        logger.info(f"Feedback saved successfully for request: {feedback_data.get('request_id', 'unknown')}")
+        logger.info(f"Feedback queued for request: {feedback_data.get('request_id', 'unknown')}")
         return True
         
     except Exception as e:
         logger.error(f"Failed to save feedback: {str(e)}")
         # Fallback to temp file if primary save fails
-        save_to_fallback(json_line)
+        if json_line is not None:
+            save_to_fallback(json_line)
         return False
 
-def write_atomic(filename, content):
-    """Write to file atomically to prevent partial writes on failure"""
-    try:
-        # Write to temp file first
-        with tempfile.NamedTemporaryFile(mode='w', 
-                                         dir=os.path.dirname(filename),
-                                         delete=False) as tmp_file:
-            tmp_file.write(content)
-        
-        # Atomic rename (works on Unix and Windows)
-        os.replace(tmp_file.name, filename)
-        
-    except OSError as e:
-        logger.error(f"Atomic write failed: {str(e)}")
-        # Clean up temp file if it exists
-        if os.path.exists(tmp_file.name):
-            os.unlink(tmp_file.name)
-        raise
-
 def rotate_file(filename):
     """Rotate files when they become too large"""
     try:
@@ -97,24 +222,299 @@ def save_to_fallback(json_line):
         # Last resort - print to stderr
         print(f"CRITICAL FEEDBACK LOSS: {json_line}")
 
-def load_feedback():
-    """Load all feedback data from files (for admin/reporting)"""
-    feedback = []
+class FeedbackIndex:
+    """Sidecar index of per-file timestamp ranges and seek checkpoints.
+
+    Feedback files are append-only, so each refresh only parses bytes added
+    since the last one. Every ``INDEX_STRIDE`` records a checkpoint stores
+    the byte offset and the largest timestamp seen before it, which lets a
+    date-range query seek past everything older than its start.
+    """
+    def __init__(self, directory=FEEDBACK_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, os.path.basename(INDEX_FILE))
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        write_json_atomic(self.path, entries)
+
+    def refresh(self):
+        """Bring the index up to date with the files on disk and return it"""
+        entries = self._load()
+        changed = False
+        try:
+            files = feedback_files(self.directory)
+        except OSError:
+            return {}
+
+        for name in list(entries):
+            if name not in files:
+                del entries[name]
+                changed = True
+
+        for name in files:
+            stat = os.stat(os.path.join(self.directory, name))
+            entry = entries.get(name)
+            if entry is None or entry['inode'] != stat.st_ino or stat.st_size < entry['size']:
+                # New, replaced or truncated file: index from scratch
+                entry = {'inode': stat.st_ino, 'size': 0, 'count': 0, 'min_ts': None,
+                         'max_ts': '', 'checkpoints': [[0, '']]}
+            if stat.st_size > entry['size']:
+                self._index_file(os.path.join(self.directory, name), entry)
+                entries[name] = entry
+                changed = True
+            elif name not in entries:
+                entries[name] = entry
+                changed = True
+
+        if changed:
+            try:
+                self._save(entries)
+            except OSError as e:
+                logger.warning(f"Failed to save feedback index: {str(e)}")
+        return entries
+
+    def _index_file(self, path, entry):
+        with open(path, 'rb') as f:
+            f.seek(entry['size'])
+            offset = entry['size']
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Partial record still being written
+                if entry['count'] and entry['count'] % INDEX_STRIDE == 0:
+                    entry['checkpoints'].append([offset, entry['max_ts']])
+                offset += len(line)
+                entry['count'] += 1
+                try:
+                    timestamp = json.loads(line).get('timestamp') or ''
+                except ValueError:
+                    continue
+                if entry['min_ts'] is None or timestamp < entry['min_ts']:
+                    entry['min_ts'] = timestamp
+                entry['max_ts'] = max(entry['max_ts'], timestamp)
+            entry['size'] = offset
+
+    @staticmethod
+    def seek_offset(entry, start):
+        """Byte offset before which every record is older than ``start``"""
+        prefix_max = [checkpoint[1] for checkpoint in entry['checkpoints']]
+        i = bisect.bisect_left(prefix_max, start) - 1
+        return entry['checkpoints'][max(i, 0)][0]
+
+
+def feedback_files(directory=FEEDBACK_DIR):
+    """Names of all JSONL feedback files, rotated ones included"""
+    return sorted(f for f in os.listdir(directory)
+                  if f.startswith('feedback_') and f.endswith('.jsonl'))
+
+
+def _bound(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _iter_legacy(path):
+    """Records from the legacy single-array feedback.json"""
     try:
-        # Get all feedback files
-        files = [f for f in os.listdir(FEEDBACK_DIR) 
-                if f.startswith('feedback_') and f.endswith('.jsonl')]
-        
-        for filename in sorted(files):
-            full_path = os.path.join(FEEDBACK_DIR, filename)
-            with open(full_path, 'r', encoding='utf-8') as f:
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read legacy feedback {path}: {str(e)}")
+        return
+    for record in records if isinstance(records, list) else []:
+        yield record
+
+
+def iter_feedback(start=None, end=None, rating=None, request_id=None,
+                  include_legacy=True, directory=FEEDBACK_DIR):
+    """Yield feedback records lazily, oldest files first.
+
+    ``start``/``end`` accept ISO strings, dates or datetimes; a date-only
+    ``end`` includes that whole day. Files whose indexed timestamp range
+    misses the window are skipped, and ``start`` seeks inside a file.
+    """
+    start, end = _bound(start), _bound(end)
+
+    def matches(record):
+        timestamp = record.get('timestamp') or ''
+        if start is not None and timestamp < start:
+            return False
+        if end is not None and timestamp[:len(end)] > end:
+            return False
+        if rating is not None and record.get('rating') != rating:
+            return False
+        if request_id is not None and record.get('request_id') != request_id:
+            return False
+        return True
+
+    if include_legacy and os.path.exists(LEGACY_FILE):
+        for record in _iter_legacy(LEGACY_FILE):
+            if matches(record):
+                yield record
+
+    index = FeedbackIndex(directory)
+    entries = index.refresh()
+    for filename, entry in sorted(entries.items()):
+        if not entry['count']:
+            continue
+        if start is not None and entry['max_ts'] < start:
+            continue
+        if end is not None and (entry['min_ts'] or '')[:len(end)] > end:
+            continue
+
+        full_path = os.path.join(directory, filename)
+        try:
+            with open(full_path, 'rb') as f:
+                if start is not None:
+                    f.seek(index.seek_offset(entry, start))
+                # Stop at the indexed size: anything later is a partial write
+                remaining = entry['size'] - f.tell()
                 for line in f:
+                    if remaining <= 0:
+                        break
+                    remaining -= len(line)
                     try:
-                        feedback.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        logger.warning(f"Invalid JSON in {filename}: {line}")
-    
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Invalid JSON in {filename}: {line!r}")
+                        continue
+                    if matches(record):
+                        yield record
+        except OSError as e:
+            logger.error(f"Failed to read feedback file {filename}: {str(e)}")
+
+
+def load_feedback(**filters):
+    """Load feedback data from files (for admin/reporting).
+
+    Prefer ``iter_feedback`` for large directories; this materializes the
+    same records into a list.
+    """
+    try:
+        return list(iter_feedback(**filters))
     except Exception as e:
         logger.error(f"Failed to load feedback: {str(e)}")
-    
-    return feedback
\ No newline at end of file
+        return []
+
+
+class FeedbackRollup:
+    """Incrementally maintained feedback counts by day, rating and function.
+
+    Each refresh tails the bytes appended since the last one. Offsets are
+    checkpointed per inode, so a file renamed by ``rotate_file`` is not
+    counted twice. The counts and offsets live together in one sidecar
+    file, which is replaced atomically under a lock shared by all processes.
+    """
+    def __init__(self, directory=FEEDBACK_DIR, refresh_interval=ROLLUP_REFRESH_INTERVAL):
+        self.directory = directory
+        self.path = os.path.join(directory, os.path.basename(ROLLUP_FILE))
+        self.lock_path = self.path + '.lock'
+        self.refresh_interval = refresh_interval
+        self.last_refresh = 0.0
+        self.state = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _empty_state():
+        return {'offsets': {}, 'legacy_consumed': False, 'total': 0,
+                'by_rating': {}, 'by_function': {}, 'by_day': {}}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self._empty_state()
+
+    def _count(self, state, record):
+        rating = record.get('rating') or 'unknown'
+        function_id = record.get('function') or 'unknown'
+        day = (record.get('timestamp') or '')[:10] or 'unknown'
+        state['total'] += 1
+        state['by_rating'][rating] = state['by_rating'].get(rating, 0) + 1
+        by_function = state['by_function'].setdefault(function_id, {})
+        by_function[rating] = by_function.get(rating, 0) + 1
+        by_day = state['by_day'].setdefault(day, {})
+        by_day[rating] = by_day.get(rating, 0) + 1
+
+    def refresh(self, force=False):
+        """Consume newly appended records; throttled to one tail per interval"""
+        with self.lock:
+            if not force and self.state is not None and time.time() - self.last_refresh < self.refresh_interval:
+                return self.state
+            os.makedirs(self.directory, exist_ok=True)
+            with file_lock(self.lock_path):
+                state = self._load()
+                changed = False
+
+                if not state['legacy_consumed'] and os.path.exists(LEGACY_FILE):
+                    for record in _iter_legacy(LEGACY_FILE):
+                        self._count(state, record)
+                    changed = True
+                state['legacy_consumed'] = True
+
+                live_inodes = set()
+                for name in feedback_files(self.directory):
+                    full_path = os.path.join(self.directory, name)
+                    try:
+                        stat = os.stat(full_path)
+                    except OSError:
+                        continue
+                    inode = str(stat.st_ino)
+                    live_inodes.add(inode)
+                    offset = state['offsets'].get(inode, 0)
+                    if stat.st_size < offset:
+                        offset = 0  # Truncated or inode reused
+                    if stat.st_size == offset:
+                        continue
+                    state['offsets'][inode] = self._tail(full_path, offset, state)
+                    changed = True
+
+                for inode in list(state['offsets']):
+                    if inode not in live_inodes:
+                        del state['offsets'][inode]
+                        changed = True
+
+                if changed:
+                    write_json_atomic(self.path, state)
+
+            self.state = state
+            self.last_refresh = time.time()
+            return state
+
+    def _tail(self, path, offset, state):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Partial record still being written
+                offset += len(line)
+                try:
+                    self._count(state, json.loads(line))
+                except ValueError:
+                    logger.warning(f"Invalid JSON in {path}: {line!r}")
+        return offset
+
+    def get_stats(self, days=None):
+        """Rollup summary; ``days`` limits the per-day series to the most recent days"""
+        state = self.refresh()
+        by_day = state['by_day']
+        if days is not None:
+            # [-0:] would slice the whole series
+            by_day = dict(sorted(by_day.items())[-max(days, 1):])
+        return {
+            'total': state['total'],
+            'by_rating': state['by_rating'],
+            'by_function': state['by_function'],
+            'by_day': by_day,
+            'updated_at': datetime.fromtimestamp(self.last_refresh).isoformat()
+        }
@@ -0,0 +1,211 @@
+import random
+import threading
+import time
+from collections import deque
+from cancellation import TaskCancelled
+
+
+class HedgeLost(Exception):
+    """Raised in a duplicate call once the other call has answered, to stop it.
+
+    ``response`` is the call's own ``(text, usage, headers)`` if it had
+    already finished, so its cost can still be accounted for.
+    """
+    def __init__(self, response=None):
+        super().__init__("Another call answered first")
+        self.response = response
+
+
+class HedgeRace:
+    """Decide which of two duplicate calls answers a task.
+
+    A call commits when it streams its first content delta, or when it
+    returns if it is not streamed. The first call to commit wins; deltas
+    of the other are refused with ``HedgeLost``, so clients never see
+    both.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.committed_at = None
+
+    def claim(self, attempt):
+        """Commit ``attempt`` unless another call already has; True if ``attempt`` is the winner"""
+        with self.lock:
+            if self.winner is None:
+                self.winner = attempt
+                self.committed_at = time.time()
+            return self.winner == attempt
+
+    def gate(self, attempt, publish):
+        """Delta callback for one call: forward its deltas to ``publish`` only while it is the winner"""
+        def forward(session_id, content):
+            if not self.claim(attempt):
+                raise HedgeLost()
+            if publish is not None:
+                publish(session_id, content)
+        return forward
+
+
+class HedgePolicy:
+    """When to duplicate a slow call on a second key.
+
+    A call that has not committed within the ``percentile`` of recent
+    commit latencies gets a duplicate, as long as hedges stay under
+    ``budget`` times the calls made. A ``holdout`` share of calls is never
+    hedged so its latency shows what hedging saves.
+    """
+    def __init__(self, percentile=95, budget=0.05, holdout=0.1, window=500, min_samples=50, min_delay=0.1):
+        self.percentile = percentile
+        self.budget = budget
+        self.holdout = holdout
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def begin(self):
+        """Count a call; True if it belongs to the holdout and must not be hedged"""
+        with self.lock:
+            self.calls += 1
+        return random.random() < self.holdout
+
+    def delay(self):
+        """Seconds to wait for a commit before hedging, or None until enough latencies are known"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    def observe(self, seconds):
+        """Record how long a primary call took to commit (cut short if its duplicate committed first)"""
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def allow(self):
+        """Take one hedge from the budget; False if it is spent"""
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self.lock:
+            self.wins += 1
+
+    def get_stats(self):
+        threshold = self.delay()
+        with self.lock:
+            return {
+                'percentile': self.percentile,
+                'threshold_seconds': round(threshold, 3) if threshold is not None else None,
+                'budget': self.budget,
+                'holdout': self.holdout,
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_rate': round(self.hedges / self.calls, 4) if self.calls else 0.0,
+                'hedge_wins': self.wins
+            }
+
+
+class HedgedCall:
+    """Bookkeeping of one completion that may be duplicated, shared by both completion engines.
+
+    The engine runs the calls (threads or asyncio tasks) and asks this
+    object when to hedge (``delay``, ``start_hedge``), whether a finished
+    call is its answer (``claim``), which calls must be settled
+    (``needs_settling``, ``settle``), what to raise when no call answered
+    (``failure``) and records the outcome (``finish``). ``key_index`` is the
+    primary call's key, whose reservation stays with the caller.
+    """
+    def __init__(self, policy, scheduler, function_id, key_index, estimated_tokens, prompt_tokens, metrics=None):
+        self.policy = policy
+        self.scheduler = scheduler
+        self.function_id = function_id
+        self.key_index = key_index
+        self.estimated_tokens = estimated_tokens
+        self.prompt_tokens = prompt_tokens
+        self.metrics = metrics
+        self.group = 'holdout' if policy.begin() else 'hedging'
+        self.race = HedgeRace()
+        self.started = time.time()
+
+    def delay(self):
+        """Seconds to wait for the primary call before hedging, or None if this call is never hedged"""
+        return self.policy.delay() if self.group == 'hedging' else None
+
+    def gate(self, attempt, publish):
+        return self.race.gate(attempt, publish)
+
+    def claim(self, attempt, response):
+        """Return a finished call's response if it is the answer, else raise ``HedgeLost`` carrying it"""
+        if not self.race.claim(attempt):
+            raise HedgeLost(response)
+        return response
+
+    def start_hedge(self):
+        """Reserve another key for a duplicate call, or None if no other key is free right now or the budget is spent"""
+        index, delay = self.scheduler.acquire(self.estimated_tokens, exclude=(self.key_index,))
+        outcome = 'sent'
+        if index == self.key_index or delay > 0:
+            outcome = 'no_key'
+        elif not self.policy.allow():
+            outcome = 'over_budget'
+        if self.metrics is not None:
+            self.metrics.hedges.inc(outcome)
+        if outcome != 'sent':
+            self.scheduler.release(index, self.estimated_tokens)
+            return None
+        return index
+
+    @staticmethod
+    def needs_settling(is_winner, is_primary, answered):
+        """Whether a call's key is settled here; the primary's is left to the caller when no call answered"""
+        return not is_winner and (answered or not is_primary)
+
+    def settle(self, index, error):
+        """Close the key reservation of a call that did not answer its task and count the tokens it cost.
+
+        ``error`` is what the call raised; pass ``HedgeLost()`` for a call
+        that was cancelled before it finished.
+        """
+        extra_tokens = 0
+        if isinstance(error, HedgeLost) and error.response is not None:
+            _, usage, headers = error.response
+            self.scheduler.record_success(index, self.estimated_tokens, usage.total_tokens if usage else None, headers)
+            extra_tokens = usage.total_tokens if usage else self.prompt_tokens
+        elif isinstance(error, (HedgeLost, TaskCancelled)):
+            # Cut short; the prompt is billed all the same
+            self.scheduler.release(index, self.estimated_tokens)
+            extra_tokens = self.prompt_tokens
+        else:
+            self.scheduler.record_failure(index, self.estimated_tokens, error)
+        if self.metrics is not None and extra_tokens:
+            self.metrics.hedge_extra_tokens.inc(self.function_id, amount=extra_tokens)
+
+    @staticmethod
+    def failure(primary_error, hedge_errors):
+        """Error to raise when no call answered"""
+        if isinstance(primary_error, HedgeLost):
+            # The duplicate committed first, then failed
+            return next(iter(hedge_errors))
+        return primary_error
+
+    def finish(self, answered, by_hedge=False):
+        """Record the race once it is decided: the commit latency, and who answered"""
+        if self.race.committed_at is not None:
+            self.policy.observe(self.race.committed_at - self.started)
+        if not answered:
+            return
+        if self.metrics is not None:
+            self.metrics.hedged_latency.observe(time.time() - self.started, self.function_id, self.group)
+        if by_hedge:
+            self.policy.record_win()
+            if self.metrics is not None:
+                self.metrics.hedges.inc('won')
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger('job_queue')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    function_id TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    context TEXT NOT NULL,
+    dedupe_key TEXT,
+    priority INTEGER NOT NULL,
+    cost INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    settled TEXT  -- NULL while open, 'cancelled' once cancelled, 'answered' once its result is being stored
+);
+CREATE INDEX IF NOT EXISTS jobs_by_lease ON jobs (lease_until);
+CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (dedupe_key);
+CREATE TABLE IF NOT EXISTS followers (
+    session_id TEXT PRIMARY KEY,
+    leader TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS followers_by_leader ON followers (leader);
+"""
+
+JOB_FIELDS = ('session_id', 'kind', 'user_id', 'function_id', 'user_input', 'context', 'attempts', 'enqueued_at',
+              'settled')
+
+# A cancelled job keeps running only for followers still waiting on it
+ABANDONED = "settled = 'cancelled' AND NOT EXISTS (SELECT 1 FROM followers WHERE leader = jobs.session_id)"
+
+# Ready jobs in lease order: priority class, then each user's cumulative queued
+# cost (start-time fair queueing), then arrival
+READY_ORDER = """
+SELECT {fields}, ROW_NUMBER() OVER (ORDER BY priority, finish, id) AS position FROM (
+    SELECT *, SUM(cost) OVER (PARTITION BY user_id ORDER BY id) AS finish
+    FROM jobs WHERE lease_until < ?
+)
+"""
+
+
+class JobQueue:
+    """Durable task queue in SQLite, shared by every process on a host.
+
+    Jobs are leased instead of popped: a job that is not acked within
+    ``visibility_timeout`` seconds becomes visible again, so work held by a
+    crashed or restarted process is picked up by another one. Jobs leased
+    ``max_attempts`` times without an ack are handed back as dead letters.
+    Identical jobs (same ``key``) attach to the queued or running one as
+    followers and are acked together with it. A leased job is cancelled by
+    flagging it; its holder stops and must ``claim`` the job before storing
+    a result, so a cancellation is never overwritten.
+    """
+    def __init__(self, path='data/jobs.db', visibility_timeout=300, max_attempts=3):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if 'settled' not in {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN settled TEXT")  # Queues created before cancellation flags
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = work(conn)
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, session_id, kind, user_id, function_id, user_input, context=(),
+            priority=0, cost=1, key=None):
+        """Queue a job; return the leader's session_id if it joined an identical job, else None"""
+        def work(conn):
+            if key is not None:
+                row = conn.execute("SELECT session_id FROM jobs WHERE dedupe_key = ? "
+                                   "AND (settled IS NULL OR settled = 'answered')", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("INSERT INTO followers (session_id, leader) VALUES (?, ?)",
+                                 (session_id, row['session_id']))
+                    return row['session_id']
+            conn.execute(
+                "INSERT INTO jobs (session_id, kind, user_id, function_id, user_input, context, dedupe_key, "
+                "priority, cost, enqueued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, kind, user_id, function_id, user_input, json.dumps(list(context)), key,
+                 priority, max(1, cost), time.time()))
+            return None
+        return self._transaction(work)
+
+    def lease(self, owner, limit=1):
+        """Lease up to ``limit`` ready jobs; return ``(jobs, dead_jobs)``"""
+        def work(conn):
+            now = time.time()
+            rows = conn.execute(READY_ORDER.format(fields=', '.join(JOB_FIELDS)) + " ORDER BY position LIMIT ?",
+                                (now, limit)).fetchall()
+            jobs, dead = [], []
+            for row in rows:
+                # Cancelled while held by a process that then died
+                if conn.execute(f"DELETE FROM jobs WHERE session_id = ? AND {ABANDONED}", (row['session_id'],)).rowcount:
+                    continue
+                job = dict(row, context=tuple(tuple(m) for m in json.loads(row['context'])))
+                if row['attempts'] >= self.max_attempts:
+                    conn.execute("DELETE FROM jobs WHERE session_id = ?", (row['session_id'],))
+                    dead.append(job)
+                    continue
+                conn.execute("UPDATE jobs SET lease_owner = ?, lease_until = ?, attempts = attempts + 1 "
+                             "WHERE session_id = ?", (owner, now + self.visibility_timeout, row['session_id']))
+                jobs.append(job)
+            return jobs, dead
+        return self._transaction(work)
+
+    def extend(self, owner, session_ids):
+        """Push back the visibility timeout of jobs this owner still holds"""
+        if not session_ids:
+            return
+        placeholders = ', '.join('?' * len(session_ids))
+        self._connection().execute(
+            f"UPDATE jobs SET lease_until = ? WHERE lease_owner = ? AND session_id IN ({placeholders})",
+            [time.time() + self.visibility_timeout, owner, *session_ids])
+
+    def ack(self, session_id):
+        """Remove a finished job; return the session_ids of its followers"""
+        def work(conn):
+            followers = [row['session_id'] for row in conn.execute(
+                "SELECT session_id FROM followers WHERE leader = ?", (session_id,))]
+            conn.execute("DELETE FROM followers WHERE leader = ?", (session_id,))
+            conn.execute("DELETE FROM jobs WHERE session_id = ?", (session_id,))
+            return followers
+        return self._transaction(work)
+
+    def cancel(self, session_id):
+        """Cancel a job or detach a follower; return 'cancelled', 'finished' if its result is being stored, or None.
+
+        A queued job nobody else waits for is withdrawn; a leased or followed
+        one is flagged, so its holder stops (once no follower needs it) and
+        does not store an answer for it.
+        """
+        def work(conn):
+            if conn.execute("DELETE FROM followers WHERE session_id = ?", (session_id,)).rowcount:
+                return 'cancelled'
+            row = conn.execute("SELECT settled FROM jobs WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            if row['settled'] == 'answered':
+                return 'finished'
+            if not conn.execute(
+                    "DELETE FROM jobs WHERE session_id = ? AND lease_until < ? "
+                    "AND NOT EXISTS (SELECT 1 FROM followers WHERE leader = ?)",
+                    (session_id, time.time(), session_id)).rowcount:
+                conn.execute("UPDATE jobs SET settled = 'cancelled' WHERE session_id = ?", (session_id,))
+            return 'cancelled'
+        return self._transaction(work)
+
+    def claim(self, session_id):
+        """Take the right to store a job's result; False if it was cancelled or already answered"""
+        return self._connection().execute(
+            "UPDATE jobs SET settled = 'answered' WHERE session_id = ? AND settled IS NULL",
+            (session_id,)).rowcount > 0
+
+    def cancelled(self, session_ids):
+        """Those of ``session_ids`` that were cancelled and that no follower waits for"""
+        if not session_ids:
+            return set()
+        placeholders = ', '.join('?' * len(session_ids))
+        return {row['session_id'] for row in self._connection().execute(
+            f"SELECT session_id FROM jobs WHERE session_id IN ({placeholders}) AND {ABANDONED}", list(session_ids))}
+
+    def release(self, owner, session_ids):
+        """Make held jobs visible again right away, e.g. on shutdown"""
+        if not session_ids:
+            return
+        placeholders = ', '.join('?' * len(session_ids))
+        self._connection().execute(
+            f"UPDATE jobs SET lease_owner = NULL, lease_until = 0, attempts = MAX(attempts - 1, 0) "
+            f"WHERE lease_owner = ? AND session_id IN ({placeholders})", [owner, *session_ids])
+
+    def position(self, session_id):
+        """1-based place of a job (or the job a follower is attached to) in lease order, None once leased"""
+        conn = self._connection()
+        row = conn.execute("SELECT leader FROM followers WHERE session_id = ?", (session_id,)).fetchone()
+        if row is not None:
+            session_id = row['leader']
+        row = conn.execute(f"SELECT position FROM ({READY_ORDER.format(fields='session_id')}) "
+                           f"WHERE session_id = ?", (time.time(), session_id)).fetchone()
+        return row['position'] if row else None
+
+    def qsize(self):
+        """Jobs waiting for a lease across all processes"""
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE lease_until < ?",
+                                          (time.time(),)).fetchone()[0]
+
+    def get_stats(self):
+        conn = self._connection()
+        now = time.time()
+        return {
+            'path': self.path,
+            'queued': conn.execute("SELECT COUNT(*) FROM jobs WHERE lease_until < ?", (now,)).fetchone()[0],
+            'leased': conn.execute("SELECT COUNT(*) FROM jobs WHERE lease_until >= ?", (now,)).fetchone()[0],
+            'followers': conn.execute("SELECT COUNT(*) FROM followers").fetchone()[0],
+            'visibility_timeout': self.visibility_timeout
+        }
+
+
+class JobFeeder:
+    """Lease jobs from a ``JobQueue`` into this process's completion engine.
+
+    At most ``capacity`` jobs are held at once, so idle processes pick up
+    the rest of the backlog. Held leases are extended in the background
+    until ``done`` is called for the job; leases still held at shutdown
+    are released for other processes. Held jobs cancelled from any process
+    are picked up every iteration, for ``is_cancelled``.
+    """
+    def __init__(self, job_queue, dispatch, on_dead, capacity, poll_interval=0.2):
+        self.job_queue = job_queue
+        self.dispatch = dispatch
+        self.on_dead = on_dead
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = set()
+        self.cancelled = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='job-feeder', daemon=True)
+        self.thread.start()
+        logger.info(f"Job feeder {self.owner} started with capacity {self.capacity}")
+
+    def _run(self):
+        renew_every = self.job_queue.visibility_timeout / 3
+        last_renewal = time.time()
+        while not self.stopped.is_set():
+            leased = 0
+            try:
+                with self.lock:
+                    free = self.capacity - len(self.held)
+                if free > 0:
+                    jobs, dead = self.job_queue.lease(self.owner, free)
+                    leased = len(jobs)
+                    for job in dead:
+                        logger.warning(f"Job {job['session_id']} failed {job['attempts']} times, giving up")
+                        self.on_dead(job)
+                    with self.lock:
+                        self.held.update(job['session_id'] for job in jobs)
+                    for job in jobs:
+                        self.dispatch(job)
+                with self.lock:
+                    held = list(self.held)
+                self.cancelled = self.job_queue.cancelled(held)
+                if time.time() - last_renewal > renew_every:
+                    self.job_queue.extend(self.owner, held)
+                    last_renewal = time.time()
+            except Exception:
+                logger.exception("Job feeder iteration failed")
+            if not leased:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def notify(self):
+        """Wake the feeder after a local put so it need not wait for the next poll"""
+        self.wake.set()
+
+    def is_cancelled(self, session_id):
+        """Whether a held job was cancelled, as of the last iteration"""
+        return session_id in self.cancelled
+
+    def done(self, session_id):
+        """Ack a finished job and return its followers"""
+        followers = self.job_queue.ack(session_id)
+        with self.lock:
+            self.held.discard(session_id)
+        self.wake.set()
+        return followers
+
+    def stop(self):
+        """Stop leasing new jobs"""
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def release_held(self):
+        with self.lock:
+            held, self.held = list(self.held), set()
+        if held:
+            self.job_queue.release(self.owner, held)
+            logger.info(f"Released {len(held)} unfinished jobs")
+
+    def get_stats(self):
+        with self.lock:
+            held = len(self.held)
+        return {'owner': self.owner, 'held': held, 'capacity': self.capacity}
@@ -0,0 +1,191 @@
+import threading
+import time
+import logging
+import openai
+
+logger = logging.getLogger('key_scheduler')
+
+
+def estimate_request_tokens(request_kwargs):
+    """Rough token cost of a request: ~4 characters per prompt token plus the completion cap"""
+    prompt_chars = sum(len(m.get('content') or '') for m in request_kwargs.get('messages', []))
+    return prompt_chars // 4 + request_kwargs.get('max_tokens', 0)
+
+
+class TokenBucket:
+    """Continuously refilling budget; may go negative to record debt"""
+    def __init__(self, capacity, per_minute):
+        self.capacity = float(capacity)
+        self.rate = per_minute / 60.0
+        self.tokens = float(capacity)
+        self.updated = time.time()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float('inf')
+
+    def set_limit(self, limit):
+        self.capacity = float(limit)
+        self.rate = limit / 60.0
+
+    def set_remaining(self, remaining):
+        self.tokens = min(self.capacity, float(remaining))
+
+
+class KeyState:
+    """Budgets and health of one API key"""
+    def __init__(self, index, rpm, tpm):
+        self.index = index
+        self.requests = TokenBucket(rpm, rpm)
+        self.tokens = TokenBucket(tpm, tpm)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = None
+
+    def wait_time(self, now, estimated_tokens):
+        return max(self.quarantined_until - now,
+                   self.requests.wait_for(1),
+                   self.tokens.wait_for(estimated_tokens),
+                   0.0)
+
+    def headroom(self):
+        """Smallest remaining fraction of the request and token budgets"""
+        return min(self.requests.tokens / self.requests.capacity,
+                   self.tokens.tokens / self.tokens.capacity)
+
+    def to_dict(self, now):
+        return {
+            'key': self.index,
+            'in_flight': self.in_flight,
+            'requests_remaining': int(self.requests.tokens),
+            'requests_per_minute': int(self.requests.capacity),
+            'tokens_remaining': int(self.tokens.tokens),
+            'tokens_per_minute': int(self.tokens.capacity),
+            'consecutive_failures': self.consecutive_failures,
+            'quarantined_for': round(max(0.0, self.quarantined_until - now), 2),
+            'successes': self.successes,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+
+class KeyScheduler:
+    """Route requests to the API key with the most rate limit headroom.
+
+    Each key has its own requests-per-minute and tokens-per-minute token
+    buckets, corrected from ``x-ratelimit-*`` response headers when the
+    upstream sends them. Throttled keys are quarantined with exponential
+    backoff without slowing down the other keys.
+    """
+    def __init__(self, num_keys, rpm=500, tpm=200000, base_backoff=3, max_backoff=30,
+                 auth_quarantine=300):
+        self.keys = [KeyState(i, rpm, tpm) for i in range(max(num_keys, 1))]
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.auth_quarantine = auth_quarantine
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens, exclude=()):
+        """Reserve budget on the best key, other than those in ``exclude`` if possible; return ``(key_index, seconds_to_wait)``"""
+        with self.lock:
+            now = time.time()
+            for key in self.keys:
+                key.requests.refill(now)
+                key.tokens.refill(now)
+            keys = [k for k in self.keys if k.index not in exclude] or self.keys
+            best = min(keys, key=lambda k: (k.wait_time(now, estimated_tokens), -k.headroom(), k.in_flight))
+            wait = best.wait_time(now, estimated_tokens)
+            best.requests.tokens -= 1
+            best.tokens.tokens -= estimated_tokens
+            best.in_flight += 1
+            return best.index, wait
+
+    def record_success(self, index, estimated_tokens, used_tokens=None, headers=None):
+        with self.lock:
+            key = self.keys[index]
+            key.in_flight -= 1
+            key.successes += 1
+            key.consecutive_failures = 0
+            key.quarantined_until = 0.0
+            if used_tokens is not None:
+                # Refund the unused part of the reservation
+                key.tokens.tokens = min(key.tokens.capacity, key.tokens.tokens + estimated_tokens - used_tokens)
+            if headers is not None:
+                self._apply_headers(key, headers)
+
+    def record_failure(self, index, estimated_tokens, error):
+        """Release a reservation; quarantine the key if the error was its fault"""
+        with self.lock:
+            key = self.keys[index]
+            key.in_flight -= 1
+            key.failures += 1
+            key.last_error = type(error).__name__
+            # A failed request does not consume tokens
+            key.tokens.tokens = min(key.tokens.capacity, key.tokens.tokens + estimated_tokens)
+
+            if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+                key.quarantined_until = time.time() + self.auth_quarantine
+                logger.warning(f"API key #{index} rejected, quarantined for {self.auth_quarantine}s")
+            elif isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+                key.consecutive_failures += 1
+                delay = min(self.base_backoff * (1.5 ** (key.consecutive_failures - 1)), self.max_backoff)
+                retry_after = _retry_after(error)
+                if retry_after is not None:
+                    delay = retry_after
+                key.quarantined_until = time.time() + delay
+                if isinstance(error, openai.RateLimitError):
+                    key.requests.tokens = min(key.requests.tokens, 0)
+
+    def release(self, index, estimated_tokens):
+        """Drop a reservation without judging the key, e.g. for a cancelled task"""
+        with self.lock:
+            key = self.keys[index]
+            key.in_flight -= 1
+            key.tokens.tokens = min(key.tokens.capacity, key.tokens.tokens + estimated_tokens)
+
+    def _apply_headers(self, key, headers):
+        try:
+            if headers.get('x-ratelimit-limit-requests'):
+                key.requests.set_limit(int(headers['x-ratelimit-limit-requests']))
+            if headers.get('x-ratelimit-remaining-requests'):
+                key.requests.set_remaining(int(headers['x-ratelimit-remaining-requests']))
+            if headers.get('x-ratelimit-limit-tokens'):
+                key.tokens.set_limit(int(headers['x-ratelimit-limit-tokens']))
+            if headers.get('x-ratelimit-remaining-tokens'):
+                key.tokens.set_remaining(int(headers['x-ratelimit-remaining-tokens']))
+        except (TypeError, ValueError):
+            pass
+
+    def retry_after(self):
+        """Seconds until some key can take a request again"""
+        now = time.time()
+        return round(min(max(0.0, k.quarantined_until - now) for k in self.keys), 1)
+
+    def healthy_keys(self):
+        now = time.time()
+        return sum(1 for k in self.keys if k.quarantined_until <= now)
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            return [k.to_dict(now) for k in self.keys]
+
+
+def _retry_after(error):
+    """Retry-After seconds from an upstream error response, if present"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
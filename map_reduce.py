@@ -0,0 +1,65 @@
+import re
+import threading
+
+# "Translate to French:" or "Please translate this into German" on the first line of an input
+_INSTRUCTION = re.compile(r'\A\s*((?:please\s+)?translate\b[^\n:]{0,80}):?[ \t]*(?:\n|(?<=:)|\Z)', re.I)
+# "[English] → [French]:" line the translate prompt puts before each translation
+_TRANSLATION_HEADER = re.compile(r'\A\s*\[?[^\n\]→]{1,40}?\]?\s*(?:→|->)\s*\[?[^\n\]:]{1,40}?\]?\s*:[ \t]*\n?')
+
+
+def leading_instruction(text):
+    """Split an instruction such as "Translate to French:" off the start of ``text``; ``('', text)`` if none"""
+    match = _INSTRUCTION.match(text)
+    if match is None:
+        return '', text
+    return match.group(1).strip() + ':', text[match.end():].lstrip()
+
+
+def join_translations(responses):
+    """Concatenate chunk translations, keeping only the first chunk's language header"""
+    parts = [responses[0].strip()] + [_TRANSLATION_HEADER.sub('', r, count=1).strip() for r in responses[1:]]
+    return '\n\n'.join(parts)
+
+
+
+class MapReduceJob:
+    """Collect the results of the chunk tasks of one long input.
+
+    Each chunk is queued as an ordinary task under its own session id with
+    ``callback(index)`` as result callback, so chunks run concurrently on
+    whichever completion engine is active. When every chunk succeeded,
+    ``on_complete`` gets the responses in input order; the first failing
+    chunk fails the whole job through ``on_error`` instead.
+    """
+    def __init__(self, session_id, num_chunks, on_complete, on_error):
+        self.session_id = session_id
+        self.responses = [None] * num_chunks
+        self.remaining = num_chunks
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.done = False
+        self.lock = threading.Lock()
+
+    def chunk_id(self, index):
+        return f"{self.session_id}:chunk{index}"
+
+    def callback(self, index):
+        return lambda result: self.collect(index, result)
+
+    def collect(self, index, result):
+        with self.lock:
+            if self.done:
+                return
+            if result['status'] != 'success':
+                self.done = True
+            else:
+                self.responses[index] = result['ai_response']
+                self.remaining -= 1
+                if self.remaining:
+                    return
+                self.done = True
+        if result['status'] != 'success':
+            self.on_error(dict(result, session_id=self.session_id))
+        else:
+            self.on_complete(self.responses)
+
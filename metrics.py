@@ -0,0 +1,206 @@
+import time
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers cache hits and queue hand-offs up to multi-minute map-reduce jobs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Seconds; in-process lookups that should stay under a millisecond
+LOOKUP_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+# Estimated Jaccard similarity, finest near the reuse threshold
+SIMILARITY_BUCKETS = (0.25, 0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99, 1)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic total per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination.
+
+    An observation is one binary search and three additions under a lock,
+    cheap enough to stay on for every request.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.series = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self.lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self.series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _labels(self.labelnames, labels, [('le', _number(float(bound)))]), cumulative)
+            yield self.name + '_sum', _labels(self.labelnames, labels), round(total, 6)
+            yield self.name + '_count', _labels(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """Value read from ``collect`` at scrape time, so the hot path pays nothing.
+
+    ``collect`` returns a number, or a dict of label value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, labelnames=()):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.collect()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in sorted(value.items()):
+            yield self.name, _labels(self.labelnames, labels), number
+
+
+class MetricsRegistry:
+    """Metrics of one process, rendered in the Prometheus text exposition format"""
+    def __init__(self, namespace='inquiro'):
+        self.namespace = namespace
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(f"{self.namespace}_{name}", help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(f"{self.namespace}_{name}", help, labelnames, buckets))
+
+    def gauge(self, name, help, collect, labelnames=()):
+        return self._add(Gauge(f"{self.namespace}_{name}", help, collect, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class PipelineMetrics:
+    """Stage timings and outcome counters of the completion pipeline.
+
+    Shared by the threaded workers and the async engine, so both report
+    the same series.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.started_at = time.time()
+        self.queue_wait = registry.histogram(
+            'queue_wait_seconds', 'Time a task waited for a free worker', ['function'])
+        self.rate_limit_wait = registry.histogram(
+            'rate_limit_wait_seconds', 'Time a task slept for its API key budget', ['function'])
+        self.upstream_latency = registry.histogram(
+            'upstream_latency_seconds', 'Duration of the chat completion call', ['function', 'outcome'])
+        self.end_to_end = registry.histogram(
+            'request_duration_seconds', 'Time from accepting a task to publishing its result',
+            ['function', 'status'])
+        self.requests = registry.counter(
+            'requests_total', 'Finished tasks by function and result status', ['function', 'status'])
+        self.rejections = registry.counter(
+            'rejections_total', 'Tasks turned away by admission control', ['function'])
+        self.upstream_errors = registry.counter(
+            'upstream_errors_total', 'Failed completion calls by error class', ['function', 'error'])
+        self.tasks_stopped = registry.counter(
+            'tasks_stopped_total', 'Tasks answered as cancelled, past their deadline or abandoned', ['reason'])
+        self.failovers = registry.counter(
+            'model_failovers_total', 'Calls retried on the next model of the chain', ['model', 'error'])
+        self.hedges = registry.counter(
+            'hedges_total', 'Duplicate calls sent for slow completions, won, or not sent', ['outcome'])
+        self.hedge_extra_tokens = registry.counter(
+            'hedge_extra_tokens_total', 'Tokens spent on calls that lost a hedge race (prompt estimate if cut short)',
+            ['function'])
+        self.hedged_latency = registry.histogram(
+            'hedged_call_seconds', 'Time for a hedging-eligible call to answer, hedged or in the never-hedged holdout',
+            ['function', 'group'])
+        self.cache_hits = registry.counter(
+            'cache_hits_total', 'Tasks answered from the response cache', ['function'])
+        self.near_duplicates = registry.counter(
+            'near_duplicates_total', 'Near-duplicate lookups after an exact cache miss, by outcome',
+            ['function', 'outcome'])
+        self.near_duplicate_lookup = registry.histogram(
+            'near_duplicate_lookup_seconds', 'Time to sign an input and probe the similarity index', ['function'],
+            buckets=LOOKUP_BUCKETS)
+        self.near_duplicate_similarity = registry.histogram(
+            'near_duplicate_similarity', 'Input similarity of near-duplicate matches', ['function'],
+            buckets=SIMILARITY_BUCKETS)
+        self.near_duplicate_agreement = registry.histogram(
+            'near_duplicate_response_similarity',
+            'Similarity between the response a near-duplicate would have reused and the fresh one', ['function'],
+            buckets=SIMILARITY_BUCKETS)
+        self.tokens = registry.counter(
+            'tokens_total', 'Tokens reported in response usage', ['function', 'type'])
+
+    def upstream_call(self, function_id, seconds, error=None, usage=None):
+        """Record one completion call: its latency, error class or token usage"""
+        if error is not None:
+            self.upstream_latency.observe(seconds, function_id, 'error')
+            self.upstream_errors.inc(function_id, type(error).__name__)
+            return
+        self.upstream_latency.observe(seconds, function_id, 'success')
+        if usage is not None:
+            self.tokens.inc(function_id, 'prompt', amount=usage.prompt_tokens or 0)
+            self.tokens.inc(function_id, 'completion', amount=usage.completion_tokens or 0)
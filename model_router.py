@@ -0,0 +1,183 @@
+import threading
+import time
+import logging
+from collections import deque
+import openai
+from key_scheduler import _retry_after
+
+logger = logging.getLogger('model_router')
+
+# Errors that belong to the model rather than the request, so the next model in the chain may succeed.
+# They are raised before a response starts streaming, so failing over never repeats published deltas.
+FAILOVER_ERRORS = (openai.RateLimitError, openai.NotFoundError, openai.InternalServerError)
+
+
+def parse_routes(spec):
+    """Parse ``'code:gpt-4o|gpt-4o-mini,summarize/large:gpt-4o-mini'`` into ``{(function, size): [models]}``.
+
+    A route without ``/size`` applies to every input size.
+    """
+    routes = {}
+    for item in spec.split(','):
+        if ':' not in item:
+            continue
+        target, models = item.split(':', 1)
+        function_id, _, size = target.strip().partition('/')
+        chain = [m.strip() for m in models.split('|') if m.strip()]
+        if chain:
+            routes[(function_id, size.strip() or None)] = chain
+    return routes
+
+
+class ModelState:
+    """Recent calls and availability of one model"""
+    def __init__(self, name, window):
+        self.name = name
+        self.calls = deque()  # (finished at, seconds, ok) within the rolling window
+        self.window = window
+        self.throttled_until = 0.0
+        self.unavailable_until = 0.0
+        self.consecutive_throttles = 0
+        self.successes = 0
+        self.failures = 0
+        self.last_error = None
+
+    def trim(self, now):
+        while self.calls and self.calls[0][0] < now - self.window:
+            self.calls.popleft()
+
+    def latency(self):
+        """Mean seconds of the successful calls in the window, or None"""
+        durations = [seconds for _, seconds, ok in self.calls if ok]
+        return sum(durations) / len(durations) if durations else None
+
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, _, ok in self.calls if not ok) / len(self.calls)
+
+    def to_dict(self, now):
+        latency = self.latency()
+        return {
+            'model': self.name,
+            'calls': len(self.calls),
+            'latency_seconds': round(latency, 3) if latency is not None else None,
+            'error_rate': round(self.error_rate(), 3),
+            'throttled_for': round(max(0.0, self.throttled_until - now), 2),
+            'unavailable_for': round(max(0.0, self.unavailable_until - now), 2),
+            'successes': self.successes,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+
+class ModelRouter:
+    """Pick the model for a task from a per-function, per-input-size fallback chain.
+
+    ``models`` is the default chain in order of preference (e.g. cheapest
+    first); ``routes`` (from ``parse_routes``) put other models in front
+    for a function, optionally only for ``'small'`` or ``'large'`` inputs,
+    split at ``large_input_tokens``. Every call's latency and outcome is
+    kept for ``window`` seconds. ``candidates`` returns the chain with
+    models that are throttled or unavailable moved to the back, behind
+    models that are merely failing often (above ``max_error_rate``) or
+    slow (mean latency above ``latency_slo``). Within each group the
+    configured order is kept, so the preferred model wins whenever it is
+    healthy. A demoted model gets traffic again once its bad calls age
+    out of the window.
+    """
+    def __init__(self, models, routes=None, count_tokens=len, large_input_tokens=2000,
+                 latency_slo=20.0, max_error_rate=0.5, min_calls=5, window=60.0,
+                 base_backoff=3, max_backoff=60, unavailable_for=300):
+        self.models = list(dict.fromkeys(models))
+        self.routes = routes or {}
+        self.count_tokens = count_tokens
+        self.large_input_tokens = large_input_tokens
+        self.latency_slo = latency_slo
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.unavailable_for = unavailable_for
+        self.lock = threading.Lock()
+        routed = [model for chain in self.routes.values() for model in chain]
+        self.states = {name: ModelState(name, window) for name in dict.fromkeys(self.models + routed)}
+
+    def size_class(self, user_input):
+        return 'large' if self.count_tokens(user_input) > self.large_input_tokens else 'small'
+
+    def chain(self, function_id, user_input):
+        """Configured models for a task in order of preference, ending with the default chain"""
+        route = self.routes.get((function_id, self.size_class(user_input))) or self.routes.get((function_id, None), [])
+        return list(dict.fromkeys(route + self.models))
+
+    def primary(self, function_id, user_input):
+        """Preferred model of a task, regardless of health"""
+        return self.chain(function_id, user_input)[0]
+
+    def _rank(self, state, now):
+        state.trim(now)
+        if state.throttled_until > now or state.unavailable_until > now:
+            return 2
+        if len(state.calls) >= self.min_calls and state.error_rate() > self.max_error_rate:
+            return 1
+        latency = state.latency()
+        if self.latency_slo and latency is not None and latency > self.latency_slo:
+            return 1
+        return 0
+
+    def candidates(self, function_id, user_input):
+        """Models to try for a task, healthiest first"""
+        chain = self.chain(function_id, user_input)
+        now = time.time()
+        with self.lock:
+            ranks = {name: self._rank(self.states[name], now) for name in chain}
+        return sorted(chain, key=lambda name: ranks[name])
+
+    def record_success(self, model, seconds):
+        with self.lock:
+            state = self.states[model]
+            state.calls.append((time.time(), seconds, True))
+            state.successes += 1
+            state.consecutive_throttles = 0
+            state.throttled_until = 0.0
+
+    def record_failure(self, model, seconds, error):
+        """Count a failed call; return True if the error is the model's and the next model should be tried"""
+        now = time.time()
+        with self.lock:
+            state = self.states[model]
+            state.calls.append((now, seconds, False))
+            state.failures += 1
+            state.last_error = type(error).__name__
+            if isinstance(error, openai.RateLimitError):
+                state.consecutive_throttles += 1
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = min(self.base_backoff * (1.5 ** (state.consecutive_throttles - 1)), self.max_backoff)
+                state.throttled_until = now + delay
+            elif isinstance(error, openai.NotFoundError):
+                state.unavailable_until = now + self.unavailable_for
+                logger.warning(f"Model {model} not found, skipped for {self.unavailable_for}s")
+            return isinstance(error, FAILOVER_ERRORS)
+
+    def fail_over(self, models, attempt, seconds, error, task=None, metrics=None):
+        """Record a failed call of ``models[attempt]``; the model to retry on, or None if the task fails.
+
+        Only errors that belong to the model move on, and only while the
+        chain has models left.
+        """
+        model = models[attempt]
+        if not self.record_failure(model, seconds, error) or attempt + 1 >= len(models):
+            return None
+        if metrics is not None:
+            metrics.failovers.inc(model, type(error).__name__)
+        logger.warning(f"{type(error).__name__} from {model}, retrying {task} on {models[attempt + 1]}")
+        return models[attempt + 1]
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            for state in self.states.values():
+                state.trim(now)
+            return [state.to_dict(now) for state in self.states.values()]
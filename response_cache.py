@@ -0,0 +1,170 @@
+import hashlib
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('response_cache')
+
+
+def normalize_input(text):
+    """Unify line endings and trim surrounding whitespace; inner whitespace is kept, since it matters in code"""
+    return text.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+
+class LRUTTLBackend:
+    """Bounded in-process store with LRU eviction and per-entry expiry"""
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, value, size)
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, size = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.time() + ttl, value, size)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'evictions': self.evictions
+        }
+
+
+class CachelibBackend:
+    """Adapter for a shared cachelib cache (filesystem, redis, memcached)"""
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, timeout=ttl)
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+def create_backend(spec, max_entries=1000):
+    """Build a backend from a spec: 'memory', 'filesystem:<dir>' or 'redis://...'.
+
+    Shared backends let several gunicorn workers reuse each other's entries.
+    """
+    if spec == 'memory':
+        return LRUTTLBackend(max_entries=max_entries)
+
+    from cachelib import FileSystemCache, RedisCache
+
+    if spec.startswith('filesystem:'):
+        cache_dir = spec.split(':', 1)[1] or 'data/response_cache'
+        return CachelibBackend(FileSystemCache(cache_dir, threshold=max_entries), 'filesystem')
+    if spec.startswith('redis://') or spec.startswith('rediss://'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The 'redis' package is required for a redis response cache backend")
+        return CachelibBackend(RedisCache(host=redis.from_url(spec), key_prefix='inquiro:cache:'), 'redis')
+
+    raise ValueError(f"Unknown response cache backend: {spec}")
+
+
+class ResponseCache:
+    """Cache completions, with the model that produced them, under deterministic (model, prompt, temperature, input) keys"""
+    def __init__(self, backend, enabled_functions, ttl=3600):
+        self.backend = backend
+        self.enabled_functions = set(enabled_functions)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def enabled_for(self, function_id):
+        return function_id in self.enabled_functions
+
+    @staticmethod
+    def make_key(model, prompt_hash, temperature, user_input, context=()):
+        parts = [model, prompt_hash, temperature, normalize_input(user_input)]
+        if context:
+            parts.append([list(message) for message in context])
+        raw = json.dumps(parts)
+        return 'resp:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def peek(self, key):
+        """Cached ``{'ai_response', 'model_used'}`` without counting a hit or miss, for lookups on behalf of another key"""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {str(e)}")
+            return None
+        if value is None:
+            return None
+        try:
+            entry = json.loads(value)
+        except ValueError:
+            entry = None
+        if not isinstance(entry, dict):
+            # Cached as bare text before the answering model was recorded
+            entry = {'ai_response': value, 'model_used': None}
+        return entry
+
+    def get(self, key):
+        value = self.peek(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, ai_response, model=None):
+        """Store a response with the model that produced it, which may differ from the one in the key"""
+        value = json.dumps({'ai_response': ai_response, 'model_used': model}, ensure_ascii=False)
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {str(e)}")
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'enabled_functions': sorted(self.enabled_functions),
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+        stats.update(self.backend.stats())
+        return stats
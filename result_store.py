@@ -0,0 +1,35 @@
+import json
+import logging
+
+logger = logging.getLogger('result_store')
+
+
+class ResultStore:
+    """Finished task results keyed by ``session_id`` with TTL expiry.
+
+    Results are stored as JSON so any response cache backend works: the
+    bounded in-process LRU for a single process, or a cachelib backend
+    shared by every gunicorn worker.
+    """
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+
+    def put(self, session_id, result):
+        try:
+            self.backend.set('result:' + session_id, json.dumps(result, ensure_ascii=False), self.ttl)
+        except Exception as e:
+            logger.error(f"Failed to store result for {session_id}: {str(e)}")
+
+    def get(self, session_id):
+        try:
+            value = self.backend.get('result:' + session_id)
+        except Exception as e:
+            logger.warning(f"Result lookup failed for {session_id}: {str(e)}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def get_stats(self):
+        stats = {'ttl': self.ttl}
+        stats.update(self.backend.stats())
+        return stats
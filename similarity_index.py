@@ -0,0 +1,175 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+WORD = re.compile(r'\w+')
+HASH_MASK = 0xFFFFFFFF
+
+
+def shingles(text, size=3):
+    """Word n-grams of the lower-cased text, so whitespace, punctuation and case do not count"""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text, num_bins=128, shingle_size=3):
+    """One-permutation MinHash signature of the text's shingles.
+
+    Each shingle is hashed once and only kept if it is the smallest in its
+    bin, so signing costs one hash per shingle instead of one per shingle
+    and permutation. Empty bins (short texts) borrow the next filled bin,
+    offset by the distance, which keeps them comparable between texts.
+    Python's string hash is salted per process, so signatures must not
+    leave the process that made them.
+    """
+    empty = HASH_MASK + 1
+    bins = [empty] * num_bins
+    for shingle in shingles(text, shingle_size):
+        h = hash(shingle) & HASH_MASK
+        index, value = h % num_bins, h // num_bins
+        if value < bins[index]:
+            bins[index] = value
+    if empty not in bins:
+        return array('I', bins)
+    # Every text has at least one shingle, so some bin is filled
+    span = (HASH_MASK + 1) // num_bins
+    signature = array('I')
+    for index in range(num_bins):
+        offset = 0
+        while bins[(index + offset) % num_bins] == empty:
+            offset += 1
+        signature.append(bins[(index + offset) % num_bins] + offset * span)
+    return signature
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class SimilarityIndex:
+    """Find near-identical earlier texts with MinHash and LSH banding.
+
+    Signatures are cut into ``bands`` bands; texts sharing all values of
+    any band become candidates, which are then kept only if their
+    estimated similarity reaches ``threshold``. With 16 bands of 8 rows a
+    pair at similarity 0.9 is found with probability above 0.999, while
+    pairs below 0.5 rarely become candidates at all. Entries live in a
+    ``scope`` (e.g. the function, prompt and context they were answered
+    under), expire after ``ttl`` seconds and the oldest is dropped beyond
+    ``max_entries``.
+    """
+    def __init__(self, threshold=0.9, num_bins=128, bands=16, shingle_size=3, max_entries=5000, ttl=3600):
+        if num_bins % bands:
+            raise ValueError("num_bins must be a multiple of bands")
+        self.threshold = threshold
+        self.num_bins = num_bins
+        self.bands = bands
+        self.rows = num_bins // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # entry id -> (scope, value, signature, expires_at, bucket keys)
+        self.buckets = {}  # hash of (scope, band, band values) -> entry ids
+        self.next_id = 0
+        self.lookups = 0
+        self.matches = 0
+        self.candidates = 0
+        self.rejected_candidates = 0  # Shared a band but fell below the threshold
+        self.similarity_total = 0.0
+        self.lookup_seconds = 0.0  # Probing buckets and scoring candidates, not signing
+
+    def signature(self, text):
+        return minhash(text, self.num_bins, self.shingle_size)
+
+    def _bucket_keys(self, scope, signature):
+        return [hash((scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                for band in range(self.bands)]
+
+    def add(self, scope, text, value, signature=None):
+        """Index ``text`` so that later near-identical texts in ``scope`` find ``value``"""
+        signature = signature or self.signature(text)
+        keys = self._bucket_keys(scope, signature)
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (scope, value, signature, time.time() + self.ttl, keys)
+            for key in keys:
+                self.buckets.setdefault(key, []).append(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, entry_id):
+        _, _, _, _, keys = self.entries.pop(entry_id)
+        for key in keys:
+            ids = self.buckets.get(key)
+            if ids is None:
+                continue
+            if entry_id in ids:
+                ids.remove(entry_id)
+            if not ids:
+                del self.buckets[key]
+
+    def find(self, scope, text, signature=None):
+        """``(value, similarity)`` of the most similar indexed text in ``scope`` at or above the threshold, or None"""
+        signature = signature or self.signature(text)
+        started = time.perf_counter()
+        keys = self._bucket_keys(scope, signature)
+        best = None
+        now = time.time()
+        with self.lock:
+            self.lookups += 1
+            seen = set()
+            for key in keys:
+                for entry_id in self.buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry_scope, value, other, expires_at, _ = self.entries[entry_id]
+                    if entry_scope != scope:
+                        continue  # Bucket hash collision
+                    if expires_at < now:
+                        self._remove(entry_id)
+                        continue
+                    self.candidates += 1
+                    score = similarity(signature, other)
+                    if score < self.threshold:
+                        self.rejected_candidates += 1
+                    elif best is None or score > best[1]:
+                        best = (value, score)
+            if best is not None:
+                self.matches += 1
+                self.similarity_total += best[1]
+            self.lookup_seconds += time.perf_counter() - started
+        return best
+
+    def memory_bytes(self):
+        """Approximate bytes held by signatures, values, entries and buckets"""
+        with self.lock:
+            total = sys.getsizeof(self.entries) + sys.getsizeof(self.buckets)
+            for entry in self.entries.values():
+                total += sum(sys.getsizeof(part) for part in entry[1:3]) + sys.getsizeof(entry) + sys.getsizeof(entry[4])
+            total += sum(sys.getsizeof(ids) for ids in self.buckets.values())
+            return total
+
+    def get_stats(self):
+        memory = self.memory_bytes()
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'buckets': len(self.buckets),
+                'memory_bytes': memory,
+                'threshold': self.threshold,
+                'lookups': self.lookups,
+                'matches': self.matches,
+                'match_rate': round(self.matches / self.lookups, 3) if self.lookups else 0.0,
+                'mean_match_similarity': round(self.similarity_total / self.matches, 3) if self.matches else None,
+                'candidate_precision': round(1 - self.rejected_candidates / self.candidates, 3) if self.candidates else None,
+                'mean_lookup_ms': round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else 0.0
+            }
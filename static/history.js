@@ -0,0 +1,62 @@
+// Chat histories are fetched a page at a time from /api/history instead of being inlined
+// in the page, so the page stays the same size however long a conversation gets.
+(function () {
+  const loaded = new Set();
+
+  function messageElement(message) {
+    const role = message.role === "user" ? "user" : "ai";
+    const div = document.createElement("div");
+    div.className = `message ${role}`;
+    div.dataset.id = message.id;
+    const avatar = document.createElement("div");
+    avatar.className = "avatar";
+    const icon = document.createElement("i");
+    icon.className = role === "user" ? "bi-person" : "bi-robot";
+    avatar.appendChild(icon);
+    const bubble = document.createElement("div");
+    bubble.className = "bubble";
+    bubble.textContent = message.content;
+    div.append(avatar, bubble);
+    return div;
+  }
+
+  function loadPage(history, before) {
+    const params = new URLSearchParams({limit: history.dataset.pageSize});
+    if (before) params.set("before", before);
+    return fetch(`/api/history/${history.dataset.function}?${params}`, {credentials: "same-origin"})
+      .then(res => res.ok ? res.json() : Promise.reject(res.status))
+      .then(page => {
+        const button = history.querySelector(".load-earlier");
+        const first = history.querySelector(".message[data-id]");
+        const height = history.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        page.messages.forEach(message => fragment.appendChild(messageElement(message)));
+        // Older pages go between the greeting and the messages already shown
+        history.insertBefore(fragment, first);
+        if (before) {
+          history.scrollTop += history.scrollHeight - height;
+        } else {
+          history.scrollTop = history.scrollHeight;
+        }
+        button.dataset.before = page.before ?? "";
+        button.hidden = page.before === null;
+      })
+      .catch(error => console.error("Could not load chat history:", error));
+  }
+
+  function show(task) {
+    const history = document.querySelector(`#chat-${task} .chat-history`);
+    if (!history || loaded.has(task)) return;
+    loaded.add(task);
+    loadPage(history, null);
+  }
+
+  document.querySelectorAll(".chat-history .load-earlier").forEach(button => {
+    button.addEventListener("click", () => loadPage(button.closest(".chat-history"), button.dataset.before));
+  });
+  // Other conversations are only fetched once their assistant is opened
+  document.querySelectorAll(".sidebar-button").forEach(button => {
+    button.addEventListener("click", () => show(button.dataset.task));
+  });
+  show(document.body.dataset.task);
+})();
@@ -0,0 +1,143 @@
+"""Content-hashed, precompressed copies of the static folder.
+
+Every file gets a URL with a hash of its content in the name
+(``main.css`` -> ``main.3f2a9c1d0b7e.css``), so it can be cached forever
+and a deploy that changes it changes its URL. Text assets are compressed
+once at startup with gzip, and with brotli when the optional ``brotli``
+package is installed, instead of on every request.
+
+    python static_assets.py static/dist
+
+writes the same hashed and compressed files plus ``manifest.json`` for a
+front proxy or CDN to serve (e.g. nginx ``gzip_static``/``brotli_static``).
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Optional; only gzip variants are built without it
+
+logger = logging.getLogger('static_assets')
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Preferred first when a client accepts several
+ENCODINGS = ('br', 'gzip')
+EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+def accepted_encodings(header):
+    """Content codings an ``Accept-Encoding`` header allows, ignoring those with ``q=0``"""
+    accepted = set()
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Asset:
+    """One static file under its content-hashed name, with its compressed variants"""
+    def __init__(self, name, content):
+        self.name = name
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        root, ext = os.path.splitext(name)
+        self.hashed_name = f"{root}.{self.digest}{ext}"
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        self.variants = {'identity': content}
+        if ext.lower() in COMPRESSIBLE:
+            compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content, quality=11)
+            # Tiny files can grow when compressed
+            self.variants.update((coding, body) for coding, body in compressed.items() if len(body) < len(content))
+
+    def pick(self, accept_encoding):
+        """``(coding, body)`` of the smallest variant the client accepts"""
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ENCODINGS:
+            if coding in self.variants and (coding in accepted or '*' in accepted):
+                return coding, self.variants[coding]
+        return 'identity', self.variants['identity']
+
+
+class AssetManifest:
+    """Hashed names and compressed variants of every file in ``folder``, built once"""
+    def __init__(self, folder, url_prefix='/assets/'):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.assets = {}  # name relative to folder -> Asset
+        self.by_hashed_name = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        if os.path.isdir(self.folder):
+            for root, dirs, files in os.walk(self.folder):
+                dirs[:] = [d for d in dirs if d != 'dist']  # Output of a previous build
+                for filename in files:
+                    if filename.endswith(('.gz', '.br')):
+                        continue
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                    with open(path, 'rb') as f:
+                        assets[name] = Asset(name, f.read())
+        self.assets = assets
+        self.by_hashed_name = {asset.hashed_name: asset for asset in assets.values()}
+        logger.info(f"Prepared {len(assets)} static assets"
+                    f"{'' if brotli is not None else ' (gzip only, brotli not installed)'}")
+
+    def url(self, name):
+        """Cache-forever URL of a static file, or None if there is no such file"""
+        asset = self.assets.get(name)
+        return self.url_prefix + asset.hashed_name if asset else None
+
+    def lookup(self, hashed_name):
+        return self.by_hashed_name.get(hashed_name)
+
+    def write(self, out_dir):
+        """Write every hashed file and its compressed variants to ``out_dir``, plus ``manifest.json``"""
+        for asset in self.assets.values():
+            path = os.path.join(out_dir, asset.hashed_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for coding, body in asset.variants.items():
+                with open(path + EXTENSIONS.get(coding, ''), 'wb') as f:
+                    f.write(body)
+        with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({name: asset.hashed_name for name, asset in sorted(self.assets.items())}, f, indent=2)
+
+    def get_stats(self):
+        return {
+            'assets': len(self.assets),
+            'brotli': brotli is not None,
+            'bytes': {coding: sum(len(a.variants.get(coding, a.variants['identity'])) for a in self.assets.values())
+                      for coding in ('identity', 'gzip') + (('br',) if brotli is not None else ())}
+        }
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'static', 'dist')
+    manifest = AssetManifest(os.path.join(here, 'static'))
+    manifest.write(out_dir)
+    print(json.dumps(manifest.get_stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+
+class StreamChannel:
+    """Buffered deltas and final payload of one in-flight completion"""
+    def __init__(self):
+        self.created_at = time.time()
+        self.deltas = []
+        self.final = None
+        self.finished_at = None
+        self.condition = threading.Condition()
+
+
+class StreamBroker:
+    """Fan completion deltas out to Server-Sent Events subscribers.
+
+    Deltas are buffered per ``session_id`` so a subscriber that connects late
+    replays everything it missed. Finished channels are kept for
+    ``retention`` seconds and abandoned ones for ``max_age``, then pruned.
+    """
+    def __init__(self, retention=120, max_age=900, heartbeat=15):
+        self.retention = retention
+        self.max_age = max_age
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def open(self, session_id):
+        """Register a channel before the task is queued"""
+        with self.lock:
+            self._prune()
+            self.channels[session_id] = StreamChannel()
+
+    def has(self, session_id):
+        return session_id in self.channels
+
+    def publish(self, session_id, content):
+        """Append a content delta and wake up subscribers"""
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return
+        with channel.condition:
+            channel.deltas.append(content)
+            channel.condition.notify_all()
+
+    def finish(self, session_id, payload):
+        """Close a channel with the final ``/get_result`` style payload"""
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return
+        with channel.condition:
+            channel.final = payload
+            channel.finished_at = time.time()
+            channel.condition.notify_all()
+
+    def events(self, session_id, poll=None, poll_interval=1.0):
+        """Yield SSE-formatted messages until the channel finishes.
+
+        ``poll`` may return the final payload of a task that finished in
+        another process, which never publishes to this channel.
+        """
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return
+        sent = 0
+        while True:
+            with channel.condition:
+                if sent == len(channel.deltas) and channel.final is None:
+                    channel.condition.wait(timeout=poll_interval if poll else self.heartbeat)
+                new_deltas = channel.deltas[sent:]
+                final = channel.final
+            sent += len(new_deltas)
+            if final is None and not new_deltas and poll is not None:
+                final = poll()
+                if final is not None:
+                    self.finish(session_id, final)
+
+            if new_deltas:
+                yield format_event('delta', {'content': ''.join(new_deltas)})
+            if final is not None and sent == len(channel.deltas):
+                yield format_event('done', final)
+                return
+            if not new_deltas and final is None:
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+
+    def _prune(self):
+        now = time.time()
+        expired = [sid for sid, ch in self.channels.items()
+                   if (ch.finished_at is not None and ch.finished_at < now - self.retention)
+                   or ch.created_at < now - self.max_age]
+        for sid in expired:
+            del self.channels[sid]
+
+
+def format_event(event, data):
+    """Serialize one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+# Modules live at the top of the repository; the fake upstream lives with the benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+SERVE = f"""
+import logging, sys
+sys.path.insert(0, {ROOT!r})
+logging.disable(logging.INFO)
+from werkzeug.serving import make_server
+import app
+server = make_server('127.0.0.1', 0, app.app, threaded=True)
+print(server.server_port, flush=True)
+server.serve_forever()
+"""
+
+
+class AppProcess:
+    """The app served from its own process, since it reads its settings once at import"""
+    def __init__(self, workdir, **settings):
+        env = dict(os.environ, FLASK_SECRET_KEY='test', CONVERSATION_DB=str(workdir / 'conversations.db'))
+        env.pop('JOB_QUEUE', None)
+        env.update(settings)
+        # Relative data paths (feedback, results) land in the temporary directory
+        self.process = subprocess.Popen([sys.executable, '-c', SERVE], cwd=workdir, env=env,
+                                        stdout=subprocess.PIPE, text=True)
+        port = self.process.stdout.readline().strip()
+        if not port:
+            self.process.kill()
+            raise RuntimeError(f"The app did not start with {settings}")
+        self.url = f"http://127.0.0.1:{port}"
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(10)
+
+
+def wait_for_result(session, base_url, session_id, timeout=10):
+    """Poll /get_result until the task is no longer pending"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = session.get(f"{base_url}/get_result/{session_id}").json()
+        if result['status'] != 'pending':
+            return result
+        time.sleep(0.05)
+    pytest.fail(f"No result for {session_id} within {timeout}s")
+
+
+@pytest.fixture(scope='module')
+def fake():
+    from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=0.05, reply="A short fake summary."))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='module')
+def serve_app(fake, tmp_path_factory):
+    """Start the app against the fake upstream with extra environment settings"""
+    started = []
+
+    def start(**settings):
+        settings.setdefault('OPENAI_API_KEYS', 'fake-key-0,fake-key-1')
+        app = AppProcess(tmp_path_factory.mktemp('app'), OPENAI_BASE_URL=fake.base_url, **settings)
+        started.append(app)
+        return app.url
+
+    yield start
+    for app in started:
+        app.stop()
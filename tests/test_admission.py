@@ -0,0 +1,46 @@
+from admission import AdmissionController
+
+
+def test_predicted_wait_follows_observed_service_times():
+    controller = AdmissionController(capacity=4, default_service=10.0)
+    assert controller.predicted_wait(8) == 20.0
+    controller.served('summarize', waited=0, busy=2.0)
+    assert controller.service_time('summarize') == 2.0  # The first sample replaces the prior
+    assert controller.predicted_wait(8) == 4.0
+    controller.served('summarize', waited=0, busy=4.0)
+    assert controller.service_time('summarize') == 2.4  # alpha 0.2
+    assert controller.service_time('unseen') == controller.service_time('summarize')
+
+
+def test_bursts_are_admitted_up_to_max_wait():
+    controller = AdmissionController(capacity=1, max_wait=60.0, default_service=10.0)
+    assert controller.admit('summarize', 6) == (True, 70.0)
+    admitted, retry_in = controller.admit('summarize', 8)
+    assert not admitted and retry_in == 20
+    assert controller.get_stats()['rejected'] == 1
+
+
+def test_standing_queue_lowers_the_limit_to_target(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('admission.time.time', lambda: clock[0])
+    controller = AdmissionController(capacity=1, target=5.0, interval=10.0, default_service=1.0)
+    controller.served('summarize', waited=8, busy=1.0)
+    clock[0] += 11
+    controller.served('summarize', waited=8, busy=1.0)
+    assert controller.get_stats()['overloaded']
+    assert not controller.admit('summarize', 6)[0]
+    assert controller.admit('summarize', 5)[0]
+    # A short wait ends the overload
+    controller.served('summarize', waited=1, busy=1.0)
+    assert controller.admit('summarize', 6)[0]
+
+
+def test_empty_queue_resets_overload(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr('admission.time.time', lambda: clock[0])
+    controller = AdmissionController(capacity=1, target=5.0, interval=1.0)
+    controller.served('summarize', waited=8, busy=1.0)
+    clock[0] += 2
+    controller.served('summarize', waited=8, busy=1.0)
+    assert controller.admit('summarize', 0)[0]
+    assert not controller.get_stats()['overloaded']
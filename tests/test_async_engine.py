@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from async_engine import AsyncCompletionEngine
+
+
+@pytest.fixture
+def engine():
+    """One concurrency slot and a fake upstream call that records the service order"""
+    engine = AsyncCompletionEngine(['fake-key'], None,
+                                   on_success=lambda session_id, reply: {'status': 'success', 'session_id': session_id},
+                                   on_error=lambda session_id, error: {'status': 'error', 'session_id': session_id,
+                                                                       'error': str(error)},
+                                   max_concurrency=1, quantum=1)
+    engine.served = []
+    engine.release = threading.Event()
+
+    async def call(session_id, function_id, user_input, context):
+        engine.served.append(session_id)
+        while not engine.release.is_set():
+            await asyncio.sleep(0.01)
+        return engine.on_success(session_id, 'reply')
+
+    engine._call = call
+    engine.start()
+    yield engine
+    engine.release.set()
+    engine.shutdown()
+
+
+def submit(engine, session_id, user, priority=0):
+    results = []
+    future = engine.submit((session_id, 'summarize', 'text', (), results.append), user=user, priority=priority)
+    return future, results
+
+
+def wait_until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        threading.Event().wait(0.01)
+    pytest.fail("Condition not reached")
+
+
+def test_users_share_slots_round_robin(engine):
+    futures = [submit(engine, 'a1', 'alice')[0]]
+    wait_until(lambda: engine.served == ['a1'])
+    futures += [submit(engine, f"a{i}", 'alice')[0] for i in range(2, 5)]
+    futures.append(submit(engine, 'b1', 'bob')[0])
+    wait_until(lambda: engine.queue_depth() == 4)
+    assert engine.position(lambda session_id: session_id == 'b1') == 2
+    engine.release.set()
+    for future in futures:
+        future.result(5)
+    assert engine.served == ['a1', 'a2', 'b1', 'a3', 'a4']
+
+
+def test_lower_priority_class_goes_first(engine):
+    futures = [submit(engine, 'running', 'alice')[0]]
+    wait_until(lambda: engine.served == ['running'])
+    futures.append(submit(engine, 'batch', 'batch:1', priority=10)[0])
+    futures.append(submit(engine, 'chat', 'bob', priority=0)[0])
+    wait_until(lambda: engine.queue_depth() == 2)
+    engine.release.set()
+    for future in futures:
+        future.result(5)
+    assert engine.served == ['running', 'chat', 'batch']
+
+
+def test_cancelled_waiter_leaves_the_queue(engine):
+    running, _ = submit(engine, 'running', 'alice')
+    wait_until(lambda: engine.served == ['running'])
+    waiting, results = submit(engine, 'waiting', 'bob')
+    wait_until(lambda: engine.queue_depth() == 1)
+    assert engine.cancel(lambda session_id: session_id == 'waiting') == 1
+    wait_until(lambda: results)
+    assert results[0]['status'] == 'error' and engine.queue_depth() == 0
+    engine.release.set()
+    running.result(5)
+    # The slot is free again
+    assert submit(engine, 'next', 'carol')[0].result(5)['status'] == 'success'
+    assert engine.served == ['running', 'next']
+
+
+def test_lookup_and_callback_run_off_the_loop():
+    threads = {}
+
+    def lookup(session_id, function_id, user_input, context):
+        threads['lookup'] = threading.current_thread()
+        return {'status': 'success', 'session_id': session_id, 'cached': True}
+
+    def callback(result):
+        threads['callback'] = threading.current_thread()
+
+    engine = AsyncCompletionEngine(['fake-key'], None, None, None, lookup=lookup)
+    engine.start()
+    try:
+        assert engine.submit(('s1', 'summarize', 'text', (), callback)).result(5)['cached']
+    finally:
+        engine.shutdown()
+    assert threads['lookup'] is not engine.thread
+    assert threads['callback'] is not engine.thread
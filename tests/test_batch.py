@@ -0,0 +1,75 @@
+import json
+import threading
+
+from batch import BatchRunner, completed_keys, item_key, parse_items, record
+
+
+def test_parse_items_numbers_lines_and_reports_bad_ones():
+    items = list(parse_items(['{"function": "summarize", "input": "a"}', '', '[1]', '{"id": "x", "input": "b"}']))
+    assert items[0]['id'] == 1
+    assert items[1]['id'] == 3 and 'error' in items[1]
+    assert items[2]['id'] == 'x'
+
+
+def test_item_key_follows_function_and_input():
+    item = {'id': 1, 'function': 'summarize', 'input': 'text'}
+    assert item_key(item) == item_key(dict(item, input='  text\n'))
+    assert item_key(item) != item_key(dict(item, input='other text'))
+    assert item_key(item) != item_key(dict(item, function='translate'))
+    assert item_key(item).startswith('1-')
+
+
+def test_completed_keys_skip_only_unchanged_items(tmp_path):
+    done = {'id': 1, 'function': 'summarize', 'input': 'text'}
+    failed = {'id': 2, 'function': 'summarize', 'input': 'more'}
+    path = tmp_path / 'out.jsonl'
+    path.write_text('\n'.join([json.dumps(record(done, {'status': 'success', 'ai_response': 'ok'})),
+                               json.dumps(record(failed, {'status': 'error', 'error': 'boom'})),
+                               '{"id": 3, "sta']) + '\n')
+    keys = completed_keys(str(path))
+    assert item_key(done) in keys
+    assert item_key(dict(done, input='edited text')) not in keys
+    assert item_key(failed) not in keys
+
+
+def test_runner_limits_concurrency_and_answers_every_item():
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def submit(item, callback):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+
+        def finish():
+            with lock:
+                in_flight[0] -= 1
+            callback({'status': 'success', 'ai_response': item['input'].upper()})
+            callback({'status': 'error', 'error': 'late duplicate'})
+        threading.Timer(0.01, finish).start()
+
+    items = [{'id': i, 'function': 'summarize', 'input': f"item {i}"} for i in range(10)]
+    lines = list(BatchRunner(submit, concurrency=3).run(items))
+    assert sorted(line['id'] for line in lines) == list(range(10))
+    assert all(line['status'] == 'completed' for line in lines)
+    assert peak[0] <= 3
+
+
+def test_runner_answers_items_whose_submit_raises():
+    def submit(item, callback):
+        if item['id'] == 1:
+            raise RuntimeError('queue closed')
+        callback({'status': 'success', 'ai_response': 'ok'})
+
+    items = [{'id': 0, 'input': 'a'}, {'id': 1, 'input': 'b'}, {'id': 2, 'input': 'c'}]
+    lines = {line['id']: line for line in BatchRunner(submit, concurrency=2).run(items)}
+    assert lines[1]['status'] == 'error' and 'queue closed' in lines[1]['error']
+    assert lines[0]['status'] == lines[2]['status'] == 'completed'
+
+
+def test_runner_answers_invalid_items_without_submitting():
+    submitted = []
+    runner = BatchRunner(lambda item, callback: submitted.append(item), validate=lambda item: 'bad input')
+    lines = list(runner.run([{'id': 1, 'input': ''}]))
+    assert lines[0]['status'] == 'error' and lines[0]['error'] == 'bad input'
+    assert submitted == []
@@ -0,0 +1,31 @@
+from conversation import build_context, history_turns
+from conversation_store import ConversationStore
+
+
+def chat(store, user, *contents):
+    for i, content in enumerate(contents):
+        store.append(user, 'explain', {'role': 'user' if i % 2 == 0 else 'ai', 'content': content,
+                                       'session_id': f"s{i // 2}", 'timestamp': '2026-10-18T12:00:00'})
+    return store.history(user, 'explain')
+
+
+def test_summary_covers_messages_up_to_its_integer_id(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversations.db'))
+    # Ids 9 and 10 compare differently as text, which the summary must not depend on
+    history = chat(store, 'u1', *(f"message {i}" for i in range(12)))
+    store.add_pending('compaction', 'u1', 'explain', compacts=history[8]['id'])
+    assert store.complete({'session_id': 'compaction', 'status': 'success', 'ai_response': 'Earlier talk.'},
+                          '2026-10-18T12:00:00')
+    summary = store.get_summary('u1', 'explain')
+    assert summary == {'text': 'Earlier talk.', 'covers': history[8]['id']}
+    assert [content for _, _, content in history_turns(history, summary)] == [f"message {i}" for i in range(9, 12)]
+
+
+def test_context_starts_with_the_summary():
+    history = [{'id': i, 'session_id': 's', 'role': role, 'content': content}
+               for i, (role, content) in enumerate([('user', 'old question'), ('ai', 'old answer'),
+                                                    ('user', 'new question')], 1)]
+    context, overflow = build_context(history, {'text': 'We talked.', 'covers': 2}, budget=1000)
+    assert context[0][0] == 'system' and context[0][1].endswith('We talked.')
+    assert context[1:] == (('user', 'new question'),)
+    assert overflow == []
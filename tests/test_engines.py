@@ -0,0 +1,55 @@
+"""End-to-end /process -> /get_result on both completion engines against the fake OpenAI server"""
+import json
+
+import pytest
+import requests
+
+from conftest import wait_for_result
+
+REPLY = "A short fake summary."
+
+
+@pytest.fixture(scope='module', params=['threaded', 'async'])
+def base_url(request, serve_app):
+    return serve_app(COMPLETION_ENGINE=request.param)
+
+
+def test_process_returns_completion(base_url, fake):
+    session = requests.Session()
+    before = fake.config.requests
+    response = session.post(f"{base_url}/process",
+                            data={'function': 'summarize', 'user_input': f"Text to summarize for {base_url}."})
+    assert response.status_code == 200
+    result = wait_for_result(session, base_url, response.json()['session_id'])
+    assert result == {'status': 'completed', 'message': REPLY}
+    assert fake.config.requests == before + 1
+
+
+def test_repeated_input_is_served_from_cache(base_url, fake):
+    session = requests.Session()
+    data = {'function': 'summarize', 'user_input': f"Cacheable text for {base_url}."}
+    first = session.post(f"{base_url}/process", data=data).json()
+    wait_for_result(session, base_url, first['session_id'])
+    before = fake.config.requests
+    second = session.post(f"{base_url}/process", data=data).json()
+    assert wait_for_result(session, base_url, second['session_id'])['message'] == REPLY
+    assert fake.config.requests == before
+
+
+def test_invalid_function_is_rejected(base_url):
+    response = requests.post(f"{base_url}/process", data={'function': 'nope', 'user_input': 'hello'})
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+
+def test_batch_is_replayed_from_the_result_store(base_url, fake):
+    body = '\n'.join(json.dumps({'id': i, 'function': 'summarize', 'input': f"Batch item {i} for {base_url}."})
+                     for i in range(3))
+    url = f"{base_url}/process_batch?batch_id=resume"
+    first = [json.loads(line) for line in requests.post(url, data=body).text.splitlines()]
+    assert sorted(line['id'] for line in first) == [0, 1, 2]
+    assert all(line['status'] == 'completed' for line in first)
+    before = fake.config.requests
+    second = [json.loads(line) for line in requests.post(url, data=body).text.splitlines()]
+    assert {line['key'] for line in second} == {line['key'] for line in first}
+    assert fake.config.requests == before
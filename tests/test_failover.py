@@ -0,0 +1,27 @@
+"""Model failover on a throttled primary, on both completion engines"""
+import pytest
+import requests
+
+from conftest import wait_for_result
+
+
+@pytest.fixture(scope='module')
+def fake():
+    from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=0.05, reply="Fallback reply.", throttled_models={'primary'}))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize('engine', ['threaded', 'async'])
+def test_throttled_primary_fails_over_after_one_attempt(serve_app, fake, engine):
+    base_url = serve_app(COMPLETION_ENGINE=engine, OPENAI_MODELS='primary,fallback', OPENAI_API_KEYS='fake-key-0')
+    session = requests.Session()
+    before_requests, before_limited = fake.config.requests, fake.config.rate_limited
+    response = session.post(f"{base_url}/process", data={'function': 'summarize', 'user_input': f"Fail over on {engine}."})
+    result = wait_for_result(session, base_url, response.json()['session_id'])
+    assert result == {'status': 'completed', 'message': "Fallback reply."}
+    # One 429 from the primary, then the fallback; no SDK retries in between
+    assert fake.config.rate_limited == before_limited + 1
+    assert fake.config.requests == before_requests + 2
@@ -0,0 +1,56 @@
+import queue
+
+import pytest
+
+from fair_queue import FairQueue
+
+
+def drain(fair_queue):
+    served = []
+    while not fair_queue.empty():
+        served.append(fair_queue.get(block=False))
+    return served
+
+
+def test_users_alternate_within_a_priority_class():
+    fair_queue = FairQueue(quantum=1)
+    for i in range(3):
+        fair_queue.put(f"a{i}", user='alice')
+    fair_queue.put('b0', user='bob')
+    assert drain(fair_queue) == ['a0', 'b0', 'a1', 'a2']
+
+
+def test_costly_tasks_wait_for_enough_credit():
+    fair_queue = FairQueue(quantum=10)
+    fair_queue.put('big', user='alice', cost=30)
+    for i in range(3):
+        fair_queue.put(f"small{i}", user='bob', cost=10)
+    # Alice needs three turns of credit for her one task; Bob spends his on one task per turn
+    assert drain(fair_queue) == ['small0', 'small1', 'big', 'small2']
+
+
+def test_lower_priority_number_is_served_first():
+    fair_queue = FairQueue()
+    fair_queue.put('batch', user='batch:1', priority=10)
+    fair_queue.put('chat', user='alice', priority=0)
+    assert drain(fair_queue) == ['chat', 'batch']
+
+
+def test_position_matches_service_order_and_remove_takes_tasks_out():
+    fair_queue = FairQueue(quantum=1)
+    for task, user in [('a0', 'alice'), ('a1', 'alice'), ('b0', 'bob')]:
+        fair_queue.put(task, user=user)
+    assert fair_queue.position(lambda task: task == 'b0') == 2
+    assert fair_queue.position(lambda task: task == 'missing') is None
+    assert fair_queue.remove(lambda task: task.startswith('a')) == ['a0', 'a1']
+    assert fair_queue.qsize() == 1 and drain(fair_queue) == ['b0']
+
+
+def test_sentinel_jumps_the_line_and_empty_get_raises():
+    fair_queue = FairQueue()
+    fair_queue.put('task')
+    fair_queue.put(None)
+    assert fair_queue.get() is None
+    assert fair_queue.get() == 'task'
+    with pytest.raises(queue.Empty):
+        fair_queue.get(timeout=0.01)
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from feedback_manager import FeedbackRollup, rotate_file
+
+
+@pytest.fixture
+def feedback_dir(tmp_path, monkeypatch):
+    # The legacy feedback file is looked up relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    directory = tmp_path / 'feedback'
+    directory.mkdir()
+    return directory
+
+
+def append(path, *records):
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def feedback(day, rating, function='summarize'):
+    return {'timestamp': f"{day}T12:00:00", 'rating': rating, 'function': function}
+
+
+def test_rollup_counts_only_new_records(feedback_dir):
+    path = feedback_dir / 'feedback_2026-10-01.jsonl'
+    append(path, feedback('2026-10-01', 'good'), feedback('2026-10-01', 'bad', 'code'))
+    rollup = FeedbackRollup(str(feedback_dir), refresh_interval=0)
+    stats = rollup.get_stats()
+    assert stats['total'] == 2
+    assert stats['by_function'] == {'summarize': {'good': 1}, 'code': {'bad': 1}}
+    append(path, feedback('2026-10-02', 'good'))
+    stats = rollup.get_stats()
+    assert stats['total'] == 3
+    assert stats['by_rating'] == {'good': 2, 'bad': 1}
+    assert stats['by_day'] == {'2026-10-01': {'good': 1, 'bad': 1}, '2026-10-02': {'good': 1}}
+
+
+def test_rotated_file_is_not_counted_twice(feedback_dir):
+    path = feedback_dir / 'feedback_2026-10-01.jsonl'
+    append(path, feedback('2026-10-01', 'good'))
+    rollup = FeedbackRollup(str(feedback_dir), refresh_interval=0)
+    assert rollup.get_stats()['total'] == 1
+    rotate_file(str(path))
+    append(path, feedback('2026-10-01', 'bad'))
+    assert rollup.get_stats()['total'] == 2
+
+
+def test_partial_lines_wait_for_their_newline(feedback_dir):
+    path = feedback_dir / 'feedback_2026-10-01.jsonl'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(feedback('2026-10-01', 'good')) + '\n' + '{"rating": "ba')
+    rollup = FeedbackRollup(str(feedback_dir), refresh_interval=0)
+    assert rollup.get_stats()['total'] == 1
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('d"}\n')
+    assert rollup.get_stats()['total'] == 2
+
+
+def test_state_is_shared_through_the_sidecar_and_days_are_limited(feedback_dir):
+    append(feedback_dir / 'feedback_2026-10-01.jsonl', *(feedback(f"2026-10-0{day}", 'good') for day in range(1, 6)))
+    FeedbackRollup(str(feedback_dir), refresh_interval=0).refresh()
+    stats = FeedbackRollup(str(feedback_dir), refresh_interval=0).get_stats(days=2)
+    assert stats['total'] == 5
+    assert list(stats['by_day']) == ['2026-10-04', '2026-10-05']
@@ -0,0 +1,35 @@
+from hedging import HedgePolicy
+
+
+def test_no_delay_until_enough_samples():
+    policy = HedgePolicy(min_samples=3)
+    policy.observe(1.0)
+    policy.observe(2.0)
+    assert policy.delay() is None
+    policy.observe(3.0)
+    assert policy.delay() is not None
+
+
+def test_delay_is_the_percentile_with_a_floor():
+    policy = HedgePolicy(percentile=90, min_samples=10, min_delay=0.5)
+    for i in range(1, 101):
+        policy.observe(i / 100)
+    assert policy.delay() == 0.91
+    policy = HedgePolicy(min_samples=1, min_delay=0.5)
+    policy.observe(0.01)
+    assert policy.delay() == 0.5
+
+
+def test_hedges_stay_within_the_budget():
+    policy = HedgePolicy(budget=0.1, holdout=0)
+    allowed = 0
+    for _ in range(100):
+        assert not policy.begin()
+        allowed += policy.allow()
+    assert allowed == 10
+    assert policy.get_stats()['hedge_rate'] == 0.1
+
+
+def test_holdout_calls_are_never_hedged():
+    policy = HedgePolicy(holdout=1.0)
+    assert all(policy.begin() for _ in range(20))
@@ -0,0 +1,101 @@
+"""The chat page's script against the markup it is served with, and the /process -> /stream flow it drives"""
+import json
+import re
+import shutil
+import subprocess
+from html.parser import HTMLParser
+
+import pytest
+import requests
+
+
+VOID = ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr')
+
+
+class PageParser(HTMLParser):
+    """Ids, chat forms (with their enclosing element ids) and inline scripts of a page"""
+    def __init__(self):
+        super().__init__()
+        self.ids = {}  # id -> classes of the element's descendants
+        self.forms = []
+        self.scripts = []
+        self.open = []  # Ids (or None) of the elements enclosing the current one
+        self.in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        enclosing = [element_id for element_id in self.open if element_id]
+        for element_id in enclosing:
+            self.ids[element_id].update(classes)
+        if tag == 'form' and 'chat-form' in classes:
+            self.forms.append((attrs.get('data-task'), enclosing))
+        if attrs.get('id'):
+            self.ids[attrs['id']] = set()
+        if tag == 'script' and 'src' not in attrs:
+            self.in_script = True
+            self.scripts.append('')
+        if tag not in VOID:
+            self.open.append(attrs.get('id'))
+
+    def handle_endtag(self, tag):
+        if tag == 'script':
+            self.in_script = False
+        if tag not in VOID and self.open:
+            self.open.pop()
+
+    def handle_data(self, data):
+        if self.in_script:
+            self.scripts[-1] += data
+
+    @property
+    def chat_script(self):
+        return next(script for script in self.scripts if '.chat-form' in script)
+
+
+@pytest.fixture(scope='module')
+def base_url(serve_app):
+    return serve_app()
+
+
+@pytest.fixture(scope='module')
+def page(base_url):
+    parser = PageParser()
+    parser.feed(requests.get(base_url).text)
+    return parser
+
+
+def test_every_chat_form_has_a_history_and_indicator(page):
+    assert page.forms
+    for task, enclosing in page.forms:
+        assert f"chat-{task}" in enclosing
+        assert 'chat-history' in page.ids[f"chat-{task}"]
+        assert f"thinking-{task}" in page.ids
+
+
+def test_script_binds_the_chat_forms_and_streams(page):
+    script = page.chat_script
+    assert 'querySelectorAll(".chat-form")' in script
+    assert '#chat-${task} .chat-history' in script
+    assert 'new EventSource(`/stream/${sessionId}`)' in script
+    assert '#chatForm' not in script and '.chat-messages' not in script
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+def test_script_parses(page, tmp_path):
+    path = tmp_path / 'chat.js'
+    path.write_text(page.chat_script)
+    subprocess.run(['node', '--check', str(path)], check=True)
+
+
+def test_form_submit_opens_the_stream(base_url):
+    # What the script sends: the form's own fields, then an EventSource on the returned session
+    session = requests.Session()
+    data = {'function': 'summarize', 'user_input': 'Stream this text.'}
+    queued = session.post(f"{base_url}/process", data=data).json()
+    assert queued['status'] == 'queued'
+    with session.get(f"{base_url}/stream/{queued['session_id']}", stream=True, timeout=10) as response:
+        assert response.headers['Content-Type'].startswith('text/event-stream')
+        events = re.findall(r'event: (\w+)\ndata: (.*)\n', response.text)
+    assert events[-1][0] == 'done'
+    assert json.loads(events[-1][1]) == {'status': 'completed', 'message': "A short fake summary."}
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+import requests
+
+from conftest import wait_for_result
+from job_queue import JobQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / 'jobs.db'), **kwargs)
+
+
+def test_cancel_withdraws_a_queued_job(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    assert queue.cancel('s1') == 'cancelled'
+    assert queue.lease('worker', 5) == ([], [])
+    assert queue.cancel('s1') is None
+
+
+def test_cancel_flags_a_leased_job_so_its_holder_stores_nothing(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    queue.lease('worker', 1)
+    assert queue.cancel('s1') == 'cancelled'
+    assert queue.cancelled(['s1']) == {'s1'}
+    assert not queue.claim('s1')
+    assert queue.ack('s1') == []
+
+
+def test_cancel_after_claim_reports_finished(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    queue.lease('worker', 1)
+    assert queue.claim('s1')
+    assert queue.cancel('s1') == 'finished'
+    assert not queue.claim('s1')
+
+
+def test_cancelled_leader_keeps_running_for_its_followers(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text', key='k')
+    assert queue.put('s2', 'task', 'u2', 'summarize', 'text', key='k') == 's1'
+    queue.lease('worker', 1)
+    assert queue.cancel('s1') == 'cancelled'
+    assert queue.cancelled(['s1']) == set()
+    assert queue.ack('s1') == ['s2']
+
+
+def test_cancelled_job_of_a_dead_holder_is_not_leased_again(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    queue.lease('crashed', 1)
+    queue.cancel('s1')
+    assert queue.lease('worker', 1) == ([], [])
+    assert queue.get_stats()['queued'] == 0
+
+
+@pytest.fixture(scope='module')
+def fake():
+    from fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency=1.5, reply="Too late."))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_cancel_through_another_process_holds(serve_app, tmp_path):
+    shared = {'JOB_QUEUE': str(tmp_path / 'jobs.db'), 'RESULT_STORE_BACKEND': f"filesystem:{tmp_path / 'results'}"}
+    accepting, other = serve_app(**shared), serve_app(**shared)
+    session = requests.Session()
+    response = session.post(f"{accepting}/process", data={'function': 'summarize', 'user_input': 'Slow text.'})
+    session_id = response.json()['session_id']
+    time.sleep(0.5)  # Leased by one of the two processes
+    response = requests.post(f"{other}/cancel/{session_id}")
+    assert response.status_code == 200 and response.json() == {'status': 'cancelled'}
+    time.sleep(2)  # Past the upstream reply
+    result = wait_for_result(session, accepting, session_id)
+    assert result['status'] == 'error' and 'cancelled' in result['message']
+
+
+def test_unacked_lease_expires_and_gives_up_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.05, max_attempts=2)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    jobs, _ = queue.lease('first', 1)
+    assert [job['session_id'] for job in jobs] == ['s1']
+    assert queue.lease('second', 1) == ([], [])  # Still leased
+    time.sleep(0.1)
+    jobs, _ = queue.lease('second', 1)
+    assert jobs[0]['attempts'] == 1
+    time.sleep(0.1)
+    jobs, dead = queue.lease('third', 1)
+    assert jobs == [] and [job['session_id'] for job in dead] == ['s1']
+    assert queue.get_stats()['queued'] == queue.get_stats()['leased'] == 0
+
+
+def test_extend_keeps_a_lease_and_release_hands_it_back(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.1)
+    queue.put('s1', 'task', 'u1', 'summarize', 'text')
+    queue.lease('owner', 1)
+    time.sleep(0.06)
+    queue.extend('owner', ['s1'])
+    time.sleep(0.06)
+    assert queue.lease('other', 1) == ([], [])
+    queue.release('owner', ['s1'])
+    jobs, _ = queue.lease('other', 1)
+    assert jobs[0]['attempts'] == 0
+
+
+def test_lease_order_is_priority_then_fair_share(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.put('a1', 'task', 'alice', 'summarize', 'text', cost=5)
+    queue.put('a2', 'task', 'alice', 'summarize', 'text', cost=5)
+    queue.put('b1', 'task', 'bob', 'summarize', 'text', cost=5)
+    queue.put('batch', 'task', 'batch:1', 'summarize', 'text', priority=10)
+    assert queue.position('b1') == 2
+    jobs, _ = queue.lease('worker', 4)
+    assert [job['session_id'] for job in jobs] == ['a1', 'b1', 'a2', 'batch']
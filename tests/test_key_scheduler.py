@@ -0,0 +1,74 @@
+import importlib
+import time
+
+import openai
+import pytest
+
+from key_scheduler import KeyScheduler
+
+# HTTP library bundled with the openai SDK, whose responses its errors carry
+http = importlib.import_module(type(openai.DEFAULT_CONNECTION_LIMITS).__module__.split('.')[0])
+
+
+def upstream_error(error_type, status, headers=None):
+    response = http.Response(status, headers=headers or {},
+                              request=http.Request('POST', 'http://upstream/v1/chat/completions'))
+    return error_type("upstream error", response=response, body=None)
+
+
+def test_rate_limited_key_is_quarantined_for_retry_after():
+    scheduler = KeyScheduler(2)
+    index, wait = scheduler.acquire(100)
+    assert wait == 0
+    scheduler.record_failure(index, 100, upstream_error(openai.RateLimitError, 429, {'retry-after': '20'}))
+    assert scheduler.healthy_keys() == 1
+    assert scheduler.get_stats()[index]['quarantined_for'] == pytest.approx(20, abs=1)
+    other, wait = scheduler.acquire(100)
+    assert other != index and wait == 0
+
+
+def test_rate_limit_backoff_grows_without_retry_after():
+    scheduler = KeyScheduler(1, base_backoff=2, max_backoff=3)
+    delays = []
+    for _ in range(3):
+        index, _ = scheduler.acquire(1)
+        scheduler.record_failure(index, 1, upstream_error(openai.RateLimitError, 429))
+        delays.append(scheduler.keys[0].quarantined_until - time.time())
+    assert delays[0] == pytest.approx(2, abs=0.1)
+    assert delays[1] == pytest.approx(3, abs=0.1)  # 2 * 1.5, then capped
+    assert delays[2] == pytest.approx(3, abs=0.1)
+
+
+def test_rejected_key_is_quarantined_for_auth_quarantine():
+    scheduler = KeyScheduler(2, auth_quarantine=300)
+    index, _ = scheduler.acquire(1)
+    scheduler.record_failure(index, 1, upstream_error(openai.AuthenticationError, 401))
+    assert scheduler.get_stats()[index]['quarantined_for'] == pytest.approx(300, abs=1)
+
+
+def test_success_clears_quarantine_and_applies_rate_limit_headers():
+    scheduler = KeyScheduler(1, rpm=500, tpm=200000)
+    index, _ = scheduler.acquire(1000)
+    scheduler.record_failure(index, 1000, upstream_error(openai.RateLimitError, 429))
+    index, _ = scheduler.acquire(1000)
+    scheduler.record_success(index, 1000, used_tokens=400, headers={
+        'x-ratelimit-limit-requests': '60', 'x-ratelimit-remaining-requests': '10',
+        'x-ratelimit-limit-tokens': '90000', 'x-ratelimit-remaining-tokens': '5000'})
+    stats = scheduler.get_stats()[0]
+    assert stats['quarantined_for'] == 0 and stats['consecutive_failures'] == 0
+    assert stats['requests_per_minute'] == 60 and stats['requests_remaining'] == 10
+    assert stats['tokens_per_minute'] == 90000 and stats['tokens_remaining'] == 5000
+
+
+def test_malformed_headers_are_ignored():
+    scheduler = KeyScheduler(1, rpm=500)
+    index, _ = scheduler.acquire(1)
+    scheduler.record_success(index, 1, headers={'x-ratelimit-limit-requests': 'lots'})
+    assert scheduler.get_stats()[0]['requests_per_minute'] == 500
+
+
+def test_exhausted_key_reports_a_wait():
+    scheduler = KeyScheduler(1, rpm=60, tpm=1000)
+    scheduler.acquire(1000)
+    _, wait = scheduler.acquire(500)
+    assert wait == pytest.approx(30, abs=1)  # 500 tokens at 1000 per minute
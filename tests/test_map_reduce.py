@@ -0,0 +1,57 @@
+from map_reduce import MapReduceJob, join_translations, leading_instruction
+from tokenizer import count_tokens, split_text
+
+
+def test_split_text_respects_the_budget_and_sentence_boundaries():
+    text = ' '.join(f"Sentence number {i} is here." for i in range(40))
+    chunks = split_text(text, 30)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 30 for chunk in chunks)
+    assert all(chunk.rstrip().endswith('.') for chunk in chunks)
+    assert ''.join(chunks) == text
+
+
+def test_split_text_overlap_repeats_the_previous_sentences():
+    text = ' '.join(f"Sentence number {i} is here." for i in range(40))
+    chunks = split_text(text, 30, overlap=10)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        first_sentence = chunk.split('. ')[0]
+        assert first_sentence in previous
+        assert count_tokens(chunk) <= 30
+
+
+def test_split_text_breaks_overlong_words():
+    chunks = split_text('x' * 400, 20)
+    assert ''.join(chunks) == 'x' * 400
+    assert all(count_tokens(chunk) <= 20 for chunk in chunks)
+
+
+def test_leading_instruction():
+    assert leading_instruction("Translate to French:\nHello there.") == ('Translate to French:', 'Hello there.')
+    assert leading_instruction("Please translate this into German: Guten Tag") == \
+        ('Please translate this into German:', 'Guten Tag')
+    assert leading_instruction("Hello there.") == ('', 'Hello there.')
+
+
+def test_join_translations_keeps_only_the_first_header():
+    responses = ["[English] → [French]:\nBonjour.", "[English] → [French]:\nAu revoir.", "Merci."]
+    assert join_translations(responses) == "[English] → [French]:\nBonjour.\n\nAu revoir.\n\nMerci."
+
+
+def test_job_completes_in_input_order():
+    completed, failed = [], []
+    job = MapReduceJob('s1', 3, completed.append, failed.append)
+    assert job.chunk_id(2) == 's1:chunk2'
+    for index in (2, 0, 1):
+        job.callback(index)({'status': 'success', 'ai_response': f"part {index}"})
+    assert completed == [['part 0', 'part 1', 'part 2']] and failed == []
+
+
+def test_first_failing_chunk_fails_the_job_once():
+    completed, failed = [], []
+    job = MapReduceJob('s1', 3, completed.append, failed.append)
+    job.collect(0, {'status': 'success', 'ai_response': 'part 0'})
+    job.collect(1, {'status': 'error', 'session_id': 's1:chunk1', 'error': 'boom'})
+    job.collect(2, {'status': 'error', 'session_id': 's1:chunk2', 'error': 'again'})
+    assert completed == []
+    assert failed == [{'status': 'error', 'session_id': 's1', 'error': 'boom'}]
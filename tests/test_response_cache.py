@@ -0,0 +1,35 @@
+from response_cache import LRUTTLBackend, ResponseCache
+
+
+def make_key(user_input):
+    return ResponseCache.make_key('gpt-3.5-turbo', 'prompt-sha', 0.7, user_input)
+
+
+def test_key_ignores_surrounding_whitespace_and_line_endings():
+    assert make_key("def f():\r\n    return 1\n") == make_key("  def f():\n    return 1")
+
+
+def test_key_keeps_indentation_and_inner_whitespace():
+    assert make_key("def f():\n    return 1") != make_key("def f():\nreturn 1")
+    assert make_key("a  b") != make_key("a b")
+
+
+def test_lru_evicts_oldest_and_expires_entries():
+    backend = LRUTTLBackend(max_entries=2)
+    backend.set('a', 'x', 60)
+    backend.set('b', 'y', 60)
+    backend.get('a')
+    backend.set('c', 'z', 60)
+    assert backend.get('b') is None
+    assert backend.get('a') == 'x'
+    backend.set('d', 'w', -1)
+    assert backend.get('d') is None
+
+
+def test_cache_counts_hits_and_misses_but_peek_does_not():
+    cache = ResponseCache(LRUTTLBackend(), ['summarize'])
+    cache.set('k', 'answer', 'gpt-4o')
+    assert cache.peek('k') == {'ai_response': 'answer', 'model_used': 'gpt-4o'}
+    assert cache.get('k')['ai_response'] == 'answer'
+    assert cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,40 @@
+import pytest
+
+from similarity_index import SimilarityIndex, minhash, similarity
+
+TEXT = ' '.join(f"Section {i} of the quarterly report shows revenue growth of {i + 3} percent in region {i * 7}."
+                for i in range(20))
+EDITED = TEXT.replace('region 21.', 'region twenty-one.')
+
+
+def test_minhash_similarity_tracks_text_overlap():
+    assert similarity(minhash(TEXT), minhash(TEXT)) == 1.0
+    assert similarity(minhash(TEXT), minhash(TEXT.upper().replace('.', ';'))) == 1.0
+    assert similarity(minhash(TEXT), minhash(EDITED)) > 0.9
+    assert similarity(minhash(TEXT), minhash("Completely unrelated words about gardening tools.")) < 0.2
+
+
+def test_find_returns_near_duplicates_in_the_same_scope_only():
+    index = SimilarityIndex(threshold=0.9)
+    index.add('summarize', TEXT, 'key-1')
+    value, score = index.find('summarize', EDITED)
+    assert value == 'key-1' and score >= 0.9
+    assert index.find('translate', TEXT) is None
+    assert index.find('summarize', "Completely unrelated words about gardening tools.") is None
+
+
+def test_entries_expire_and_are_capped():
+    index = SimilarityIndex(max_entries=2, ttl=0)
+    index.add('s', TEXT, 'expired')
+    assert index.find('s', TEXT) is None
+    assert len(index.entries) == 0
+    index = SimilarityIndex(max_entries=2)
+    for i in range(3):
+        index.add('s', f"{TEXT} Version {i}.", f"key-{i}")
+    assert len(index.entries) == 2
+    assert index.find('s', f"{TEXT} Version 0.")[0] != 'key-0'
+
+
+def test_bins_must_divide_into_bands():
+    with pytest.raises(ValueError):
+        SimilarityIndex(num_bins=100, bands=16)
@@ -0,0 +1,83 @@
+import os
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character heuristic
+    tiktoken = None
+
+DEFAULT_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+CHARS_PER_TOKEN = 4  # Rough average for English text when tiktoken is missing
+
+_SENTENCE = re.compile(r'.+?(?:[.!?\u3002\uff01\uff1f]+\s+|\n\s*|$)', re.S)
+_WORD = re.compile(r'\s*\S+\s*')
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model=DEFAULT_MODEL):
+    """tiktoken encoding for a model, or None when tiktoken is not installed"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    """Number of tokens ``text`` uses for ``model``"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def tokenizer_name(model=DEFAULT_MODEL):
+    encoding = get_encoding(model)
+    return encoding.name if encoding is not None else 'heuristic'
+
+
+def _segments(text, max_tokens, model):
+    """Sentences of ``text``, broken further into words or characters when too long"""
+    for sentence in _SENTENCE.findall(text):
+        if count_tokens(sentence, model) <= max_tokens:
+            yield sentence
+            continue
+        for word in _WORD.findall(sentence):
+            tokens = count_tokens(word, model)
+            if tokens <= max_tokens:
+                yield word
+                continue
+            step = max(1, len(word) * max_tokens // tokens)
+            for i in range(0, len(word), step):
+                yield word[i:i + step]
+
+
+def split_text(text, max_tokens, overlap=0, model=DEFAULT_MODEL):
+    """Split ``text`` at sentence boundaries into chunks of at most ``max_tokens`` tokens.
+
+    Each chunk after the first repeats up to ``overlap`` tokens of whole
+    sentences from the end of the previous one, so context that straddles
+    a boundary is seen by both chunks.
+    """
+    chunks = []
+    current, size = [], 0
+    for segment in _segments(text, max_tokens, model):
+        tokens = count_tokens(segment, model)
+        if current and size + tokens > max_tokens:
+            chunks.append(''.join(s for s, _ in current))
+            carried, carried_size = [], 0
+            for s, n in reversed(current):
+                if carried_size + n > overlap:
+                    break
+                carried.insert(0, (s, n))
+                carried_size += n
+            if carried_size + tokens > max_tokens:
+                carried, carried_size = [], 0
+            current, size = carried, carried_size
+        current.append((segment, tokens))
+        size += tokens
+    if current:
+        chunks.append(''.join(s for s, _ in current))
+    return chunks
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger('worker_pool')
+
+
+class WorkerStats:
+    """Utilization counters for a single pool worker"""
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.tasks_processed = 0
+        self.busy_seconds = 0.0
+        self.current_task_started = None
+
+    def to_dict(self, now):
+        busy = self.busy_seconds
+        if self.current_task_started is not None:
+            busy += now - self.current_task_started
+        uptime = max(now - self.started_at, 1e-9)
+        return {
+            'name': self.name,
+            'busy': self.current_task_started is not None,
+            'tasks_processed': self.tasks_processed,
+            'busy_seconds': round(busy, 2),
+            'utilization': round(min(busy / uptime, 1.0), 3)
+        }
+
+
+class WorkerPool:
+    """Fixed-size pool of daemon threads draining a shared task queue.
+
+    Every task taken from ``task_queue`` is passed to ``handler``. A failing
+    handler is logged and never takes its worker down with it.
+    """
+    def __init__(self, task_queue, handler, size, name='api-worker'):
+        self.task_queue = task_queue
+        self.handler = handler
+        self.size = max(1, int(size))
+        self.name = name
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.stats = {}
+
+    def start(self):
+        """Spawn the worker threads (idempotent)"""
+        with self.lock:
+            if self.threads:
+                return
+            self.stop_event.clear()
+            for i in range(self.size):
+                worker_name = f"{self.name}-{i}"
+                self.stats[worker_name] = WorkerStats(worker_name)
+                thread = threading.Thread(target=self._run, args=(worker_name,),
+                                          name=worker_name, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        logger.info(f"Started {self.size} workers for pool '{self.name}'")
+
+    def _run(self, worker_name):
+        stats = self.stats[worker_name]
+        while not self.stop_event.is_set():
+            try:
+                task = self.task_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if task is None:
+                # Shutdown sentinel
+                self.task_queue.task_done()
+                continue
+
+            stats.current_task_started = time.time()
+            try:
+                self.handler(task)
+            except Exception:
+                logger.exception(f"Worker {worker_name} failed to process task")
+            finally:
+                stats.busy_seconds += time.time() - stats.current_task_started
+                stats.current_task_started = None
+                stats.tasks_processed += 1
+                self.task_queue.task_done()
+
+    def busy_count(self):
+        """Number of workers currently processing a task"""
+        return sum(1 for s in self.stats.values() if s.current_task_started is not None)
+
+    def get_stats(self):
+        """Snapshot of pool size and per-worker utilization"""
+        now = time.time()
+        workers = [s.to_dict(now) for s in list(self.stats.values())]
+        return {
+            'size': self.size,
+            'alive': sum(1 for t in self.threads if t.is_alive()),
+            'busy': sum(1 for w in workers if w['busy']),
+            'workers': workers
+        }
+
+    def shutdown(self, timeout=5.0):
+        """Stop accepting work and wait for in-flight tasks to finish"""
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        # Wake up idle workers blocked on the queue
+        for _ in self.threads:
+            self.task_queue.put(None)
+
+        deadline = time.time() + timeout
+        for thread in self.threads:
+            thread.join(timeout=max(0, deadline - time.time()))
+
+        still_running = [t.name for t in self.threads if t.is_alive()]
+        if still_running:
+            logger.warning(f"Workers still busy after shutdown timeout: {still_running}")
+        else:
+            logger.info(f"Worker pool '{self.name}' shut down cleanly")